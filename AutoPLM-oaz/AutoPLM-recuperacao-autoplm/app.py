@@ -19,11 +19,12 @@ Para executar: python run.py
 
 from app import create_app, init_db
 
-# Criar instância da aplicação usando factory pattern
-app = create_app()  
+# Só no script: os processos do parse_pool reimportam este arquivo como __mp_main__
+if __name__ == '__main__':
+    # Criar instância da aplicação usando factory pattern
+    app = create_app()
 
-# Inicializar banco de dados
-init_db(app)
+    # Inicializar banco de dados
+    init_db(app)
 
-if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -1,7 +1,7 @@
 import os
 import json
 from dotenv import load_dotenv, dotenv_values
-from flask import Flask
+from flask import Flask, request
 from app.config import config
 from app.extensions import db, csrf, init_openai
 from app.routes import register_blueprints
@@ -63,6 +63,7 @@ def create_app(config_name=None):
     app.config['SECRET_KEY'] = os.environ.get('SESSION_SECRET')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
     app.config['OPENAI_API_KEY'] = os.environ.get('OPENAI_API_KEY')
+    app.config['OPENAI_BASE_URL'] = os.environ.get('OPENAI_BASE_URL')
     app.config['RPA_MONITOR_ID'] = os.environ.get('RPA_MONITOR_ID')
     app.config['RPA_MONITOR_HOST'] = os.environ.get('RPA_MONITOR_HOST')
     app.config['RPA_MONITOR_REGION'] = os.environ.get('RPA_MONITOR_REGION', 'default')
@@ -72,12 +73,13 @@ def create_app(config_name=None):
     os.makedirs(os.path.join(app.static_folder, 'thumbnails'), exist_ok=True)
     os.makedirs(os.path.join(app.static_folder, 'drawings'), exist_ok=True)
     os.makedirs(os.path.join(app.static_folder, 'covers'), exist_ok=True)
+    os.makedirs(os.path.join(app.static_folder, 'assets'), exist_ok=True)
     os.makedirs(os.path.join(app.static_folder, 'product_images'), exist_ok=True)
     
     db.init_app(app)
     csrf.init_app(app)
     
-    init_openai(app.config.get('OPENAI_API_KEY'))
+    init_openai(app.config.get('OPENAI_API_KEY'), app.config.get('OPENAI_BASE_URL'))
     
     # RPA Monitor initialization
     rpa_host = app.config.get('RPA_MONITOR_HOST', '')
@@ -106,9 +108,16 @@ def create_app(config_name=None):
 
     app.jinja_env.filters['from_json'] = _from_json
     
+    from app.utils.assets import register_asset_refcounting, ASSET_URL_PREFIX, ASSET_CACHE_CONTROL
+    register_asset_refcounting()
+
     @app.after_request
     def add_cache_control(response):
-        if 'text/html' in response.content_type:
+        if request.path.startswith(ASSET_URL_PREFIX) and response.status_code in (200, 206, 304):
+            # Assets são endereçados por conteúdo: a URL muda se o arquivo mudar
+            response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+            response.headers.pop('Expires', None)
+        elif 'text/html' in response.content_type:
             response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
             response.headers['Pragma'] = 'no-cache'
             response.headers['Expires'] = '0'
@@ -12,8 +12,26 @@ class Config:
     }
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 1024 * 1024 * 1024  # 1GB max file size
+    UPLOAD_MAX_FILE_MB = int(os.environ.get("UPLOAD_MAX_FILE_MB", "200"))  # por arquivo (PDF/imagem)
+    IMPORT_MAX_FILE_MB = int(os.environ.get("IMPORT_MAX_FILE_MB", "50"))  # por planilha XLSX
+    # Previews/jobs de importação compartilhados entre os workers (pickle+gzip em disco)
+    IMPORT_STORE_DIR = os.environ.get("IMPORT_STORE_DIR")  # padrão: uploads/.import_store
+    IMPORT_STORE_MAX_MB = int(os.environ.get("IMPORT_STORE_MAX_MB", "2048"))
+    IMPORT_STORE_ENTRY_MAX_MB = int(os.environ.get("IMPORT_STORE_ENTRY_MAX_MB", "256"))
+
+    # Entrega de arquivos: 'flask' (send_file), 'nginx' (X-Accel-Redirect) ou 'sendfile' (X-Sendfile)
+    FILE_SERVING_BACKEND = os.environ.get("FILE_SERVING_BACKEND", "flask").lower()
+    ACCEL_REDIRECT_UPLOADS = os.environ.get("ACCEL_REDIRECT_UPLOADS", "/_protected/uploads/")
+    ACCEL_REDIRECT_STATIC = os.environ.get("ACCEL_REDIRECT_STATIC", "/_protected/static/")
+
+    # Object Storage dos desenhos legados: 'replit', 'filesystem' (OBJECT_STORAGE_ROOT) ou 'none'
+    OBJECT_STORAGE_BACKEND = os.environ.get("OBJECT_STORAGE_BACKEND", "")
+    OBJECT_STORAGE_ROOT = os.environ.get("OBJECT_STORAGE_ROOT")
+    OBJECT_STORAGE_CACHE_DIR = os.environ.get("OBJECT_STORAGE_CACHE_DIR")  # padrão: uploads/.object_storage
+    OBJECT_STORAGE_CACHE_MAX_MB = int(os.environ.get("OBJECT_STORAGE_CACHE_MAX_MB", "1024"))
     
     OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+    OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")  # ex: http://127.0.0.1:8089/v1 (stub local)
     
     RPA_MONITOR_ID = os.environ.get("RPA_MONITOR_ID")
     RPA_MONITOR_HOST = os.environ.get("RPA_MONITOR_HOST")
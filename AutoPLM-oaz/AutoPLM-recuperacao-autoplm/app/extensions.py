@@ -7,9 +7,16 @@ csrf = CSRFProtect()
 
 openai_client = None
 
-def init_openai(api_key):
+def init_openai(api_key, base_url=None):
+    """Cria o cliente OpenAI global.
+
+    `base_url` (OPENAI_BASE_URL) aponta o cliente para um servidor compatível,
+    como o stub local de openai_stub_server.py usado em benchmarks.
+    """
     global openai_client
-    if api_key:
+    if base_url:
+        openai_client = OpenAI(api_key=api_key or 'stub', base_url=base_url)
+    elif api_key:
         openai_client = OpenAI(api_key=api_key)
     return openai_client
 
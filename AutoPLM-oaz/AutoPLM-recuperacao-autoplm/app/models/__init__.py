@@ -6,6 +6,10 @@ from app.models.activity_log import ActivityLog
 from app.models.ficha_tecnica import FichaTecnica, FichaTecnicaItem
 from app.models.oaz_value_map import OazValueMap
 from app.models.fluxogama_subetapa import FluxogamaSubetapa
+from app.models.vision_analysis import VisionAnalysis
+from app.models.drawing_job import DrawingJob, DrawingBatch, DrawingCandidate
+from app.models.static_asset import StaticAsset
+from app.models.import_job import ImportJob
 
 __all__ = [
     'User',
@@ -17,5 +21,11 @@ __all__ = [
     'FichaTecnicaItem',
     'OazValueMap',
     'FluxogamaSubetapa',
+    'VisionAnalysis',
+    'DrawingJob',
+    'DrawingBatch',
+    'DrawingCandidate',
+    'StaticAsset',
+    'ImportJob',
 ]
 
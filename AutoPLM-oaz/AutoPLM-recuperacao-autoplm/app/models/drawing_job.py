@@ -0,0 +1,137 @@
+from datetime import datetime
+from app.extensions import db
+
+
+class DrawingJob(db.Model):
+    """Job da fila de geração de desenho técnico (gpt-image-1).
+
+    Tem status próprio para não disputar `Specification.processing_status`
+    com o pipeline de ingestão. O índice único parcial garante no máximo um
+    job ativo (queued/running) por ficha, mesmo entre workers do gunicorn.
+    """
+    __tablename__ = 'drawing_job'
+
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    id = db.Column(db.Integer, primary_key=True)
+    specification_id = db.Column(db.Integer, db.ForeignKey('specification.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    drawing_batch_id = db.Column(db.Integer, db.ForeignKey('drawing_batch.id', ondelete='SET NULL'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, error, cancelled
+    error = db.Column(db.Text)
+    drawing_url = db.Column(db.String(500))
+    request_count = db.Column(db.Integer, default=1)  # cliques agrupados neste job
+    variants = db.Column(db.Integer, default=1)  # candidatos pedidos numa única chamada
+    force_new = db.Column(db.Boolean, default=False)  # "Gerar Novo Desenho": ignora o cache de desenhos
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_drawing_job_status_created', 'status', 'created_at'),
+        db.Index('ix_drawing_job_spec', 'specification_id'),
+        db.Index('ix_drawing_job_batch_status', 'drawing_batch_id', 'status'),
+        db.Index(
+            'uq_drawing_job_active_spec', 'specification_id',
+            unique=True,
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+            sqlite_where=db.text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'spec_id': self.specification_id,
+            'status': self.status,
+            'error': self.error,
+            'drawing_url': self.drawing_url,
+            'request_count': self.request_count or 1,
+            'variants': self.variants or 1,
+            'force_new': bool(self.force_new),
+            'drawing_batch_id': self.drawing_batch_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class DrawingBatch(db.Model):
+    """Geração em massa de desenhos para uma coleção ou lote de upload.
+
+    Cada ficha vira um DrawingJob com `drawing_batch_id`; os jobs em massa
+    só são reivindicados depois dos pedidos individuais e respeitam o mesmo
+    limite global de concorrência e de imagens por minuto da fila.
+    """
+    __tablename__ = 'drawing_batch'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    scope = db.Column(db.String(20), nullable=False)  # collection, batch
+    collection_id = db.Column(db.Integer, db.ForeignKey('collection.id', ondelete='SET NULL'), nullable=True)
+    upload_batch_id = db.Column(db.String(50))  # Specification.batch_id
+    label = db.Column(db.String(255))
+    variants = db.Column(db.Integer, default=1)
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, completed, cancelled
+    total_specs = db.Column(db.Integer, default=0)  # fichas no escopo
+    queued_count = db.Column(db.Integer, default=0)  # jobs criados
+    skipped_existing = db.Column(db.Integer, default=0)  # já tinham desenho
+    skipped_active = db.Column(db.Integer, default=0)  # já estavam na fila
+    skipped_missing = db.Column(db.Integer, default=0)  # arquivo de origem ausente
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'scope': self.scope,
+            'collection_id': self.collection_id,
+            'upload_batch_id': self.upload_batch_id,
+            'label': self.label,
+            'variants': self.variants or 1,
+            'status': self.status,
+            'total_specs': self.total_specs or 0,
+            'queued': self.queued_count or 0,
+            'skipped_existing': self.skipped_existing or 0,
+            'skipped_active': self.skipped_active or 0,
+            'skipped_missing': self.skipped_missing or 0,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class DrawingCandidate(db.Model):
+    """Candidato de desenho técnico gerado por um job (n>1 na mesma chamada).
+
+    O estilista escolhe um candidato, que passa a ser o
+    `technical_drawing_url` da ficha.
+    """
+    __tablename__ = 'drawing_candidate'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('drawing_job.id', ondelete='CASCADE'), nullable=True)
+    specification_id = db.Column(db.Integer, db.ForeignKey('specification.id', ondelete='CASCADE'), nullable=False)
+    variant_index = db.Column(db.Integer, nullable=False, default=0)
+    image_url = db.Column(db.String(500), nullable=False)
+    cache_key = db.Column(db.String(64))
+    from_cache = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_drawing_candidate_spec_job', 'specification_id', 'job_id'),
+    )
+
+    def to_dict(self, selected_url=None):
+        return {
+            'id': self.id,
+            'job_id': self.job_id,
+            'variant_index': self.variant_index,
+            'image_url': self.image_url,
+            'from_cache': bool(self.from_cache),
+            'selected': bool(selected_url) and selected_url == self.image_url,
+        }
@@ -66,6 +66,13 @@ class FichaTecnica(db.Model):
 class FichaTecnicaItem(db.Model):
     __tablename__ = 'ficha_tecnica_item'
 
+    # Integration state kept across re-imports (see app/utils/ficha_sync.py)
+    SYNC_COLUMNS = (
+        'fluxogama_status', 'fluxogama_sent_at', 'fluxogama_response',
+        'oaz_status', 'oaz_pushed_at', 'oaz_remote_id', 'oaz_last_error',
+        'oaz_payload_hash', 'oaz_last_response',
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     ficha_id = db.Column(db.Integer, db.ForeignKey('ficha_tecnica.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -123,6 +130,11 @@ class FichaTecnicaItem(db.Model):
 
     raw_row = db.Column(db.Text)
 
+    # Incremental re-import tracking
+    row_hash = db.Column(db.String(64))   # SHA-256 of the last imported row
+    updated_at = db.Column(db.DateTime)   # last re-import that changed the row
+    deleted_at = db.Column(db.DateTime)   # soft delete: row left the spreadsheet
+
     __table_args__ = (
         db.UniqueConstraint(
             'ficha_id',
@@ -0,0 +1,90 @@
+import json
+from datetime import datetime
+from app.extensions import db
+
+
+class ImportJob(db.Model):
+    """Job de importação em background (ficha, compras, banco de dados).
+
+    O payload parseado no preview fica no import_store; o job guarda só o
+    token dele, o progresso e o checkpoint. Cada bloco de linhas é gravado
+    na mesma transação que avança o checkpoint, então um job interrompido
+    (deploy, worker morto) volta para a fila e continua de onde parou.
+    """
+    __tablename__ = 'import_job'
+
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # ficha, compras, banco
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, error, cancelled
+    payload_token = db.Column(db.String(64))
+    source_filename = db.Column(db.String(255))
+    total_rows = db.Column(db.Integer, default=0)
+    processed_rows = db.Column(db.Integer, default=0)
+    run_start_rows = db.Column(db.Integer, default=0)  # processed_rows quando a execução atual começou
+    checkpoint = db.Column(db.Text)  # JSON, específico de cada tipo
+    result = db.Column(db.Text)  # JSON com o resultado (ficha_id, created, ...)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    attempts = db.Column(db.Integer, default=0)
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)  # início da execução atual
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_import_job_status_created', 'status', 'created_at'),
+        db.Index('ix_import_job_user', 'user_id'),
+    )
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def get_checkpoint(self):
+        return json.loads(self.checkpoint) if self.checkpoint else {}
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else {}
+
+    def rows_per_second(self):
+        """Vazão da execução atual (ou da última, se já terminou)."""
+        if not self.started_at:
+            return None
+        end = self.finished_at or self.heartbeat_at
+        if not end:
+            return None
+        elapsed = (end - self.started_at).total_seconds()
+        rows = (self.processed_rows or 0) - (self.run_start_rows or 0)
+        if elapsed <= 0 or rows <= 0:
+            return None
+        return rows / elapsed
+
+    def to_dict(self):
+        total = self.total_rows or 0
+        processed = self.processed_rows or 0
+        rate = self.rows_per_second()
+        eta_seconds = None
+        if self.is_active and rate and total > processed:
+            eta_seconds = int((total - processed) / rate)
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'source_filename': self.source_filename,
+            'total_rows': total,
+            'processed_rows': processed,
+            'percent': round(100.0 * processed / total, 1) if total else (100.0 if self.status == 'completed' else 0.0),
+            'rows_per_second': round(rate, 1) if rate else None,
+            'eta_seconds': eta_seconds,
+            'cancel_requested': bool(self.cancel_requested),
+            'attempts': self.attempts or 0,
+            'error': self.error,
+            'result': self.get_result(),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
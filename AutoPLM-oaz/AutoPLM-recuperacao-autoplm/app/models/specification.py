@@ -127,3 +127,12 @@ class Specification(db.Model):
             return f"{minutes} minutos, {seconds} segundos"
         else:
             return f"{seconds} segundos"
+
+
+# Galeria de desenhos: filtro "tem desenho" + ordenação (created_at, id) para
+# a paginação por keyset. Em bancos existentes, criar com migrate_gallery_indexes.py
+db.Index('ix_specification_drawing_created',
+         Specification.technical_drawing_url.isnot(None), Specification.created_at, Specification.id)
+db.Index('ix_specification_user_drawing_created',
+         Specification.user_id, Specification.technical_drawing_url.isnot(None),
+         Specification.created_at, Specification.id)
@@ -0,0 +1,18 @@
+from datetime import datetime
+from app.extensions import db
+
+
+class StaticAsset(db.Model):
+    """Arquivo do asset store endereçado por conteúdo (static/assets/<aa>/<bb>/<sha256>.<ext>).
+
+    `ref_count` é mantido pelas colunas que apontam para o asset
+    (ver app.utils.assets._asset_references) e recalculado pelo GC.
+    """
+    __tablename__ = 'static_asset'
+
+    digest = db.Column(db.String(64), primary_key=True)
+    extension = db.Column(db.String(10), nullable=False)
+    size_bytes = db.Column(db.BigInteger)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
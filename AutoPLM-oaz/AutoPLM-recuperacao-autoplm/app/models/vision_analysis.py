@@ -0,0 +1,25 @@
+from datetime import datetime
+from app.extensions import db
+
+
+class VisionAnalysis(db.Model):
+    """Cache da análise visual (GPT-4o Vision) por conteúdo das imagens.
+
+    A chave é o SHA-256 das imagens enviadas + versão do prompt, de modo que
+    o parsing (etapa 4) e a geração de desenho técnico reaproveitam o mesmo
+    resultado e regenerações não pagam outra chamada de visão.
+    """
+    __tablename__ = 'vision_analysis'
+
+    id = db.Column(db.Integer, primary_key=True)
+    image_hash = db.Column(db.String(64), nullable=False)
+    prompt_version = db.Column(db.String(20), nullable=False)
+    model = db.Column(db.String(50))
+    analysis_json = db.Column(db.Text, nullable=False)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('image_hash', 'prompt_version', name='uq_vision_analysis_key'),
+    )
@@ -1,15 +1,24 @@
-import io
 import json
-import csv
 import time
 import uuid
 from datetime import datetime, timedelta
-from flask import Blueprint, jsonify, session, request, send_file
+from sqlalchemy import delete, select, update, bindparam
+from flask import Blueprint, jsonify, session, request, send_file, current_app, Response, stream_with_context
 from app.extensions import csrf, db
-from app.models import User, Specification, FichaTecnica, FichaTecnicaItem, OazValueMap
+from app.models import User, Specification, FichaTecnica, FichaTecnicaItem, OazValueMap, ImportJob
 from app.utils.auth import login_required
 from app.utils.excel_parser import parse_excel, HEADER_FIELD_MAP
-from app.utils.compras_parser import parse_compras_xlsx
+from app.utils.compras_parser import parse_compras_xlsx, parse_compras_columns, default_compras_sheet
+from app.utils.workbook_cache import cache_workbook, workbook_info, load_sheet_columns, WorkbookExpired
+from app.utils.import_store import get_import_store, PayloadTooLarge
+from app.utils.bulk_insert import bulk_insert
+from app.utils.ficha_sync import IMPORTED_COLUMNS, item_row_hash, plan_item_sync
+from app.utils.ficha_export import export_columns, export_header, iter_item_rows, iter_csv, write_xlsx
+from app.utils.import_jobs import (
+    enqueue_import_job, register_import_handler, get_import_job_for_user,
+    cancel_import_job, prune_import_store,
+)
+from app.utils.uploads import ingest_to_tempfile, reject_oversized_request, UploadRejected, XLSX_KINDS
 from app.integrations.oaz.client import OazClient, OazConfigError, compute_payload_hash
 from app.integrations.oaz.mapper import (
     build_oaz_payload, get_oaz_map_lookup, normalize_text, FIELD_MAP, DB_FIELDS,
@@ -32,7 +41,6 @@ STAGE_MAP = {
     7: 'completed'
 }
 
-_IMPORT_CACHE = {}
 _IMPORT_CACHE_TTL = timedelta(minutes=30)
 
 
@@ -46,29 +54,16 @@ def get_processing_stage(spec):
 
 
 def _cache_import_payload(payload):
-    token = str(uuid.uuid4())
-    _IMPORT_CACHE[token] = {
-        'payload': payload,
-        'expires_at': datetime.utcnow() + _IMPORT_CACHE_TTL,
-    }
-    return token
+    """Grava o payload parseado no store compartilhado; o confirm pode cair em outro worker."""
+    return get_import_store().put('imports', payload, _IMPORT_CACHE_TTL)
 
 
 def _pop_import_payload(token):
-    data = _IMPORT_CACHE.get(token)
-    if not data:
-        return None
-    if data['expires_at'] < datetime.utcnow():
-        _IMPORT_CACHE.pop(token, None)
-        return None
-    return _IMPORT_CACHE.pop(token)['payload']
+    return get_import_store().pop('imports', token)
 
 
 def _prune_import_cache():
-    now = datetime.utcnow()
-    expired = [k for k, v in _IMPORT_CACHE.items() if v['expires_at'] < now]
-    for key in expired:
-        _IMPORT_CACHE.pop(key, None)
+    prune_import_store()
 
 
 def _ensure_user_access(user, ficha):
@@ -77,6 +72,202 @@ def _ensure_user_access(user, ficha):
     return True
 
 
+def _ficha_item_rows(items, ficha_id, created_at):
+    model_fields = set(FichaTecnicaItem.__table__.columns.keys())
+    model_fields.difference_update({'id', 'ficha_id', 'created_at', 'raw_row'})
+    for item in items:
+        row = {k: v for k, v in item.items() if k in model_fields}
+        row['ficha_id'] = ficha_id
+        row['created_at'] = created_at
+        row['raw_row'] = json.dumps(item.get('raw_row', {}))
+        row['row_hash'] = item_row_hash(row)
+        yield row
+
+
+def _run_ficha_import(payload, ctx):
+    """Job 'ficha': cria a FichaTecnica e grava os itens em blocos (checkpoint: ficha_id, offset)."""
+    items = payload.get('items', [])
+    ficha_id = ctx.checkpoint.get('ficha_id')
+    if not ficha_id:
+        ficha = FichaTecnica(
+            user_id=ctx.user_id,
+            source_filename=payload.get('source_filename'),
+            created_at=datetime.utcnow(),
+            header_raw=json.dumps(payload.get('header_raw', [])),
+            columns_meta=json.dumps(payload.get('columns', [])),
+            **payload.get('header', {})
+        )
+        db.session.add(ficha)
+        db.session.flush()
+        ficha_id = ficha.id
+        ctx.save(0, ficha_id=ficha_id, offset=0)
+
+    offset = ctx.checkpoint.get('offset', 0)
+    created_at = datetime.utcnow()
+    while offset < len(items):
+        chunk = items[offset:offset + ctx.chunk_size]
+        bulk_insert(FichaTecnicaItem.__table__, _ficha_item_rows(chunk, ficha_id, created_at))
+        offset += len(chunk)
+        ctx.save(offset, offset=offset)
+
+    logger.info('import_confirm: job=%s ficha=%s itens=%d', ctx.job_id, ficha_id, len(items))
+    return {
+        'ficha_id': ficha_id,
+        'created_items': len(items),
+        'skipped_items': len(payload.get('invalid_rows', [])),
+    }
+
+
+def _cancel_ficha_import(job, checkpoint):
+    """Remove a ficha parcial de um job cancelado."""
+    ficha_id = checkpoint.get('ficha_id')
+    if ficha_id:
+        db.session.execute(delete(FichaTecnicaItem.__table__).where(FichaTecnicaItem.ficha_id == ficha_id))
+        db.session.execute(delete(FichaTecnica.__table__).where(FichaTecnica.id == ficha_id))
+
+
+register_import_handler('ficha', _run_ficha_import, on_cancel=_cancel_ficha_import)
+
+
+def _find_existing_ficha(header):
+    """Ficha já importada com o mesmo number_pi_order (reimportação incremental)."""
+    number_pi_order = (header or {}).get('number_pi_order')
+    if not number_pi_order:
+        return None
+    return FichaTecnica.query.filter_by(number_pi_order=number_pi_order).first()
+
+
+def _active_ficha_update(ficha_id):
+    """Job 'ficha_update' na fila/rodando para a ficha, ou None."""
+    jobs = ImportJob.query.filter(
+        ImportJob.kind == 'ficha_update',
+        ImportJob.status.in_(ImportJob.ACTIVE_STATUSES),
+    ).all()
+    return next((job for job in jobs if job.get_checkpoint().get('ficha_id') == ficha_id), None)
+
+
+def _existing_item_states(ficha_id):
+    """Chave, hash e estado de sync dos itens da ficha (inclusive os removidos).
+
+    Itens importados antes do row_hash têm o hash calculado a partir do banco
+    (hash_backfill=True), e o valor é gravado quando a linha não mudou.
+    """
+    table = FichaTecnicaItem.__table__
+    states = [
+        dict(row._mapping) for row in db.session.execute(
+            select(
+                table.c.id, table.c.item_no_ref_supplier, table.c.oaz_reference,
+                table.c.row_hash, table.c.deleted_at, table.c.fluxogama_status,
+            ).where(table.c.ficha_id == ficha_id)
+        )
+    ]
+    legacy = {state['id']: state for state in states if state['row_hash'] is None}
+    legacy_ids = list(legacy)
+    columns = [table.c.id] + [table.c[name] for name in IMPORTED_COLUMNS]
+    for i in range(0, len(legacy_ids), 2000):
+        chunk = legacy_ids[i:i + 2000]
+        for row in db.session.execute(select(*columns).where(table.c.id.in_(chunk))):
+            state = legacy[row.id]
+            state['row_hash'] = item_row_hash(row._mapping)
+            state['hash_backfill'] = True
+    return states
+
+
+def _plan_ficha_update(ficha_id, items):
+    rows = list(_ficha_item_rows(items, ficha_id, datetime.utcnow()))
+    return rows, plan_item_sync(_existing_item_states(ficha_id), rows)
+
+
+def _item_update_params(row, state, now):
+    params = {name: row.get(name) for name in IMPORTED_COLUMNS}
+    params.update({
+        'item_id': state['id'],
+        'row_hash': row['row_hash'],
+        'updated_at': now,
+        'deleted_at': None,
+        # Item alterado volta para a fila do Fluxogama; o OAZ já reenvia pelo payload_hash
+        'fluxogama_status': 'pending' if state['fluxogama_status'] == 'sent' else state['fluxogama_status'],
+    })
+    return params
+
+
+def _run_ficha_update(payload, ctx):
+    """
+    Job 'ficha_update': reimportação incremental de uma ficha existente.
+
+    Insere as linhas novas, atualiza as que mudaram (row_hash) e faz soft
+    delete dos itens que saíram da planilha; o estado de sync dos itens sem
+    mudança é preservado. Checkpoint: offset + contadores. Ao retomar, o plano
+    é refeito (linhas já aplicadas aparecem como sem mudança) e só as linhas
+    a partir do offset são aplicadas.
+    """
+    ficha = db.session.get(FichaTecnica, payload['ficha_id'])
+    if not ficha:
+        raise ValueError(f"Ficha {payload['ficha_id']} nao existe mais")
+
+    for field, value in payload.get('header', {}).items():
+        setattr(ficha, field, value)
+    ficha.source_filename = payload.get('source_filename')
+    ficha.header_raw = json.dumps(payload.get('header_raw', []))
+    ficha.columns_meta = json.dumps(payload.get('columns', []))
+
+    rows, plan = _plan_ficha_update(ficha.id, payload.get('items', []))
+    counts = ctx.checkpoint.get('counts') or {'insert': 0, 'update': 0, 'unchanged': 0, 'delete': 0}
+    offset = ctx.checkpoint.get('offset', 0)
+
+    table = FichaTecnicaItem.__table__
+    update_stmt = update(table).where(table.c.id == bindparam('item_id'))
+    backfill_stmt = update(table).where(table.c.id == bindparam('item_id')).values(row_hash=bindparam('new_hash'))
+    now = datetime.utcnow()
+
+    while offset < len(rows):
+        end = offset + ctx.chunk_size
+        inserts, updates, backfill = [], [], []
+        for row, (action, state) in zip(rows[offset:end], plan.actions[offset:end]):
+            counts[action] += 1
+            if action == 'insert':
+                inserts.append(row)
+            elif action == 'update':
+                updates.append(_item_update_params(row, state, now))
+            elif state.get('hash_backfill'):
+                backfill.append({'item_id': state['id'], 'new_hash': row['row_hash']})
+        if inserts:
+            bulk_insert(table, inserts)
+        if updates:
+            db.session.execute(update_stmt, updates)
+        if backfill:
+            db.session.execute(backfill_stmt, backfill)
+        offset = min(end, len(rows))
+        ctx.save(offset, offset=offset, counts=counts)
+
+    if not ctx.checkpoint.get('deleted'):
+        for i in range(0, len(plan.removed), 2000):
+            db.session.execute(
+                update(table)
+                .where(table.c.id.in_(plan.removed[i:i + 2000]), table.c.deleted_at.is_(None))
+                .values(deleted_at=now)
+            )
+        counts['delete'] = len(plan.removed)
+        ctx.save(len(rows), offset=len(rows), counts=counts, deleted=True)
+
+    logger.info(
+        'import_confirm: job=%s ficha=%s atualizada (novos=%d alterados=%d sem_mudanca=%d removidos=%d)',
+        ctx.job_id, ficha.id, counts['insert'], counts['update'], counts['unchanged'], counts['delete'],
+    )
+    return {
+        'ficha_id': ficha.id,
+        'created_items': counts['insert'],
+        'updated_items': counts['update'],
+        'unchanged_items': counts['unchanged'],
+        'deleted_items': counts['delete'],
+        'skipped_items': len(payload.get('invalid_rows', [])),
+    }
+
+
+# Cancelar uma atualização mantém o que já foi aplicado (os itens antigos não são recriados)
+register_import_handler('ficha_update', _run_ficha_update)
+
+
 @api_bp.route('/fichas/import/preview', methods=['POST'])
 @login_required
 @csrf.exempt
@@ -87,13 +278,21 @@ def import_preview():
     if not user:
         return jsonify({'success': False, 'error': 'Sessao invalida'}), 401
 
+    too_large = reject_oversized_request(XLSX_KINDS)
+    if too_large:
+        return jsonify({'success': False, 'error': too_large}), 413
+
     file = request.files.get('file')
     if not file or not file.filename:
         return jsonify({'success': False, 'error': 'Arquivo XLSX nao encontrado'}), 400
 
     try:
-        payload = parse_excel(file.read())
+        with ingest_to_tempfile(file) as upload:
+            payload = parse_excel(upload.path)
         payload['source_filename'] = file.filename
+        payload['source_sha256'] = upload.sha256
+    except UploadRejected as exc:
+        return jsonify({'success': False, 'error': str(exc)}), exc.status_code
     except Exception as exc:
         logger.error('Erro ao ler XLSX: %s', exc, exc_info=True)
         return jsonify({'success': False, 'error': f'Falha ao ler o XLSX: {exc}'}), 400
@@ -101,7 +300,23 @@ def import_preview():
     if payload.get('errors'):
         return jsonify({'success': False, 'error': 'Planilha invalida', 'details': payload['errors']}), 400
 
-    token = _cache_import_payload(payload)
+    existing_ficha = None
+    existing = _find_existing_ficha(payload.get('header'))
+    if existing:
+        can_update = _ensure_user_access(user, existing)
+        existing_ficha = {
+            'id': existing.id,
+            'number_pi_order': existing.number_pi_order,
+            'source_filename': existing.source_filename,
+            'created_at': existing.created_at.isoformat() if existing.created_at else None,
+            'can_update': can_update,
+            'changes': _plan_ficha_update(existing.id, payload.get('items', []))[1].counts() if can_update else None,
+        }
+
+    try:
+        token = _cache_import_payload(payload)
+    except PayloadTooLarge as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 413
     preview_items = payload['items'][:50]
     return jsonify({
         'success': True,
@@ -121,6 +336,7 @@ def import_preview():
         'missing_columns': payload.get('missing_columns', []),
         'unmapped_columns': payload.get('unmapped_columns', []),
         'preview_items': preview_items,
+        'existing_ficha': existing_ficha,
     })
 
 
@@ -143,95 +359,285 @@ def import_confirm():
     if not payload:
         return jsonify({'success': False, 'error': 'Token expirado ou invalido'}), 400
 
-    header = payload.get('header', {})
-    columns = payload.get('columns', [])
-    items = payload.get('items', [])
-
-    ficha = FichaTecnica(
-        user_id=user.id,
-        source_filename=payload.get('source_filename'),
-        created_at=datetime.utcnow(),
-        header_raw=json.dumps(payload.get('header_raw', [])),
-        columns_meta=json.dumps(columns),
-        **header
-    )
-    db.session.add(ficha)
-    db.session.flush()
+    # Mesma PI já importada: reimportação incremental da ficha existente
+    kind = 'ficha'
+    checkpoint = None
+    existing = _find_existing_ficha(payload.get('header'))
+    if existing:
+        if not _ensure_user_access(user, existing):
+            return jsonify({
+                'success': False,
+                'error': f'A PI {existing.number_pi_order} ja foi importada por outro usuario',
+            }), 403
+        # Uma atualização por ficha: duas planejariam os inserts sobre o mesmo estado
+        # (itens sem oaz_reference não têm chave única e seriam duplicados). A trava
+        # na linha da ficha vale até o commit do enqueue e serializa confirms simultâneos.
+        db.session.query(FichaTecnica.id).filter(FichaTecnica.id == existing.id).with_for_update().scalar()
+        running = _active_ficha_update(existing.id)
+        if running:
+            db.session.rollback()
+            get_import_store().put('imports', payload, _IMPORT_CACHE_TTL, token=token)
+            return jsonify({
+                'success': False,
+                'error': f'A ficha {existing.number_pi_order} ja esta sendo atualizada; aguarde e confirme novamente',
+                'job_id': running.id,
+            }), 409
+        kind = 'ficha_update'
+        payload['ficha_id'] = existing.id
+        checkpoint = {'ficha_id': existing.id}
 
-    created = 0
-    model_fields = set(FichaTecnicaItem.__table__.columns.keys())
-    model_fields.discard('raw_row')
-    for item in items:
-        clean_payload = {k: v for k, v in item.items() if k in model_fields}
-        ficha_item = FichaTecnicaItem(
-            ficha_id=ficha.id,
-            created_at=datetime.utcnow(),
-            raw_row=json.dumps(item.get('raw_row', {})),
-            **clean_payload
+    try:
+        job = enqueue_import_job(
+            kind, payload, user.id, current_app._get_current_object(),
+            total_rows=len(payload.get('items', [])),
+            source_filename=payload.get('source_filename'),
+            checkpoint=checkpoint,
         )
-        db.session.add(ficha_item)
-        created += 1
+    except PayloadTooLarge as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 413
 
-    db.session.commit()
+    logger.info('import_confirm: user=%s job=%s tipo=%s itens=%d', user.username, job.id, kind, job.total_rows)
     return jsonify({
         'success': True,
-        'ficha_id': ficha.id,
-        'created_items': created,
+        'job_id': job.id,
+        'mode': 'update' if existing else 'create',
+        'ficha_id': existing.id if existing else None,
+        'status_url': f'/api/imports/jobs/{job.id}',
+        'total_items': job.total_rows,
         'skipped_items': len(payload.get('invalid_rows', [])),
-    })
+    }), 202
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Compras (Purchased Products) Import → Specifications
 # ═══════════════════════════════════════════════════════════════════════
 
+
+# Map of compras parser fields → Specification model fields
+# Mirrors exactly the XLSX columns:
+#   A  COLEÇÃO         → collection
+#   D  REFERÊNCIA      → description (material name)
+#   E  COMPOSIÇÃO      → composition
+#   F  CORNER          → corner
+#   G  LINHA           → main_fabric (product line)
+#   H  GRUPO           → main_group
+#   I  SUBGRUPO        → sub_group
+#   J  PREÇO DE VENDA  → target_price
+#   K  FX DE PREÇO     → price_range
+#   M  FORNECEDOR      → supplier
+#   O  COR             → colors
+#   P-U Sizes           → pilot_size (built by parser)
+#   AB DATA DE ENTREGA → delivery_cd_month
+_COMPRAS_FIELD_MAPPING = {
+    'referencia':       'description',
+    'composition':      'composition',
+    'corner':           'corner',
+    'linha':            'main_fabric',
+    'main_group':       'main_group',
+    'sub_group':        'sub_group',
+    'supplier':         'supplier',
+    'colors':           'colors',
+    'target_price':     'target_price',
+    'price_range':      'price_range',
+    'pilot_size':       'pilot_size',
+    'delivery_date':    'delivery_cd_month',
+    'collection':       'collection',
+    'cor_etiqueta':     'tags_kit',
+    'origem':           'specific_details',
+}
+
+# Extra fields stored as JSON in spec.extra_fields
+_COMPRAS_EXTRA_KEYS = (
+    'grade', 'total_pcs', 'packs', 'total_souq',
+    'custo_real', 'custo_negociado', 'compra_total', 'aprovado',
+)
+
+
+def _compras_spec_rows(items, start, user_id, batch_id, now, errors_list):
+    """Specification rows for items[start:], numbered from start + 1."""
+    for i, item in enumerate(items, start=start):
+        try:
+            row = {
+                'user_id': user_id,
+                'pdf_filename': f'compras_import_{batch_id}_{i+1}.xlsx',
+                'batch_id': batch_id,
+                'processing_status': 'completed',
+                'processing_stage': 7,  # STAGE_COMPLETED
+                'created_at': now,
+                # Same as Specification.set_status('in_development') on a new spec
+                'status': 'in_development',
+                'status_changed_at': now,
+                'status_completed_at': None,
+                'is_imported': True,
+                'import_category': 'compras',
+            }
+
+            # Set mapped fields
+            for src_field, spec_field in _COMPRAS_FIELD_MAPPING.items():
+                value = item.get(src_field)
+                if value:
+                    row[spec_field] = str(value)
+
+            # Build ref_souq from sub_group + color + supplier
+            ref_parts = []
+            if item.get('sub_group'):
+                ref_parts.append(item['sub_group'])
+            if item.get('colors'):
+                ref_parts.append(item['colors'])
+            row['ref_souq'] = ' - '.join(ref_parts) if ref_parts else f'COMPRA-{batch_id}-{i+1}'
+
+            # Store extra fields as JSON
+            extra = {}
+            for key in _COMPRAS_EXTRA_KEYS:
+                if item.get(key):
+                    extra[key] = item[key]
+            if extra:
+                row['extra_fields'] = json.dumps(extra, ensure_ascii=False)
+        except Exception as e:
+            errors_list.append(f'Linha {i+1}: {str(e)}')
+            continue
+        yield row
+
+
+def _run_compras_import(payload, ctx):
+    """Job 'compras': one Specification per row, in chunks (checkpoint: batch_id, offset, created)."""
+    items = payload.get('items', [])
+    batch_id = ctx.checkpoint.get('batch_id') or str(uuid.uuid4())[:8]
+    offset = ctx.checkpoint.get('offset', 0)
+    created = ctx.checkpoint.get('created', 0)
+    errors_list = list(ctx.checkpoint.get('errors', []))
+    now = datetime.utcnow()
+
+    while offset < len(items):
+        chunk = items[offset:offset + ctx.chunk_size]
+        created += bulk_insert(
+            Specification.__table__,
+            _compras_spec_rows(chunk, offset, ctx.user_id, batch_id, now, errors_list),
+        )
+        offset += len(chunk)
+        ctx.save(offset, batch_id=batch_id, offset=offset, created=created, errors=errors_list[:100])
+
+    logger.info(
+        'compras_import_confirm: job=%s batch=%s created=%d errors=%d',
+        ctx.job_id, batch_id, created, len(errors_list)
+    )
+    return {
+        'created': created,
+        'errors': errors_list[:100],
+        'batch_id': batch_id,
+    }
+
+
+def _cancel_compras_import(job, checkpoint):
+    """Remove the specs already created by a cancelled job."""
+    batch_id = checkpoint.get('batch_id')
+    if batch_id:
+        db.session.execute(
+            delete(Specification.__table__).where(
+                Specification.batch_id == batch_id,
+                Specification.import_category == 'compras',
+                Specification.user_id == job.user_id,
+            )
+        )
+
+
+register_import_handler('compras', _run_compras_import, on_cancel=_cancel_compras_import)
+
+
+def _parse_cached_compras_sheet(user_id, workbook_id, sheet_name):
+    """Parse a sheet of a cached workbook; returns (source_filename, result)."""
+    source_filename, sheet_names = workbook_info(user_id, workbook_id)
+    sheet_name = sheet_name or default_compras_sheet(sheet_names)
+    columns = None
+    if sheet_name in sheet_names:
+        columns, sheet_names = load_sheet_columns(user_id, workbook_id, sheet_name)
+    result = parse_compras_columns(columns, sheet_names, sheet_name=sheet_name)
+    result['source_sha256'] = workbook_id
+    return source_filename, result
+
+
 @api_bp.route('/compras/import/sheets', methods=['POST'])
 @login_required
 @csrf.exempt
 def compras_import_sheets():
-    """Upload a Compras XLSX and return only sheet names (lightweight, no parsing)."""
+    """Upload a Compras XLSX once: cache it and return its sheet names (no parsing).
+
+    The returned workbook_id is sent to /compras/import/preview instead of the file.
+    """
+    _prune_import_cache()
+
     user = User.query.get(session.get('user_id'))
     if not user:
         return jsonify({'success': False, 'error': 'Sessao invalida'}), 401
 
+    too_large = reject_oversized_request(XLSX_KINDS)
+    if too_large:
+        return jsonify({'success': False, 'error': too_large}), 413
+
     file = request.files.get('file')
     if not file or not file.filename:
         return jsonify({'success': False, 'error': 'Arquivo XLSX nao encontrado'}), 400
 
     try:
-        import pandas as pd
-        xl = pd.ExcelFile(io.BytesIO(file.read()), engine='openpyxl')
+        with ingest_to_tempfile(file) as upload:
+            workbook_id, sheet_names = cache_workbook(user.id, upload)
         return jsonify({
             'success': True,
-            'sheet_names': xl.sheet_names,
+            'workbook_id': workbook_id,
+            'sheet_names': sheet_names,
         })
+    except PayloadTooLarge as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 413
+    except UploadRejected as exc:
+        return jsonify({'success': False, 'error': str(exc)}), exc.status_code
     except Exception as exc:
         logger.error('Erro ao ler sheet names: %s', exc, exc_info=True)
         return jsonify({'success': False, 'error': f'Falha ao ler o XLSX: {exc}'}), 400
 
+
 @api_bp.route('/compras/import/preview', methods=['POST'])
 @login_required
 @csrf.exempt
 def compras_import_preview():
-    """Upload a Compras XLSX, parse it, return preview of items."""
+    """Parse one sheet of a Compras XLSX, return preview of items.
+
+    Either workbook_id (from /compras/import/sheets) + sheet_name, or the file itself.
+    """
     _prune_import_cache()
 
     user = User.query.get(session.get('user_id'))
     if not user:
         return jsonify({'success': False, 'error': 'Sessao invalida'}), 401
 
-    file = request.files.get('file')
-    if not file or not file.filename:
-        return jsonify({'success': False, 'error': 'Arquivo XLSX nao encontrado'}), 400
+    too_large = reject_oversized_request(XLSX_KINDS)
+    if too_large:
+        return jsonify({'success': False, 'error': too_large}), 413
 
     sheet_name = request.form.get('sheet_name', '').strip() or None
+    workbook_id = request.form.get('workbook_id', '').strip()
 
-    try:
-        file_bytes = file.read()
-        result = parse_compras_xlsx(file_bytes, sheet_name=sheet_name)
-    except Exception as exc:
-        logger.error('Erro ao ler XLSX compras: %s', exc, exc_info=True)
-        return jsonify({'success': False, 'error': f'Falha ao ler o XLSX: {exc}'}), 400
+    if workbook_id:
+        try:
+            source_filename, result = _parse_cached_compras_sheet(user.id, workbook_id, sheet_name)
+        except WorkbookExpired as exc:
+            return jsonify({'success': False, 'error': str(exc), 'workbook_expired': True}), 410
+        except Exception as exc:
+            logger.error('Erro ao ler XLSX compras (cache): %s', exc, exc_info=True)
+            return jsonify({'success': False, 'error': f'Falha ao ler o XLSX: {exc}'}), 400
+    else:
+        file = request.files.get('file')
+        if not file or not file.filename:
+            return jsonify({'success': False, 'error': 'Arquivo XLSX nao encontrado'}), 400
+        source_filename = file.filename
+        try:
+            with ingest_to_tempfile(file) as upload:
+                result = parse_compras_xlsx(upload.path, sheet_name=sheet_name)
+            result['source_sha256'] = upload.sha256
+        except UploadRejected as exc:
+            return jsonify({'success': False, 'error': str(exc)}), exc.status_code
+        except Exception as exc:
+            logger.error('Erro ao ler XLSX compras: %s', exc, exc_info=True)
+            return jsonify({'success': False, 'error': f'Falha ao ler o XLSX: {exc}'}), 400
 
     if result.get('errors'):
         return jsonify({
@@ -241,8 +647,11 @@ def compras_import_preview():
         }), 400
 
     # Cache for confirm step
-    result['source_filename'] = file.filename
-    token = _cache_import_payload(result)
+    result['source_filename'] = source_filename
+    try:
+        token = _cache_import_payload(result)
+    except PayloadTooLarge as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 413
 
     return jsonify({
         'success': True,
@@ -276,106 +685,56 @@ def compras_import_confirm():
     if not payload:
         return jsonify({'success': False, 'error': 'Token expirado ou invalido'}), 400
 
-    items = payload.get('items', [])
-    source_filename = payload.get('source_filename', 'compras_import.xlsx')
-    batch_id = str(uuid.uuid4())[:8]
-
-    # Map of compras parser fields → Specification model fields
-    # Mirrors exactly the XLSX columns:
-    #   A  COLEÇÃO         → collection
-    #   D  REFERÊNCIA      → description (material name)
-    #   E  COMPOSIÇÃO      → composition
-    #   F  CORNER          → corner
-    #   G  LINHA           → main_fabric (product line)
-    #   H  GRUPO           → main_group
-    #   I  SUBGRUPO        → sub_group
-    #   J  PREÇO DE VENDA  → target_price
-    #   K  FX DE PREÇO     → price_range
-    #   M  FORNECEDOR      → supplier
-    #   O  COR             → colors
-    #   P-U Sizes           → pilot_size (built by parser)
-    #   AB DATA DE ENTREGA → delivery_cd_month
-    FIELD_MAPPING = {
-        'referencia':       'description',
-        'composition':      'composition',
-        'corner':           'corner',
-        'linha':            'main_fabric',
-        'main_group':       'main_group',
-        'sub_group':        'sub_group',
-        'supplier':         'supplier',
-        'colors':           'colors',
-        'target_price':     'target_price',
-        'price_range':      'price_range',
-        'pilot_size':       'pilot_size',
-        'delivery_date':    'delivery_cd_month',
-        'collection':       'collection',
-        'cor_etiqueta':     'tags_kit',
-        'origem':           'specific_details',
-    }
-
-    # Extra fields stored as JSON in spec.extra_fields
-    EXTRA_KEYS = (
-        'grade', 'total_pcs', 'packs', 'total_souq',
-        'custo_real', 'custo_negociado', 'compra_total', 'aprovado',
-    )
+    try:
+        job = enqueue_import_job(
+            'compras', payload, user.id, current_app._get_current_object(),
+            total_rows=len(payload.get('items', [])),
+            source_filename=payload.get('source_filename'),
+        )
+    except PayloadTooLarge as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 413
 
-    created = 0
-    errors_list = []
+    logger.info('compras_import_confirm: user=%s job=%s itens=%d', user.username, job.id, job.total_rows)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': f'/api/imports/jobs/{job.id}',
+        'total_items': job.total_rows,
+    }), 202
 
-    for i, item in enumerate(items):
-        try:
-            spec = Specification()
-            spec.user_id = user.id
-            spec.pdf_filename = f'compras_import_{batch_id}_{i+1}.xlsx'
-            spec.batch_id = batch_id
-            spec.processing_status = 'completed'
-            spec.processing_stage = 7  # STAGE_COMPLETED
-            spec.created_at = datetime.utcnow()
-            spec.set_status('in_development')
-            spec.is_imported = True
-            spec.import_category = 'compras'
 
-            # Set mapped fields
-            for src_field, spec_field in FIELD_MAPPING.items():
-                value = item.get(src_field)
-                if value:
-                    setattr(spec, spec_field, str(value))
+@api_bp.route('/imports/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def import_job_status(job_id):
+    """Progresso de um job de importação (ficha, compras ou banco)."""
+    user = User.query.get(session.get('user_id'))
+    if not user:
+        return jsonify({'success': False, 'error': 'Sessao invalida'}), 401
 
-            # Build ref_souq from sub_group + color + supplier
-            ref_parts = []
-            if item.get('sub_group'):
-                ref_parts.append(item['sub_group'])
-            if item.get('colors'):
-                ref_parts.append(item['colors'])
-            spec.ref_souq = ' - '.join(ref_parts) if ref_parts else f'COMPRA-{batch_id}-{i+1}'
+    job = get_import_job_for_user(job_id, user)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job nao encontrado'}), 404
 
-            # Store extra fields as JSON
-            extra = {}
-            for key in EXTRA_KEYS:
-                if item.get(key):
-                    extra[key] = item[key]
-            if extra:
-                spec.extra_fields = json.dumps(extra, ensure_ascii=False)
+    return jsonify({'success': True, **job.to_dict()})
 
-            db.session.add(spec)
-            created += 1
-        except Exception as e:
-            errors_list.append(f'Linha {i+1}: {str(e)}')
-            continue
 
-    db.session.commit()
+@api_bp.route('/imports/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+@csrf.exempt
+def import_job_cancel(job_id):
+    """Cancela um job de importação; as linhas já gravadas são desfeitas."""
+    user = User.query.get(session.get('user_id'))
+    if not user:
+        return jsonify({'success': False, 'error': 'Sessao invalida'}), 401
 
-    logger.info(
-        'compras_import_confirm: user=%s batch=%s created=%d errors=%d',
-        user.username, batch_id, created, len(errors_list)
-    )
+    job = get_import_job_for_user(job_id, user)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job nao encontrado'}), 404
 
-    return jsonify({
-        'success': True,
-        'created': created,
-        'errors': errors_list,
-        'batch_id': batch_id,
-    })
+    if not cancel_import_job(job, current_app._get_current_object()):
+        return jsonify({'success': False, 'error': 'Job ja finalizado', **job.to_dict()}), 409
+    db.session.refresh(job)
+    return jsonify({'success': True, **job.to_dict()})
 
 
 @api_bp.route('/fichas', methods=['GET'])
@@ -471,7 +830,7 @@ def ficha_itens(ficha_id):
     order = request.args.get('order', type=str, default='asc')
     export = request.args.get('export', type=int, default=0)
 
-    query = FichaTecnicaItem.query.filter_by(ficha_id=ficha.id)
+    query = FichaTecnicaItem.query.filter_by(ficha_id=ficha.id, deleted_at=None)
 
     if q:
         query = query.filter(
@@ -503,37 +862,21 @@ def ficha_itens(ficha_id):
     query = query.order_by(sort_column)
 
     if export:
-        items = query.all()
-        columns = []
-        if ficha.columns_meta:
-            try:
-                columns = json.loads(ficha.columns_meta)
-            except (TypeError, ValueError):
-                columns = []
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([c['sourceColumnName'] or c['name'] for c in columns])
-        for item in items:
-            raw = {}
-            if item.raw_row:
-                try:
-                    raw = json.loads(item.raw_row)
-                except (TypeError, ValueError):
-                    raw = {}
-            row = []
-            for col in columns:
-                if hasattr(item, col['name']):
-                    value = getattr(item, col['name'], None)
-                else:
-                    value = raw.get(col['sourceColumnName'])
-                row.append(value)
-            writer.writerow(row)
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
+        # Streaming: itens lidos em blocos, só as colunas pedidas (?columns=a,b)
+        columns = export_columns(ficha, request.args.getlist('columns'))
+        header = export_header(columns)
+        rows = iter_item_rows(query, columns)
+        if request.args.get('format', 'csv').lower() == 'xlsx':
+            return send_file(
+                write_xlsx(header, rows),
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                as_attachment=True,
+                download_name=f"ficha_{ficha.id}_itens.xlsx",
+            )
+        return Response(
+            stream_with_context(iter_csv(header, rows)),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=f"ficha_{ficha.id}_itens.csv",
+            headers={'Content-Disposition': f'attachment; filename="ficha_{ficha.id}_itens.csv"'},
         )
 
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
@@ -648,6 +991,8 @@ def get_spec_status(spec_id):
             'stage': spec.processing_stage or 0,
             'description': spec.description or 'Processando...',
             'ref_souq': spec.ref_souq or '',
+            'supplier': spec.supplier or '',
+            'collection': spec.collection or '',
             'has_drawing': bool(spec.technical_drawing_url),
             'error': spec.last_error
         })
@@ -760,7 +1105,7 @@ def oaz_preview(ficha_id):
     if not _ensure_user_access(user, ficha):
         return jsonify({'success': False, 'error': 'Acesso negado'}), 403
 
-    items = FichaTecnicaItem.query.filter_by(ficha_id=ficha.id).all()
+    items = FichaTecnicaItem.query.filter_by(ficha_id=ficha.id, deleted_at=None).all()
     if not items:
         return jsonify({'success': False, 'error': 'Nenhum item nesta ficha'}), 404
 
@@ -833,7 +1178,7 @@ def oaz_push(ficha_id):
     force = data.get('force', False)
     item_ids = data.get('item_ids')
 
-    query = FichaTecnicaItem.query.filter_by(ficha_id=ficha.id)
+    query = FichaTecnicaItem.query.filter_by(ficha_id=ficha.id, deleted_at=None)
     if item_ids:
         query = query.filter(FichaTecnicaItem.id.in_(item_ids))
     items = query.all()
@@ -960,7 +1305,7 @@ def oaz_status(ficha_id):
     if not _ensure_user_access(user, ficha):
         return jsonify({'success': False, 'error': 'Acesso negado'}), 403
 
-    items = FichaTecnicaItem.query.filter_by(ficha_id=ficha.id).all()
+    items = FichaTecnicaItem.query.filter_by(ficha_id=ficha.id, deleted_at=None).all()
 
     statuses = []
     counts = {'PENDING': 0, 'SENT': 0, 'ERROR': 0, 'NONE': 0}
@@ -2,9 +2,12 @@ import os
 from flask import Blueprint, render_template, redirect, url_for, flash, session, request, current_app
 from werkzeug.utils import secure_filename
 from app.extensions import db
-from app.models import User, Collection, Specification
+from app.models import User, Collection, Specification, DrawingBatch
 from app.utils.auth import login_required
 from app.utils.logging import log_activity, rpa_info, rpa_error
+from app.utils.assets import store_asset
+from app.utils.drawing_queue import get_drawing_batch_progress
+from app.utils.gallery import invalidate_gallery_facets
 
 collections_bp = Blueprint('collections', __name__)
 
@@ -76,15 +79,12 @@ def create():
 
             cover_file = request.files.get('cover_image')
             if cover_file and cover_file.filename:
-                filename = secure_filename(cover_file.filename)
-                covers_dir = os.path.join(current_app.static_folder, 'covers')
-                os.makedirs(covers_dir, exist_ok=True)
-                cover_path = os.path.join(covers_dir, filename)
-                cover_file.save(cover_path)
-                collection.cover_image = f'/static/covers/{filename}'
+                extension = os.path.splitext(secure_filename(cover_file.filename))[1]
+                collection.cover_image = store_asset(cover_file.read(), extension, current_app.static_folder)
 
             db.session.add(collection)
             db.session.commit()
+            invalidate_gallery_facets()
 
             log_activity('CREATE_COLLECTION', 'collection', collection.id, target_name=collection.name)
             rpa_info(f"CREATE_COLLECTION: Coleção '{collection.name}' criada (ID: {collection.id})")
@@ -112,12 +112,20 @@ def view(id):
     specifications = Specification.query.filter_by(collection_id=collection.id).order_by(
         Specification.created_at.desc()).all()
 
+    # Geração em massa em andamento (ou a última) para o painel de progresso
+    drawing_batch = DrawingBatch.query.filter_by(collection_id=collection.id).order_by(
+        DrawingBatch.id.desc()).first()
+    drawing_batch_progress = get_drawing_batch_progress(drawing_batch) if drawing_batch else None
+    missing_drawings = sum(1 for spec in specifications if not spec.technical_drawing_url)
+
     log_activity('VIEW_COLLECTION', 'collection', collection.id, target_name=collection.name)
 
     return render_template('view_collection.html',
                            current_user=user,
                            collection=collection,
-                           specifications=specifications)
+                           specifications=specifications,
+                           drawing_batch=drawing_batch_progress,
+                           missing_drawings=missing_drawings)
 
 
 @collections_bp.route('/collections/<int:id>/edit', methods=['GET', 'POST'])
@@ -137,15 +145,12 @@ def edit(id):
 
         cover_file = request.files.get('cover_image')
         if cover_file and cover_file.filename:
-            filename = secure_filename(cover_file.filename)
-            covers_dir = os.path.join(current_app.static_folder, 'covers')
-            os.makedirs(covers_dir, exist_ok=True)
-            cover_path = os.path.join(covers_dir, filename)
-            cover_file.save(cover_path)
-            collection.cover_image = f'/static/covers/{filename}'
+            extension = os.path.splitext(secure_filename(cover_file.filename))[1]
+            collection.cover_image = store_asset(cover_file.read(), extension, current_app.static_folder)
 
         try:
             db.session.commit()
+            invalidate_gallery_facets()
             log_activity('EDIT_COLLECTION', 'collection', collection.id, target_name=collection.name)
             rpa_info(f"EDIT_COLLECTION: Coleção '{collection.name}' atualizada (ID: {collection.id})")
             flash('Coleção atualizada com sucesso!')
@@ -173,6 +178,7 @@ def delete(id):
         collection_name = collection.name
         db.session.delete(collection)
         db.session.commit()
+        invalidate_gallery_facets()
         log_activity('DELETE_COLLECTION', 'collection', id, target_name=collection_name)
         rpa_info(f"DELETE_COLLECTION: Coleção '{collection_name}' excluída (ID: {id})")
         flash('Coleção excluída com sucesso!')
@@ -1,26 +1,47 @@
 import os
 import io
 import base64
-import uuid
-import threading
 from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, flash, session, request, jsonify, send_file, current_app
-try:
-    from replit.object_storage import Client
-except ImportError:
-    Client = None
+from flask import Blueprint, render_template, redirect, url_for, flash, session, request, jsonify, current_app
+from sqlalchemy.orm import load_only
 from app.extensions import db, get_openai_client
-from app.models import User, Specification, Collection
+from app.models import User, Specification, Collection, DrawingJob, DrawingBatch, DrawingCandidate
 from app.utils.auth import login_required, admin_required
 from app.utils.files import is_image_file, is_pdf_file, convert_image_to_data_url
-from app.utils.pdf import extract_images_from_pdf, generate_image_thumbnail, generate_pdf_thumbnail
+from app.utils.pdf import get_pdf_images, generate_image_thumbnail, generate_pdf_thumbnail
 from app.utils.ai import analyze_images_with_gpt4_vision, build_technical_drawing_prompt
+from app.utils.vision import VISION_MAX_IMAGES
+from app.utils.drawing_cache import (
+    DRAWING_MODEL, DRAWING_SIZE, DRAWING_QUALITY, clamp_variants,
+    drawing_cache_key, load_cached_drawings, store_drawings,
+)
 from app.utils.logging import log_activity, rpa_info, rpa_error
+from app.utils.file_serving import serve_file, serve_object_storage
+from app.utils.object_storage import get_object_storage
+from app.utils.gallery import (
+    gallery_page, get_gallery_facets, get_gallery_total, invalidate_gallery_facets,
+    has_drawing, drawing_version, drawing_thumbnail_path,
+)
+from app.utils.drawing_queue import (
+    enqueue_drawing_job, get_latest_drawing_job, drawing_job_payload,
+    get_queue_stats, ensure_drawing_dispatcher,
+    enqueue_drawing_batch, get_drawing_batch_progress, cancel_drawing_batch,
+)
 
 drawings_bp = Blueprint('drawings', __name__)
 
 
-def generate_drawing_background(spec_id, file_path, app):
+def generate_drawing_background(spec_id, file_path, app, variants=1, job_id=None, force_new=False):
+    """Gera `variants` candidatos de desenho técnico numa única chamada e
+    retorna a URL do primeiro, que passa a ser o desenho da ficha.
+
+    Com force_new o cache de desenhos não é consultado (a geração nova
+    substitui a entrada).
+
+    Executada pelos workers da fila de desenhos (app.utils.drawing_queue);
+    falhas são propagadas como exceção e registradas no DrawingJob, sem
+    tocar em `processing_status` (que pertence ao pipeline de ingestão).
+    """
     from sqlalchemy.orm import sessionmaker
     Session = sessionmaker(bind=db.engine)
     thread_session = Session()
@@ -28,123 +49,101 @@ def generate_drawing_background(spec_id, file_path, app):
     try:
         spec = thread_session.query(Specification).get(spec_id)
         if not spec:
-            print(f"Specification {spec_id} not found")
-            thread_session.close()
-            return
-        
-        spec.processing_status = 'processing'
-        thread_session.commit()
+            raise ValueError(f"Specification {spec_id} not found")
         
         openai_client = get_openai_client()
         if not openai_client:
-            print("OpenAI client not initialized")
-            spec.processing_status = 'error'
-            thread_session.commit()
-            thread_session.close()
-            return
+            raise RuntimeError("OpenAI client not initialized")
         
+        # Uma única passada pelo arquivo: a imagem base (maior) e as imagens
+        # para a visão saem das mesmas imagens renderizadas (em cache por arquivo).
         base_image_bytes = None
+        vision_images = []
 
         if is_image_file(spec.pdf_filename):
             print(f"📸 Arquivo de imagem detectado para edição: {spec.pdf_filename}")
             with open(file_path, "rb") as f:
                 base_image_bytes = f.read()
+            image_data_url = convert_image_to_data_url(file_path)
+            if image_data_url:
+                vision_images = [image_data_url]
 
         elif is_pdf_file(spec.pdf_filename):
             print(f"📄 Arquivo PDF detectado para edição: {spec.pdf_filename}")
-            pdf_images_data = extract_images_from_pdf(file_path)
+            pdf_images_data = get_pdf_images(file_path, limit=VISION_MAX_IMAGES)
             if pdf_images_data:
-                largest_img = max(pdf_images_data, key=lambda x: x.get('area', 0))
+                largest_img = pdf_images_data[0]
                 print(f"✓ Usando imagem da página {largest_img['page']} como base para edição")
-                base_image_bytes = base64.b64decode(largest_img['base64'])
+                base_image_bytes = largest_img['png_bytes']
+                vision_images = [img['base64'] for img in pdf_images_data]
             else:
                 print("⚠️ Nenhuma imagem encontrada no PDF para servir de base")
         else:
             print(f"Formato de arquivo não suportado: {spec.pdf_filename}")
 
-        if not base_image_bytes:
+        visual_desc = analyze_images_with_gpt4_vision(vision_images) if vision_images else None
+        prompt = build_technical_drawing_prompt(spec, visual_desc)
+
+        static_folder = current_app.static_folder
+        cache_key = drawing_cache_key(base_image_bytes, prompt)
+        drawing_urls = None if force_new else load_cached_drawings(static_folder, cache_key, variants)
+        from_cache = drawing_urls is not None
+
+        if from_cache:
+            print(f"♻️ Desenho técnico em cache ({cache_key[:12]}…): {len(drawing_urls)} candidato(s) sem chamar a API")
+        elif not base_image_bytes:
             print("⚠️ Sem imagem base — voltando para geração pura (sem edição).")
-            
-            images = []
-            if is_image_file(spec.pdf_filename):
-                image_data_url = convert_image_to_data_url(file_path)
-                if image_data_url:
-                    images = [image_data_url]
-            elif is_pdf_file(spec.pdf_filename):
-                pdf_images_data = extract_images_from_pdf(file_path)
-                images = [img['base64'] for img in pdf_images_data] if pdf_images_data else []
-
-            visual_desc = analyze_images_with_gpt4_vision(images) if images else None
-            prompt = build_technical_drawing_prompt(spec, visual_desc)
 
             response = openai_client.images.generate(
-                model="gpt-image-1",
+                model=DRAWING_MODEL,
                 prompt=prompt,
-                size="1024x1024",
-                quality="high",
-                n=1
+                size=DRAWING_SIZE,
+                quality=DRAWING_QUALITY,
+                n=variants
             )
         else:
-            images_b64 = []
-            if is_image_file(spec.pdf_filename):
-                img_data_url = convert_image_to_data_url(file_path)
-                if img_data_url:
-                    images_b64 = [img_data_url]
-            elif is_pdf_file(spec.pdf_filename):
-                pdf_images_data = extract_images_from_pdf(file_path)
-                images_b64 = [img['base64'] for img in pdf_images_data] if pdf_images_data else []
-
-            visual_desc = analyze_images_with_gpt4_vision(images_b64) if images_b64 else None
-            prompt = build_technical_drawing_prompt(spec, visual_desc)
-
             base_image_file = io.BytesIO(base_image_bytes)
             base_image_file.name = "base.png"
 
-            print("🧠 Chamando gpt-image-1 em modo EDIÇÃO (images.edit) com imagem base...")
+            print(f"🧠 Chamando gpt-image-1 em modo EDIÇÃO (images.edit) com imagem base ({variants} candidato(s))...")
             response = openai_client.images.edit(
-                model="gpt-image-1",
+                model=DRAWING_MODEL,
                 image=base_image_file,
                 prompt=prompt,
-                size="1024x1024",
-                quality="high",
-                n=1
+                size=DRAWING_SIZE,
+                quality=DRAWING_QUALITY,
+                n=variants
             )
 
-        b64_json = response.data[0].b64_json
-        if b64_json:
-            image_data = base64.b64decode(b64_json)
-        else:
-            raise ValueError("No b64_json in response")
-        drawing_filename = f"drawing_{spec.id}_{uuid.uuid4().hex[:8]}.png"
-        
-        drawings_dir = os.path.join(current_app.static_folder, 'drawings')
-        os.makedirs(drawings_dir, exist_ok=True)
-        static_drawing_path = os.path.join(drawings_dir, drawing_filename)
-        
-        with open(static_drawing_path, 'wb') as f:
-            f.write(image_data)
-        
-        spec.technical_drawing_url = f"/static/drawings/{drawing_filename}"
-        print(f"✅ Desenho técnico salvo em: {spec.technical_drawing_url}")
+        if not from_cache:
+            images_data = [base64.b64decode(item.b64_json) for item in response.data if item.b64_json]
+            if not images_data:
+                raise ValueError("No b64_json in response")
+            drawing_urls = store_drawings(static_folder, cache_key, images_data, requested=variants)
+
+        for index, url in enumerate(drawing_urls):
+            thread_session.add(DrawingCandidate(
+                job_id=job_id,
+                specification_id=spec.id,
+                variant_index=index,
+                image_url=url,
+                cache_key=cache_key,
+                from_cache=from_cache,
+            ))
+
+        spec.technical_drawing_url = drawing_urls[0]
+        print(f"✅ Desenho técnico salvo em: {spec.technical_drawing_url} ({len(drawing_urls)} candidato(s))")
 
-        spec.processing_status = 'completed'
         thread_session.commit()
-        thread_session.close()
+        invalidate_gallery_facets()
         print(f"✅ Desenho técnico gerado com sucesso para spec {spec_id} (agora image-to-image)")
+        return spec.technical_drawing_url
 
-    except Exception as e:
-        print(f"❌ Error generating technical drawing for spec {spec_id}: {e}")
-        import traceback
-        traceback.print_exc()
-        try:
-            spec_obj = thread_session.query(Specification).get(spec_id)
-            if spec_obj:
-                spec_obj.processing_status = 'error'
-                thread_session.commit()
-        except Exception as update_error:
-            print(f"Error updating specification status: {update_error}")
-        finally:
-            thread_session.close()
+    except Exception:
+        thread_session.rollback()
+        raise
+    finally:
+        thread_session.close()
 
 
 @drawings_bp.route('/specification/<int:id>/generate_drawing', methods=['POST'])
@@ -175,48 +174,34 @@ def generate(id):
                 'error': 'Arquivo não encontrado'
             }), 404
 
-        spec.processing_status = 'processing'
-        db.session.commit()
-
         spec_id = spec.id
-        
-        log_activity('GENERATE_DRAWING', 'specification', spec_id,
-                    target_name=spec.description or spec.ref_souq)
-        rpa_info(f"DESENHO_TECNICO: Iniciando geração para spec ID {spec_id} por '{user.username}'")
 
         from flask import current_app as flask_app
         app = flask_app._get_current_object()  # type: ignore
 
-        def process_in_background():
-            with app.app_context():
-                try:
-                    generate_drawing_background(spec_id, file_path, app)
-                    rpa_info(f"DESENHO_TECNICO: Geração concluída para spec ID {spec_id}")
-                except Exception as e:
-                    print(f"❌ Error in background drawing generation thread: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    rpa_error(f"DESENHO_TECNICO_ERRO: Falha ao gerar desenho para spec ID {spec_id}", exc=e, regiao="geracao_desenho")
-                    try:
-                        from sqlalchemy.orm import sessionmaker
-                        Session = sessionmaker(bind=db.engine)
-                        error_session = Session()
-                        error_spec = error_session.query(Specification).get(spec_id)
-                        if error_spec:
-                            error_spec.processing_status = 'error'
-                            error_session.commit()
-                        error_session.close()
-                    except:
-                        pass
-
-        thread = threading.Thread(target=process_in_background)
-        thread.daemon = True
-        thread.start()
+        variants = clamp_variants(request.values.get('variants'))
+        force_new = request.values.get('force') == '1'
+        job, coalesced = enqueue_drawing_job(spec_id, user.id, app, variants=variants, force_new=force_new)
+        payload = drawing_job_payload(job)
+
+        if coalesced:
+            rpa_info(f"DESENHO_TECNICO: Pedido agrupado no job {job.id} (spec ID {spec_id}) por '{user.username}'")
+            message = 'Este desenho técnico já está sendo gerado.'
+        else:
+            log_activity('GENERATE_DRAWING', 'specification', spec_id,
+                        target_name=spec.description or spec.ref_souq)
+            rpa_info(f"DESENHO_TECNICO: Job {job.id} enfileirado para spec ID {spec_id} por '{user.username}'")
+            message = 'Geração de desenho técnico iniciada! Processamento em segundo plano.'
+
+        if payload['queue_position'] > 1:
+            message += f" Posição na fila: {payload['queue_position']}."
 
         return jsonify({
             'success': True,
-            'message': 'Geração de desenho técnico iniciada! Processamento em segundo plano.',
-            'spec_id': spec_id
+            'message': message,
+            'spec_id': spec_id,
+            'coalesced': coalesced,
+            'job': payload,
         })
 
     except Exception as e:
@@ -230,6 +215,63 @@ def generate(id):
         }), 500
 
 
+@drawings_bp.route('/specification/<int:id>/drawing_status', methods=['GET'])
+@login_required
+def drawing_status(id):
+    spec = Specification.query.get_or_404(id)
+    user = User.query.get(session['user_id'])
+    if not user:
+        session.clear()
+        return jsonify({'success': False, 'error': 'Sessão inválida'}), 401
+
+    if not user.is_admin and spec.user_id != user.id:
+        return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+
+    job = get_latest_drawing_job(spec.id)
+    if job and job.is_active:
+        from flask import current_app as flask_app
+        ensure_drawing_dispatcher(flask_app._get_current_object())  # type: ignore
+
+    return jsonify({
+        'success': True,
+        'spec_id': spec.id,
+        'has_drawing': bool(spec.technical_drawing_url),
+        'job': drawing_job_payload(job, selected_url=spec.technical_drawing_url),
+        'queue': get_queue_stats(),
+    })
+
+
+@drawings_bp.route('/specification/<int:id>/drawing_candidates/<int:candidate_id>/select', methods=['POST'])
+@login_required
+def select_drawing_candidate(id, candidate_id):
+    spec = Specification.query.get_or_404(id)
+    user = User.query.get(session['user_id'])
+    if not user:
+        session.clear()
+        return jsonify({'success': False, 'error': 'Sessão inválida'}), 401
+
+    if not user.is_admin and spec.user_id != user.id:
+        return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+
+    candidate = DrawingCandidate.query.filter_by(id=candidate_id, specification_id=spec.id).first()
+    if not candidate:
+        return jsonify({'success': False, 'error': 'Candidato não encontrado'}), 404
+
+    spec.technical_drawing_url = candidate.image_url
+    db.session.commit()
+
+    log_activity('SELECT_DRAWING', 'specification', spec.id,
+                target_name=spec.description or spec.ref_souq,
+                metadata={'candidate_id': candidate.id, 'variant_index': candidate.variant_index})
+    rpa_info(f"DESENHO_TECNICO: Candidato {candidate.variant_index + 1} escolhido para spec ID {spec.id} por '{user.username}'")
+
+    return jsonify({
+        'success': True,
+        'spec_id': spec.id,
+        'technical_drawing_url': spec.technical_drawing_url,
+    })
+
+
 @drawings_bp.route('/specification/<int:id>/download_drawing', methods=['GET'])
 @login_required
 def download(id):
@@ -254,36 +296,34 @@ def download(id):
         download_filename = f"desenho_tecnico_{ref_name}.png"
 
         if spec.technical_drawing_url.startswith('/static/'):
-            local_path = spec.technical_drawing_url.lstrip('/')
+            local_path = os.path.join(current_app.static_folder, spec.technical_drawing_url[len('/static/'):])
             if os.path.exists(local_path):
                 log_activity('DOWNLOAD_DRAWING', 'specification', spec.id, target_name=spec.description or spec.ref_souq)
                 rpa_info(f"DOWNLOAD_DRAWING: Desenho técnico baixado (ID: {spec.id})")
-                return send_file(local_path,
-                               mimetype='image/png',
-                               as_attachment=True,
-                               download_name=download_filename)
+                return serve_file(local_path,
+                                  mimetype='image/png',
+                                  as_attachment=True,
+                                  download_name=download_filename)
 
         if spec.technical_drawing_url.startswith('http://') or spec.technical_drawing_url.startswith('https://'):
             return redirect(spec.technical_drawing_url)
         
-        if Client:
-            try:
-                storage_client = Client()
-                if storage_client.exists(spec.technical_drawing_url):
-                    image_data = storage_client.download_as_bytes(spec.technical_drawing_url)
-                    return send_file(io.BytesIO(image_data),
-                                   mimetype='image/png',
-                                   as_attachment=True,
-                                   download_name=download_filename)
-            except Exception as storage_error:
-                print(f"Object Storage lookup failed: {storage_error}")
+        try:
+            response = serve_object_storage(spec.technical_drawing_url,
+                                            mimetype='image/png',
+                                            as_attachment=True,
+                                            download_name=download_filename)
+            if response:
+                return response
+        except Exception as storage_error:
+            print(f"Object Storage lookup failed: {storage_error}")
 
         drawing_path = os.path.join(current_app.config['UPLOAD_FOLDER'], spec.technical_drawing_url)
         if os.path.exists(drawing_path):
-            return send_file(drawing_path, 
-                           mimetype='image/png',
-                           as_attachment=True,
-                           download_name=download_filename)
+            return serve_file(drawing_path,
+                              mimetype='image/png',
+                              as_attachment=True,
+                              download_name=download_filename)
         else:
             flash('Arquivo de desenho não encontrado.')
             return redirect(url_for('specifications.view', id=id))
@@ -322,14 +362,12 @@ def view_drawing(id):
     if drawing_url.startswith('http://') or drawing_url.startswith('https://'):
         return redirect(drawing_url)
 
-    if Client:
-        try:
-            storage_client = Client()
-            if storage_client.exists(drawing_url):
-                image_data = storage_client.download_as_bytes(drawing_url)
-                return send_file(io.BytesIO(image_data), mimetype='image/png', as_attachment=False)
-        except Exception as storage_error:
-            print(f"Object Storage lookup failed: {storage_error}")
+    try:
+        response = serve_object_storage(drawing_url, mimetype='image/png', as_attachment=False)
+        if response:
+            return response
+    except Exception as storage_error:
+        print(f"Object Storage lookup failed: {storage_error}")
 
     drawing_path = os.path.join(current_app.config['UPLOAD_FOLDER'], drawing_url)
     if os.path.exists(drawing_path):
@@ -340,12 +378,149 @@ def view_drawing(id):
             'png': 'image/png'
         }
         mimetype = mimetype_map.get(ext, 'image/png')
-        return send_file(drawing_path, mimetype=mimetype, as_attachment=False)
+        return serve_file(drawing_path, mimetype=mimetype, as_attachment=False)
 
     flash('Arquivo de desenho nÇœo encontrado.')
     return redirect(url_for('specifications.view', id=id))
 
 
+@drawings_bp.route('/technical-drawings/bulk', methods=['POST'])
+@login_required
+def bulk_generate():
+    """Gera desenhos para todas as fichas sem desenho de uma coleção ou lote de upload."""
+    user = User.query.get(session['user_id'])
+    if not user:
+        session.clear()
+        return jsonify({'success': False, 'error': 'Sessão inválida'}), 401
+
+    if not get_openai_client():
+        return jsonify({'success': False, 'error': 'OpenAI não configurado'}), 500
+
+    scope = request.values.get('scope', 'collection')
+    # Em massa o padrão é 1 candidato por ficha (custo); o usuário pode pedir mais
+    variants = clamp_variants(request.values.get('variants', 1))
+    query = Specification.query
+    collection_id = None
+    upload_batch_id = None
+
+    if scope == 'collection':
+        collection_id = request.values.get('collection_id', type=int)
+        collection = Collection.query.get(collection_id) if collection_id else None
+        if not collection:
+            return jsonify({'success': False, 'error': 'Coleção não encontrada'}), 404
+        if not user.is_admin and collection.user_id != user.id:
+            return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+        query = query.filter(Specification.collection_id == collection.id)
+        label = collection.name
+    elif scope == 'batch':
+        upload_batch_id = (request.values.get('batch_id') or '').strip()
+        if not upload_batch_id:
+            return jsonify({'success': False, 'error': 'Lote não informado'}), 400
+        query = query.filter(Specification.batch_id == upload_batch_id)
+        label = f'Lote {upload_batch_id}'
+    else:
+        return jsonify({'success': False, 'error': 'Escopo inválido'}), 400
+
+    if not user.is_admin:
+        query = query.filter(Specification.user_id == user.id)
+
+    try:
+        app = current_app._get_current_object()
+        batch = enqueue_drawing_batch(query, user.id, app, scope, variants=variants,
+                                      collection_id=collection_id, upload_batch_id=upload_batch_id,
+                                      label=label)
+    except Exception as e:
+        print(f"Error in bulk_generate: {e}")
+        import traceback
+        traceback.print_exc()
+        rpa_error("DESENHO_TECNICO_ERRO: Erro ao iniciar geração em massa", exc=e, regiao="geracao_desenho")
+        return jsonify({'success': False, 'error': 'Erro ao iniciar geração em massa'}), 500
+
+    log_activity('BULK_GENERATE_DRAWINGS', scope, collection_id, target_name=label,
+                 metadata={'drawing_batch_id': batch.id, 'queued': batch.queued_count,
+                           'skipped_existing': batch.skipped_existing, 'variants': variants})
+    rpa_info(f"DESENHO_TECNICO: Geração em massa {batch.id} ({label}) com {batch.queued_count} ficha(s) por '{user.username}'")
+
+    message = f'{batch.queued_count} desenho(s) na fila.'
+    skipped = batch.skipped_existing + batch.skipped_active + batch.skipped_missing
+    if skipped:
+        message += f' {skipped} ficha(s) ignorada(s).'
+    return jsonify({'success': True, 'message': message, 'batch': get_drawing_batch_progress(batch)})
+
+
+def _get_drawing_batch_for_user(batch_id):
+    batch = DrawingBatch.query.get_or_404(batch_id)
+    user = User.query.get(session['user_id'])
+    if not user or (not user.is_admin and batch.user_id != user.id):
+        return None
+    return batch
+
+
+@drawings_bp.route('/technical-drawings/bulk/<int:batch_id>', methods=['GET'])
+@login_required
+def bulk_status(batch_id):
+    batch = _get_drawing_batch_for_user(batch_id)
+    if not batch:
+        return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+    return jsonify({'success': True, 'batch': get_drawing_batch_progress(batch), 'queue': get_queue_stats()})
+
+
+@drawings_bp.route('/technical-drawings/bulk/<int:batch_id>/cancel', methods=['POST'])
+@login_required
+def bulk_cancel(batch_id):
+    batch = _get_drawing_batch_for_user(batch_id)
+    if not batch:
+        return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+    cancelled = cancel_drawing_batch(batch)
+    log_activity('CANCEL_BULK_DRAWINGS', batch.scope, batch.collection_id, target_name=batch.label,
+                 metadata={'drawing_batch_id': batch.id, 'cancelled': cancelled})
+    return jsonify({'success': True, 'message': f'{cancelled} job(s) cancelado(s).',
+                    'batch': get_drawing_batch_progress(batch)})
+
+
+@drawings_bp.route('/specification/<int:id>/drawing_thumbnail', methods=['GET'])
+@login_required
+def drawing_thumbnail(id):
+    """Miniatura leve do desenho para os cards da galeria."""
+    spec = Specification.query.options(
+        load_only(Specification.id, Specification.user_id, Specification.technical_drawing_url)
+    ).get_or_404(id)
+    user = User.query.get(session['user_id'])
+    if not user or (not user.is_admin and spec.user_id != user.id):
+        return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+
+    drawing_url = spec.technical_drawing_url
+    if not drawing_url:
+        return jsonify({'success': False, 'error': 'Sem desenho técnico'}), 404
+    if drawing_url.startswith('http://') or drawing_url.startswith('https://'):
+        return redirect(drawing_url)
+
+    source_path = None
+    if drawing_url.startswith('/static/'):
+        source_path = os.path.join(current_app.static_folder, drawing_url[len('/static/'):])
+    else:
+        storage = get_object_storage()
+        try:
+            source_path = storage.fetch(drawing_url) if storage else None
+        except Exception as storage_error:
+            print(f"Object Storage lookup failed: {storage_error}")
+        if not source_path:
+            source_path = os.path.join(current_app.config['UPLOAD_FOLDER'], drawing_url)
+
+    if not source_path or not os.path.exists(source_path):
+        return jsonify({'success': False, 'error': 'Arquivo de desenho não encontrado'}), 404
+
+    try:
+        thumb_path = drawing_thumbnail_path(source_path, current_app.static_folder)
+    except Exception as e:
+        print(f"Erro ao gerar miniatura do desenho {id}: {e}")
+        return redirect(url_for('drawings.view_drawing', id=id))
+
+    # Com ?v= (hash da URL do desenho) a resposta pode ser cacheada para sempre
+    versioned = request.args.get('v') == drawing_version(drawing_url)
+    return serve_file(thumb_path, mimetype='image/webp', max_age=300, immutable=versioned)
+
+
 @drawings_bp.route('/technical-drawings')
 @login_required
 def gallery():
@@ -355,15 +530,12 @@ def gallery():
         flash('Sessão inválida. Por favor, faça login novamente.')
         return redirect(url_for('auth.login'))
 
-    page = request.args.get('page', 1, type=int)
-    per_page = 12
-
     if user.is_admin:
-        query = Specification.query.filter(Specification.technical_drawing_url.isnot(None))
+        query = Specification.query.filter(has_drawing())
     else:
         query = Specification.query.filter(
             Specification.user_id == user.id,
-            Specification.technical_drawing_url.isnot(None))
+            has_drawing())
 
     search = request.args.get('search', '').strip()
     if search:
@@ -376,34 +548,37 @@ def gallery():
     if collection_filter:
         query = query.filter(Specification.collection_id == collection_filter)
 
+    # Os valores vêm da lista de facetas, então a comparação é exata
     supplier_filter = request.args.get('supplier', '').strip()
     if supplier_filter:
-        query = query.filter(Specification.supplier.ilike(f'%{supplier_filter}%'))
+        query = query.filter(Specification.supplier == supplier_filter)
 
-    if user.is_admin:
-        all_collections = Collection.query.order_by(Collection.name).all()
-    else:
-        all_collections = Collection.query.filter_by(user_id=user.id).order_by(Collection.name).all()
+    all_collections, all_suppliers = get_gallery_facets(user)
 
-    if user.is_admin:
-        suppliers_query = db.session.query(Specification.supplier).filter(
-            Specification.supplier.isnot(None), Specification.supplier != '',
-            Specification.technical_drawing_url.isnot(None)).distinct().order_by(Specification.supplier)
-    else:
-        suppliers_query = db.session.query(Specification.supplier).filter(
-            Specification.user_id == user.id,
-            Specification.supplier.isnot(None), Specification.supplier != '',
-            Specification.technical_drawing_url.isnot(None)).distinct().order_by(Specification.supplier)
+    total = get_gallery_total(user, query, (search, collection_filter, supplier_filter))
+    page = gallery_page(query, after=request.args.get('after'), before=request.args.get('before'))
+    specifications = page['items']
 
-    all_suppliers = [s[0] for s in suppliers_query.all()]
+    page_ids = [s.id for s in specifications]
+    active_drawing_ids = set()
+    if page_ids:
+        active_drawing_ids = {row[0] for row in db.session.query(DrawingJob.specification_id).filter(
+            DrawingJob.specification_id.in_(page_ids),
+            DrawingJob.status.in_(DrawingJob.ACTIVE_STATUSES)).all()}
 
-    pagination = query.order_by(Specification.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
+    thumbnail_urls = {
+        s.id: url_for('drawings.drawing_thumbnail', id=s.id, v=drawing_version(s.technical_drawing_url))
+        for s in specifications
+    }
 
     return render_template('technical_drawings.html',
                            current_user=user,
-                           specifications=pagination.items,
-                           pagination=pagination,
+                           specifications=specifications,
+                           active_drawing_ids=active_drawing_ids,
+                           thumbnail_urls=thumbnail_urls,
+                           total=total,
+                           next_cursor=page['next_cursor'],
+                           prev_cursor=page['prev_cursor'],
                            collections=all_collections,
                            suppliers=all_suppliers,
                            search=search,
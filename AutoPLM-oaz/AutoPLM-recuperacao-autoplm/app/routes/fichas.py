@@ -51,7 +51,7 @@ def editar_item(ficha_id, item_id):
         return redirect(url_for('dashboard.index'))
 
     item = FichaTecnicaItem.query.get_or_404(item_id)
-    if item.ficha_id != ficha.id:
+    if item.ficha_id != ficha.id or item.deleted_at:
         flash('Item nao pertence a esta ficha.')
         return redirect(url_for('fichas.tabela', ficha_id=ficha.id))
 
@@ -33,7 +33,7 @@ def _get_ficha_and_item(ficha_id, item_id):
         return None, None, (jsonify({'error': 'Acesso negado.'}), 403)
 
     item = FichaTecnicaItem.query.get(item_id)
-    if not item:
+    if not item or item.deleted_at:
         return None, None, (jsonify({'error': f'Item {item_id} não encontrado.'}), 404)
 
     if item.ficha_id != ficha.id:
@@ -238,8 +238,8 @@ def send_batch():
     for item_id in item_ids:
         item = FichaTecnicaItem.query.get(item_id)
 
-        # Item not found or doesn't belong to this ficha
-        if not item or item.ficha_id != ficha.id:
+        # Item not found, removed by a re-import or doesn't belong to this ficha
+        if not item or item.deleted_at or item.ficha_id != ficha.id:
             results.append({
                 'item_id': item_id,
                 'ok': False,
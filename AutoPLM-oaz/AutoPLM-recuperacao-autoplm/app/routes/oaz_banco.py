@@ -7,29 +7,36 @@ workflow to populate oaz_value_map with WSIDs from Fluxogama database exports.
 Flow:
   1. GET  /admin/bancos               → render import page
   2. POST /api/admin/bancos/preview   → auto-detect field_key per file, parse, return stats + token
-  3. POST /api/admin/bancos/confirm   → upsert cached data into DB (per-file field_key)
+  3. POST /api/admin/bancos/confirm   → queue an ImportJob that upserts the cached data (per-file field_key)
   4. GET  /api/admin/bancos/status/<id>→ poll background job progress
 """
-import threading
+import json
 import uuid
 import unicodedata
 import re
+from contextlib import ExitStack
 from datetime import datetime, timedelta
-from flask import Blueprint, render_template, request, jsonify, session
+from flask import (
+    Blueprint, Response, render_template, request, jsonify, session, current_app, stream_with_context,
+)
+from sqlalchemy import func, literal_column, select
 from app.extensions import csrf, db
 from app.utils.auth import admin_required
 from app.utils.banco_parser import parse_banco_xlsx
+from app.utils.uploads import ingest_to_tempfile, UploadRejected
+from app.utils.parse_pool import iter_parallel
+from app.utils.import_store import get_import_store, PayloadTooLarge
 from app.models.oaz_value_map import OazValueMap
+from app.models.import_job import ImportJob
+from app.utils.import_jobs import (
+    enqueue_import_job, register_import_handler, prune_import_store,
+)
 
 oaz_banco_bp = Blueprint('oaz_banco', __name__)
 
-# ── Thread-safe stores ───────────────────────────────────────────────
-_lock = threading.Lock()
-_PREVIEW_CACHE = {}          # {token: {files, admin_id, created_at}}
-_IMPORT_JOBS = {}            # {job_id: {status, files, ...}}
+# ── Shared preview store (import_store: visible to every gunicorn worker) ──
+_PREVIEW_KIND = 'banco_previews'   # {token: {files, admin_id, created_at}}
 _PREVIEW_TTL = timedelta(minutes=30)
-_JOB_TTL = timedelta(hours=1)
-_MAX_CONCURRENT_JOBS = 3
 
 # ── Field key options (used for overrides + stats display) ───────────
 FIELD_KEY_OPTIONS = [
@@ -137,139 +144,173 @@ def detect_field_key(filename, sheet_name=''):
     return None, None
 
 
-def _prune_previews():
-    """Remove expired preview tokens. Must be called under lock."""
-    now = datetime.utcnow()
-    expired = [t for t, p in _PREVIEW_CACHE.items()
-               if (now - p['created_at']) > _PREVIEW_TTL]
-    for t in expired:
-        del _PREVIEW_CACHE[t]
+def _upsert_statement(dialect_name):
+    """INSERT ... ON CONFLICT (field_key, text_norm) DO UPDATE, executed with a list of rows.
 
-
-def _prune_old_jobs():
-    """Remove jobs older than TTL. Must be called under lock."""
-    now = datetime.utcnow()
-    expired = [jid for jid, j in _IMPORT_JOBS.items()
-               if j.get('ended_at') and (now - j['ended_at']) > _JOB_TTL]
-    for jid in expired:
-        del _IMPORT_JOBS[jid]
+    SQLAlchemy sends the list as multi-row VALUES pages (insertmanyvalues),
+    so a batch is a few round trips, not one per row.
+    """
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    stmt = dialect_insert(OazValueMap.__table__).values(created_at=func.now(), updated_at=func.now())
+    return stmt.on_conflict_do_update(
+        index_elements=['field_key', 'text_norm'],
+        set_={
+            'text_value': stmt.excluded.text_value,
+            'wsid_value': stmt.excluded.wsid_value,
+            'source_name': stmt.excluded.source_name,
+            'updated_at': func.now(),
+        },
+    )
 
 
-def _batch_upsert(field_key, items, source_name=None, batch_size=500):
+def _batch_upsert(field_key, items, source_name=None, batch_size=2000, commit=True):
     """
     Batch upsert items into oaz_value_map.
     Returns (created, updated, errors).
-    """
-    from sqlalchemy import text as sa_text
 
+    commit=False leaves the batches in the caller's transaction (each one
+    inside a SAVEPOINT, so a failed batch is still skipped on its own); the
+    import job uses it to commit the rows together with its checkpoint.
+
+    One INSERT ... ON CONFLICT per batch (multi-row VALUES pages). On
+    PostgreSQL the statement returns (xmax = 0) per row, which is true only
+    for rows that were inserted, so created/updated come back with the
+    upsert itself.
+    Other dialects (sqlite in dev) look up the batch's existing keys first.
+    Repeated text_norm values inside a batch keep the last row (same result
+    as upserting them one by one) and count as updates.
+    """
     created = 0
     updated = 0
     errors = []
-
-    # Preload existing text_norm values
-    existing = set()
-    try:
-        rows = db.session.execute(
-            sa_text("SELECT text_norm FROM oaz_value_map WHERE field_key = :fk"),
-            {'fk': field_key}
-        ).fetchall()
-        existing = {r[0] for r in rows}
-    except Exception:
-        pass
+    dialect_name = db.session.get_bind().dialect.name
+    table = OazValueMap.__table__
+    stmt = _upsert_statement(dialect_name)
 
     for i in range(0, len(items), batch_size):
         batch = items[i:i + batch_size]
-        try:
-            for item in batch:
-                text_value = item['descricao']
-                text_norm = _normalize_text(text_value)
-                wsid_value = item['wsid']
-
-                if not text_norm or not wsid_value:
-                    continue
-
-                is_new = text_norm not in existing
-
-                stmt = sa_text("""
-                    INSERT INTO oaz_value_map
-                        (field_key, text_value, text_norm, wsid_value, source_name, created_at, updated_at)
-                    VALUES
-                        (:field_key, :text_value, :text_norm, :wsid_value, :source_name, NOW(), NOW())
-                    ON CONFLICT (field_key, text_norm)
-                    DO UPDATE SET
-                        text_value = EXCLUDED.text_value,
-                        wsid_value = EXCLUDED.wsid_value,
-                        source_name = EXCLUDED.source_name,
-                        updated_at = NOW()
-                """)
-                db.session.execute(stmt, {
-                    'field_key': field_key,
-                    'text_value': text_value,
-                    'text_norm': text_norm,
-                    'wsid_value': wsid_value,
-                    'source_name': source_name,
-                })
-
-                if is_new:
-                    created += 1
-                    existing.add(text_norm)
-                else:
-                    updated += 1
+        rows = {}
+        repeated = 0
+        for item in batch:
+            text_norm = _normalize_text(item['descricao'])
+            wsid_value = item['wsid']
+            if not text_norm or not wsid_value:
+                continue
+            if text_norm in rows:
+                repeated += 1
+            rows[text_norm] = {
+                'field_key': field_key,
+                'text_value': item['descricao'],
+                'text_norm': text_norm,
+                'wsid_value': wsid_value,
+                'source_name': source_name,
+            }
+        if not rows:
+            continue
 
-            db.session.commit()
+        savepoint = None if commit else db.session.begin_nested()
+        try:
+            params = list(rows.values())
+            if dialect_name == 'postgresql':
+                inserted = db.session.execute(
+                    stmt.returning(literal_column('(xmax = 0)')), params
+                ).scalars().all()
+                batch_created = sum(1 for flag in inserted if flag)
+            else:
+                existing = db.session.execute(
+                    select(func.count()).select_from(table).where(
+                        table.c.field_key == field_key,
+                        table.c.text_norm.in_(list(rows)),
+                    )
+                ).scalar()
+                db.session.execute(stmt, params)
+                batch_created = len(rows) - existing
+            if savepoint is None:
+                db.session.commit()
+            else:
+                savepoint.commit()
+            created += batch_created
+            updated += len(rows) - batch_created + repeated
         except Exception as e:
-            db.session.rollback()
+            if savepoint is None:
+                db.session.rollback()
+            else:
+                savepoint.rollback()
             errors.append(f'Batch {i // batch_size + 1}: {str(e)[:200]}')
 
     return created, updated, errors
 
 
-def _process_confirm_job(app, job_id, files_data):
-    """Background thread: upsert items from confirmed preview (per-file field_key)."""
-    with app.app_context():
-        with _lock:
-            job = _IMPORT_JOBS.get(job_id)
-            if not job:
-                return
-            job['status'] = 'processing'
-            job['started_at'] = datetime.utcnow()
-
-        total_created = 0
-        total_updated = 0
-
-        for idx, fd in enumerate(files_data):
-            filename = fd['filename']
-            field_key = fd['field_key']
-            file_items = fd['items']
-
-            with _lock:
-                job['current_file_index'] = idx
-                job['current_filename'] = filename
-
-            if not file_items:
-                with _lock:
-                    job['files'][idx]['status'] = 'empty'
-                    job['files'][idx]['error'] = 'Nenhum item válido.'
-                continue
+def _banco_file_states(files_data):
+    return [{
+        'filename': fd['filename'],
+        'field_key': fd['field_key'],
+        'field_key_label': _FIELD_KEY_LABELS.get(fd['field_key'], '?'),
+        'sheet_name': fd.get('sheet_name', ''),
+        'total_rows': fd.get('total_rows', 0),
+        'valid_items': len(fd.get('items', [])),
+        'created': 0,
+        'updated': 0,
+        'status': 'queued',
+        'error': None,
+    } for fd in files_data]
 
-            created, updated, errors = _batch_upsert(
-                field_key, file_items, source_name=filename
-            )
-            total_created += created
-            total_updated += updated
 
-            with _lock:
-                job['files'][idx]['created'] = created
-                job['files'][idx]['updated'] = updated
-                job['files'][idx]['status'] = 'done' if not errors else 'partial'
+def _run_banco_import(payload, ctx):
+    """
+    ImportJob 'banco': upsert each file's items in chunks (per-file field_key).
+    Checkpoint: file_index + offset; per-file counters live in the job result.
+    Each chunk's upsert is committed by ctx.save() together with the checkpoint
+    and counters, so a resumed job neither skips nor double-counts a chunk.
+    """
+    files_data = payload['files']
+    state = ctx.result or {
+        'files': _banco_file_states(files_data),
+        'total_created': 0,
+        'total_updated': 0,
+    }
+    file_index = ctx.checkpoint.get('file_index', 0)
+    offset = ctx.checkpoint.get('offset', 0)
+    processed = ctx.processed_rows
+
+    while file_index < len(files_data):
+        fd = files_data[file_index]
+        fs = state['files'][file_index]
+        file_items = fd['items']
+
+        if not file_items:
+            fs['status'] = 'empty'
+            fs['error'] = 'Nenhum item válido.'
+        else:
+            fs['status'] = 'processing'
+            while offset < len(file_items):
+                chunk = file_items[offset:offset + ctx.chunk_size]
+                created, updated, errors = _batch_upsert(
+                    fd['field_key'], chunk, source_name=fd['filename'], commit=False
+                )
+                fs['created'] += created
+                fs['updated'] += updated
+                state['total_created'] += created
+                state['total_updated'] += updated
                 if errors:
-                    job['files'][idx]['error'] = '; '.join(errors)
+                    fs['error'] = '; '.join(filter(None, [fs['error']] + errors))[:1000]
+                offset += len(chunk)
+                processed += len(chunk)
+                ctx.save(processed, result=state, file_index=file_index, offset=offset)
+            fs['status'] = 'partial' if fs['error'] else 'done'
 
-        with _lock:
-            job['status'] = 'done'
-            job['ended_at'] = datetime.utcnow()
-            job['total_created'] = total_created
-            job['total_updated'] = total_updated
+        file_index += 1
+        offset = 0
+        ctx.save(processed, result=state, file_index=file_index, offset=0)
+
+    return state
+
+
+register_import_handler('banco', _run_banco_import)
 
 
 # ── Routes ───────────────────────────────────────────────────────────
@@ -289,6 +330,148 @@ def import_view():
                            mapping_counts=counts_map)
 
 
+def _failed_parse(error):
+    """Resultado no formato do parse_banco_xlsx para um arquivo que não terminou."""
+    return {
+        'success': False,
+        'items': [],
+        'total_rows': 0,
+        'skipped_inactive': 0,
+        'skipped_invalid': 0,
+        'error': f'Erro ao ler XLSX: {error}',
+        'sheet_name': '',
+    }
+
+
+def _banco_file_result(filename, result, override_key):
+    """Per-file preview entry: parse result + field_key (override > auto-detect)."""
+    detected_key, detect_source = detect_field_key(
+        filename, result.get('sheet_name', '')
+    )
+
+    # Use override if valid, else detected
+    if override_key and override_key in _VALID_FIELD_KEYS:
+        final_key = override_key
+        detect_source = 'override'
+    elif detected_key:
+        final_key = detected_key
+    else:
+        final_key = None
+
+    fi = {
+        'filename': filename,
+        'sheet_name': result.get('sheet_name', ''),
+        'total_rows': result.get('total_rows', 0),
+        'skipped_inactive': result.get('skipped_inactive', 0),
+        'skipped_invalid': result.get('skipped_invalid', 0),
+        'valid_items': len(result.get('items', [])),
+        'detected_columns': result.get('detected_columns', {}),
+        'field_key': final_key,
+        'field_key_label': _FIELD_KEY_LABELS.get(final_key, '?') if final_key else None,
+        'detect_source': detect_source,
+        'error': result.get('error'),
+        'parsed': result['success'],
+        'items': result.get('items', []) if result['success'] else [],
+        'invalid_examples': result.get('invalid_examples', []) if result['success'] else [],
+    }
+
+    if not final_key and result['success']:
+        fi['error'] = 'Tipo de banco não identificado. Use o seletor manual.'
+    return fi
+
+
+def _file_response(fr):
+    """Per-file entry for the browser (no items / raw examples)."""
+    resp = {k: v for k, v in fr.items() if k not in ('items', 'invalid_examples')}
+    resp['valid_items'] = len(fr['items']) if fr['items'] else fr.get('valid_items', 0)
+    return resp
+
+
+def _preview_summary(files_result, admin_id):
+    """
+    Totals + examples (in upload order) and the cached preview token.
+    Raises PayloadTooLarge if the parsed files don't fit in the store.
+    """
+    total_valid = 0
+    total_invalid = 0
+    total_rows = 0
+    examples_valid = []
+    examples_invalid = []
+
+    for fr in files_result:
+        total_rows += fr['total_rows']
+        if not (fr['parsed'] and fr['field_key']):
+            continue
+        total_valid += len(fr['items'])
+        total_invalid += fr['skipped_invalid']
+
+        # Collect valid examples (up to 10 total)
+        for item in fr['items'][:max(0, 10 - len(examples_valid))]:
+            examples_valid.append({
+                'descricao': item['descricao'],
+                'wsid': item['wsid'],
+                'text_norm': _normalize_text(item['descricao']),
+                'field_key': fr['field_key'],
+                'source': fr['filename'],
+            })
+
+        # Collect invalid examples with reasons (up to 10 total)
+        for inv in fr['invalid_examples']:
+            if len(examples_invalid) < 10:
+                examples_invalid.append({
+                    'descricao': inv.get('descricao', ''),
+                    'wsid': inv.get('wsid', ''),
+                    'reason': inv.get('reason', 'Desconhecido'),
+                    'source': fr['filename'],
+                })
+
+    # Count how many files have valid items + detected field_key
+    importable = [fr for fr in files_result if fr['field_key'] and fr['items']]
+
+    # Generate token bound to current admin
+    token = str(uuid.uuid4())[:12]
+    prune_import_store()
+    store = get_import_store()
+    store.put(_PREVIEW_KIND, {
+        'files': [{
+            'filename': fr['filename'],
+            'field_key': fr['field_key'],
+            'items': fr['items'],
+            'sheet_name': fr['sheet_name'],
+            'total_rows': fr['total_rows'],
+            'valid_items': fr['valid_items'],
+        } for fr in importable],
+        'admin_id': admin_id,
+        'created_at': datetime.utcnow(),
+    }, _PREVIEW_TTL, token=token)
+
+    return {
+        'success': True,
+        'token': token,
+        'total_rows': total_rows,
+        'total_valid': total_valid,
+        'total_invalid': total_invalid,
+        'total_importable': len(importable),
+        'files': [_file_response(fr) for fr in files_result],
+        'examples_valid': examples_valid[:10],
+        'examples_invalid': examples_invalid[:10],
+    }
+
+
+def _iter_banco_parses(uploads, stack):
+    """
+    Parse the ingested files in parallel (parse_pool); yields (index, file entry)
+    as each file finishes. Closes `stack` (temp files) at the end.
+    """
+    try:
+        paths = [upload.path for upload, _ in uploads]
+        for index, result, error in iter_parallel(parse_banco_xlsx, paths):
+            upload, override_key = uploads[index]
+            yield index, _banco_file_result(upload.original_filename, result or _failed_parse(error), override_key)
+    finally:
+        stack.close()
+
+
 @oaz_banco_bp.route('/api/admin/bancos/preview', methods=['POST'])
 @admin_required
 @csrf.exempt
@@ -297,9 +480,16 @@ def preview():
     Parse uploaded XLSX files without saving. Auto-detects field_key per file.
     Accepts optional per-file overrides via form data.
 
+    Files are parsed concurrently (one process each, with a timeout and a
+    memory cap), so latency follows the slowest file, not the sum.
+
     Form data:
         files[]: one or more XLSX files
         override_<filename>: optional field_key override for a specific file
+
+    With ?stream=1 (or Accept: application/x-ndjson) the response is NDJSON:
+    one {"type": "file", "index", "file"} line per file as it finishes, then
+    {"type": "done", ...} with the same body as the JSON response.
     """
     files = request.files.getlist('files[]')
     if not files:
@@ -307,134 +497,55 @@ def preview():
     if not files:
         return jsonify(success=False, error='Nenhum arquivo enviado.'), 400
 
-    files_result = []
-    total_valid = 0
-    total_invalid = 0
-    total_rows = 0
-    examples_valid = []
-    examples_invalid = []
-
-    for f in files:
-        if not f.filename:
-            continue
-        if not f.filename.lower().endswith('.xlsx'):
-            return jsonify(success=False,
-                           error=f'Arquivo "{f.filename}" não é .xlsx'), 400
-        file_bytes = f.read()
-        if len(file_bytes) > 50 * 1024 * 1024:
-            return jsonify(success=False,
-                           error=f'Arquivo "{f.filename}" excede 50MB.'), 400
-
-        result = parse_banco_xlsx(file_bytes)
-
-        # Check for override first
-        override_key = request.form.get(f'override_{f.filename}', '').strip()
-
-        # Auto-detect field_key
-        detected_key, detect_source = detect_field_key(
-            f.filename, result.get('sheet_name', '')
-        )
-
-        # Use override if valid, else detected
-        if override_key and override_key in _VALID_FIELD_KEYS:
-            final_key = override_key
-            detect_source = 'override'
-        elif detected_key:
-            final_key = detected_key
-        else:
-            final_key = None
-
-        fi = {
-            'filename': f.filename,
-            'sheet_name': result.get('sheet_name', ''),
-            'total_rows': result.get('total_rows', 0),
-            'skipped_inactive': result.get('skipped_inactive', 0),
-            'skipped_invalid': result.get('skipped_invalid', 0),
-            'valid_items': len(result.get('items', [])),
-            'detected_columns': result.get('detected_columns', {}),
-            'field_key': final_key,
-            'field_key_label': _FIELD_KEY_LABELS.get(final_key, '?') if final_key else None,
-            'detect_source': detect_source,
-            'error': result.get('error'),
-            'items': result.get('items', []) if result['success'] else [],
-        }
-
-        if not final_key and result['success']:
-            fi['error'] = 'Tipo de banco não identificado. Use o seletor manual.'
-
-        if result['success'] and final_key:
-            valid_items = result['items']
-            invalid_count = result.get('skipped_invalid', 0)
-            total_valid += len(valid_items)
-            total_invalid += invalid_count
-            total_rows += result.get('total_rows', 0)
-
-            # Collect valid examples (up to 10 total)
-            for item in valid_items[:max(0, 10 - len(examples_valid))]:
-                examples_valid.append({
-                    'descricao': item['descricao'],
-                    'wsid': item['wsid'],
-                    'text_norm': _normalize_text(item['descricao']),
-                    'field_key': final_key,
-                    'source': f.filename,
-                })
-
-            # Collect invalid examples with reasons (up to 10 total)
-            for inv in result.get('invalid_examples', []):
-                if len(examples_invalid) < 10:
-                    examples_invalid.append({
-                        'descricao': inv.get('descricao', ''),
-                        'wsid': inv.get('wsid', ''),
-                        'reason': inv.get('reason', 'Desconhecido'),
-                        'source': f.filename,
-                    })
-        else:
-            total_rows += result.get('total_rows', 0)
-
-        files_result.append(fi)
-
-    if not files_result:
+    stack = ExitStack()
+    uploads = []
+    try:
+        for f in files:
+            if not f.filename:
+                continue
+            if not f.filename.lower().endswith('.xlsx'):
+                stack.close()
+                return jsonify(success=False,
+                               error=f'Arquivo "{f.filename}" não é .xlsx'), 400
+            upload = stack.enter_context(ingest_to_tempfile(f, max_bytes=50 * 1024 * 1024))
+            uploads.append((upload, request.form.get(f'override_{f.filename}', '').strip()))
+    except UploadRejected as exc:
+        stack.close()
+        return jsonify(success=False, error=str(exc)), 400
+
+    if not uploads:
+        stack.close()
         return jsonify(success=False, error='Nenhum arquivo válido.'), 400
 
-    # Count how many files have valid items + detected field_key
-    importable = [fr for fr in files_result if fr['field_key'] and fr['items']]
-
-    # Generate token bound to current admin
     admin_id = session.get('user_id')
-    token = str(uuid.uuid4())[:12]
-    with _lock:
-        _prune_previews()
-        _PREVIEW_CACHE[token] = {
-            'files': [{
-                'filename': fr['filename'],
-                'field_key': fr['field_key'],
-                'items': fr['items'],
-                'sheet_name': fr['sheet_name'],
-                'total_rows': fr['total_rows'],
-                'valid_items': fr['valid_items'],
-            } for fr in importable],
-            'admin_id': admin_id,
-            'created_at': datetime.utcnow(),
-        }
-
-    # Strip items from response (don't send all rows to browser)
-    files_response = []
-    for fr in files_result:
-        resp = {k: v for k, v in fr.items() if k != 'items'}
-        resp['valid_items'] = len(fr['items']) if fr['items'] else fr.get('valid_items', 0)
-        files_response.append(resp)
+    parses = _iter_banco_parses(uploads, stack)
 
-    return jsonify(
-        success=True,
-        token=token,
-        total_rows=total_rows,
-        total_valid=total_valid,
-        total_invalid=total_invalid,
-        total_importable=len(importable),
-        files=files_response,
-        examples_valid=examples_valid[:10],
-        examples_invalid=examples_invalid[:10],
-    )
+    stream = request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    if not stream:
+        files_result = [None] * len(uploads)
+        for index, fi in parses:
+            files_result[index] = fi
+        try:
+            return jsonify(_preview_summary(files_result, admin_id))
+        except PayloadTooLarge as exc:
+            return jsonify(success=False, error=str(exc)), 413
+
+    def generate():
+        files_result = [None] * len(uploads)
+        try:
+            for index, fi in parses:
+                files_result[index] = fi
+                yield json.dumps({'type': 'file', 'index': index, 'file': _file_response(fi)}) + '\n'
+            try:
+                summary = _preview_summary(files_result, admin_id)
+            except PayloadTooLarge as exc:
+                summary = {'success': False, 'error': str(exc)}
+            yield json.dumps({'type': 'done', **summary}) + '\n'
+        finally:
+            parses.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
 
 
 @oaz_banco_bp.route('/api/admin/bancos/confirm', methods=['POST'])
@@ -457,8 +568,7 @@ def confirm():
 
     admin_id = session.get('user_id')
 
-    with _lock:
-        cached = _PREVIEW_CACHE.pop(token, None)
+    cached = get_import_store().pop(_PREVIEW_KIND, token)
 
     if not cached:
         return jsonify(success=False,
@@ -484,81 +594,55 @@ def confirm():
     if not files_data:
         return jsonify(success=False, error='Nenhum item válido para importar.'), 400
 
-    # Check concurrent job limit
-    with _lock:
-        _prune_old_jobs()
-        active = sum(1 for j in _IMPORT_JOBS.values() if j['status'] == 'processing')
-        if active >= _MAX_CONCURRENT_JOBS:
-            return jsonify(success=False,
-                           error=f'Limite de {_MAX_CONCURRENT_JOBS} jobs atingido.'), 429
-
-    # Create job
-    job_id = str(uuid.uuid4())[:8]
-    job = {
-        'job_id': job_id,
-        'status': 'queued',
-        'total_files': len(files_data),
-        'current_file_index': 0,
-        'current_filename': '',
-        'files': [{
-            'filename': fd['filename'],
-            'field_key': fd['field_key'],
-            'field_key_label': _FIELD_KEY_LABELS.get(fd['field_key'], '?'),
-            'sheet_name': fd.get('sheet_name', ''),
-            'total_rows': fd.get('total_rows', 0),
-            'valid_items': len(fd.get('items', [])),
-            'created': 0,
-            'updated': 0,
-            'status': 'queued',
-            'error': None,
-        } for fd in files_data],
-        'total_created': 0,
-        'total_updated': 0,
-        'created_at': datetime.utcnow(),
-        'started_at': None,
-        'ended_at': None,
-    }
-
-    with _lock:
-        _IMPORT_JOBS[job_id] = job
-
-    # Start background thread
-    from flask import current_app
-    app = current_app._get_current_object()
-    t = threading.Thread(
-        target=_process_confirm_job,
-        args=(app, job_id, files_data),
-        daemon=True,
-    )
-    t.start()
+    # Queue the import (processed by the import job dispatcher)
+    total_items = sum(len(fd['items']) for fd in files_data)
+    try:
+        job = enqueue_import_job(
+            'banco', {'files': files_data}, admin_id, current_app._get_current_object(),
+            total_rows=total_items,
+            source_filename=', '.join(fd['filename'] for fd in files_data),
+        )
+    except PayloadTooLarge as exc:
+        return jsonify(success=False, error=str(exc)), 413
 
-    return jsonify(success=True, job_id=job_id, total_files=len(files_data))
+    return jsonify(success=True, job_id=job.id, total_files=len(files_data))
 
 
-@oaz_banco_bp.route('/api/admin/bancos/status/<job_id>')
+@oaz_banco_bp.route('/api/admin/bancos/status/<int:job_id>')
 @admin_required
 def import_status(job_id):
     """Poll the status of a confirm/import job."""
-    with _lock:
-        job = _IMPORT_JOBS.get(job_id)
+    job = db.session.get(ImportJob, job_id)
 
-    if not job:
+    if not job or job.kind != 'banco':
         return jsonify(success=False, error='Job não encontrado.'), 404
 
+    state = job.get_result()
+    checkpoint = job.get_checkpoint()
+    files = state.get('files', [])
+    current_index = min(checkpoint.get('file_index', 0), max(len(files) - 1, 0))
+
     def _dt(d):
         return d.isoformat() + 'Z' if d else None
 
+    progress = job.to_dict()
     return jsonify(
         success=True,
-        job_id=job['job_id'],
-        status=job['status'],
-        total_files=job['total_files'],
-        current_file_index=job.get('current_file_index', 0),
-        current_filename=job.get('current_filename', ''),
-        files=job['files'],
-        total_created=job.get('total_created', 0),
-        total_updated=job.get('total_updated', 0),
-        created_at=_dt(job.get('created_at')),
-        started_at=_dt(job.get('started_at')),
-        ended_at=_dt(job.get('ended_at')),
+        job_id=job.id,
+        status=job.status,
+        total_files=len(files),
+        current_file_index=current_index,
+        current_filename=files[current_index]['filename'] if files else '',
+        files=files,
+        total_created=state.get('total_created', 0),
+        total_updated=state.get('total_updated', 0),
+        total_rows=progress['total_rows'],
+        processed_rows=progress['processed_rows'],
+        percent=progress['percent'],
+        rows_per_second=progress['rows_per_second'],
+        eta_seconds=progress['eta_seconds'],
+        error=job.error,
+        created_at=_dt(job.created_at),
+        started_at=_dt(job.started_at),
+        ended_at=_dt(job.finished_at),
     )
@@ -3,7 +3,7 @@ import threading
 import re
 import json
 from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, flash, session, request, jsonify, send_file, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, session, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 from app.extensions import db, csrf, get_openai_client
 from app.models import User, Specification, Collection, Supplier
@@ -14,6 +14,11 @@ from app.utils.pdf import extract_text_from_pdf, extract_text_from_image, genera
 from app.utils.ai import analyze_images_with_gpt4_vision, process_specification_with_openai
 from app.utils.helpers import convert_value_to_string, get_or_create_supplier
 from app.utils.logging import log_activity, rpa_info, rpa_error
+from app.utils.drawing_queue import get_latest_candidates
+from app.utils.file_serving import serve_file
+from app.utils.uploads import ingest_upload, UploadRejected
+from app.utils.drawing_cache import DRAWING_VARIANTS, DRAWING_MAX_VARIANTS
+from app.utils.gallery import invalidate_gallery_facets
 
 specifications_bp = Blueprint('specifications', __name__)
 
@@ -336,8 +341,8 @@ def upload():
             if len(files) == 1:
                 file = files[0]
                 filename = secure_filename(file.filename)
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
+                upload = ingest_upload(file, current_app.config['UPLOAD_FOLDER'], filename)
+                file_path = upload.path
 
                 spec = Specification()
                 spec.user_id = session['user_id']
@@ -368,7 +373,8 @@ def upload():
                 
                 log_activity('UPLOAD_FILE', 'specification', spec_id, 
                             target_name=spec.description or filename,
-                            metadata={'filename': filename, 'collection_id': spec.collection_id, 'supplier_id': spec.supplier_id})
+                            metadata={'filename': filename, 'collection_id': spec.collection_id, 'supplier_id': spec.supplier_id,
+                                      'sha256': upload.sha256, 'size_bytes': upload.size})
                 rpa_info(f"UPLOAD: Arquivo '{filename}' enviado pelo usuário '{user.username}'")
 
                 app = current_app._get_current_object()
@@ -423,11 +429,15 @@ def upload():
                     supplier_name = selected_supplier.name if selected_supplier else None
                 
                 spec_ids = []
+                rejected = []
                 for file in files:
                     if file.filename:
                         filename = secure_filename(file.filename)
-                        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                        file.save(file_path)
+                        try:
+                            ingest_upload(file, current_app.config['UPLOAD_FOLDER'], filename)
+                        except UploadRejected as rejection:
+                            rejected.append(str(rejection))
+                            continue
                         
                         spec = Specification()
                         spec.user_id = session['user_id']
@@ -451,10 +461,14 @@ def upload():
                         spec_ids.append(spec.id)
                 
                 db.session.commit()
+
+                if not spec_ids:
+                    raise UploadRejected(' '.join(rejected) or 'Nenhum arquivo válido.')
                 
                 log_activity('BATCH_UPLOAD', 'specification', None,
                             target_name=f'Lote {batch_id}',
-                            metadata={'batch_id': batch_id, 'file_count': len(spec_ids), 'collection_id': collection_id})
+                            metadata={'batch_id': batch_id, 'file_count': len(spec_ids), 'collection_id': collection_id,
+                                      'rejected': rejected})
                 rpa_info(f"BATCH_UPLOAD: {len(spec_ids)} arquivos enviados pelo usuário '{user.username}' (lote {batch_id})")
                 
                 app = current_app._get_current_object()
@@ -476,12 +490,21 @@ def upload():
                         'message': f'{len(spec_ids)} arquivos enviados! Processamento iniciado.',
                         'batch_id': batch_id,
                         'count': len(spec_ids),
-                        'specs': specs_data
+                        'specs': specs_data,
+                        'rejected': rejected
                     })
                 
+                for rejection in rejected:
+                    flash(rejection)
                 flash(f'{len(spec_ids)} arquivos enviados! Processamento iniciado em segundo plano.')
                 return redirect(url_for('dashboard.index'))
 
+        except UploadRejected as e:
+            db.session.rollback()
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({'success': False, 'message': str(e)}), e.status_code
+            flash(str(e))
+            return render_template('upload_pdf.html', form=form, current_user=user, subetapas=subetapas)
         except Exception as e:
             db.session.rollback()
             print(f"Error in upload_pdf: {e}")
@@ -522,7 +545,12 @@ def view(id):
     if not isinstance(extra_fields, dict):
         extra_fields = {}
 
-    return render_template('view_specification.html', specification=spec, extra_fields=extra_fields)
+    drawing_candidates = get_latest_candidates(spec.id)
+
+    return render_template('view_specification.html', specification=spec, extra_fields=extra_fields,
+                           drawing_candidates=drawing_candidates,
+                           drawing_variants_default=DRAWING_VARIANTS,
+                           drawing_variants_max=DRAWING_MAX_VARIANTS)
 
 
 @specifications_bp.route('/specification/<int:id>/edit', methods=['GET', 'POST'])
@@ -610,6 +638,7 @@ def delete(id):
         spec_name = spec.description or spec.ref_souq
         db.session.delete(spec)
         db.session.commit()
+        invalidate_gallery_facets()
         log_activity('DELETE_SPECIFICATION', 'specification', id, target_name=spec_name)
         rpa_info(f"DELETE_SPEC: Especificação '{spec_name}' (ID: {id}) excluída")
 
@@ -669,6 +698,7 @@ def delete_all():
             db.session.delete(spec)
 
         db.session.commit()
+        invalidate_gallery_facets()
         log_activity('DELETE_ALL_SPECIFICATIONS', 'specification', None,
                     target_name=f'{total} fichas excluídas',
                     metadata={'total': total, 'user': user.username})
@@ -709,7 +739,7 @@ def download_pdf(id):
         if os.path.exists(file_path):
             log_activity('DOWNLOAD_FILE', 'specification', spec.id, target_name=spec.pdf_filename)
             rpa_info(f"DOWNLOAD_FILE: Arquivo '{spec.pdf_filename}' baixado (ID: {spec.id})")
-            return send_file(file_path, as_attachment=True, download_name=spec.pdf_filename)
+            return serve_file(file_path, as_attachment=True, download_name=spec.pdf_filename)
         else:
             flash('Arquivo PDF não encontrado.')
             return redirect(url_for('specifications.view', id=id))
@@ -735,7 +765,7 @@ def view_pdf(id):
     try:
         file_path = os.path.abspath(os.path.join(current_app.config['UPLOAD_FOLDER'], spec.pdf_filename))
         if os.path.exists(file_path):
-            return send_file(
+            return serve_file(
                 file_path,
                 mimetype='application/pdf',
                 as_attachment=False,
@@ -772,7 +802,7 @@ def view_image(id):
                 'png': 'image/png'
             }
             mimetype = mimetype_map.get(ext, 'image/jpeg')
-            return send_file(
+            return serve_file(
                 file_path,
                 mimetype=mimetype,
                 as_attachment=False,
@@ -860,8 +890,7 @@ def upload_batch_files():
             base_name = filename.rsplit('.', 1)[0] if '.' in filename else filename
             unique_filename = f"{base_name}_{uuid.uuid4().hex[:6]}.{ext}"
             
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
+            upload = ingest_upload(file, current_app.config['UPLOAD_FOLDER'], unique_filename)
             
             spec = Specification()
             spec.user_id = user.id
@@ -892,8 +921,11 @@ def upload_batch_files():
             
             log_activity('BATCH_UPLOAD', 'specification', spec.id,
                         target_name=unique_filename,
-                        metadata={'batch_id': batch_id, 'original_filename': file.filename})
+                        metadata={'batch_id': batch_id, 'original_filename': file.filename,
+                                  'sha256': upload.sha256, 'size_bytes': upload.size})
             
+        except UploadRejected as e:
+            errors.append(str(e))
         except Exception as e:
             errors.append(f"{file.filename}: {str(e)}")
             db.session.rollback()
@@ -10,6 +10,7 @@ from app.utils.logging import log_activity, rpa_info, rpa_warn, rpa_error, init_
 from app.utils.pdf import (
     extract_text_from_pdf, 
     extract_images_from_pdf, 
+    get_pdf_images,
     generate_pdf_thumbnail,
     generate_image_thumbnail
 )
@@ -36,6 +37,7 @@ __all__ = [
     'init_rpa_monitor',
     'extract_text_from_pdf',
     'extract_images_from_pdf',
+    'get_pdf_images',
     'generate_pdf_thumbnail',
     'generate_image_thumbnail',
     'analyze_images_with_gpt4_vision',
@@ -1,7 +1,9 @@
+import os
 import json
 import re
 import unicodedata
 from app.extensions import get_openai_client
+from app.utils.vision import prepare_images_for_vision, vision_image_hash, VISION_MAX_IMAGES
 
 def _normalize_text(value):
     if value is None:
@@ -272,11 +274,78 @@ def _trim_value_at_labels(value, labels):
 
 
 
-def analyze_images_with_gpt4_vision(images_base64):
+# Incrementar quando o prompt/esquema da análise visual mudar (invalida o cache)
+VISION_PROMPT_VERSION = "v1"
+VISION_MODEL = "gpt-4o"
+
+
+def _vision_cache_version(preprocess):
+    return VISION_PROMPT_VERSION if preprocess else f"{VISION_PROMPT_VERSION}-raw"
+
+
+def _load_cached_vision_analysis(image_hash, prompt_version):
+    from datetime import datetime
+    from sqlalchemy.orm import sessionmaker
+    from app.extensions import db
+    from app.models import VisionAnalysis
+
+    Session = sessionmaker(bind=db.engine)
+    cache_session = Session()
+    try:
+        cached = cache_session.query(VisionAnalysis).filter_by(
+            image_hash=image_hash, prompt_version=prompt_version).first()
+        if not cached:
+            return None
+        analysis = json.loads(cached.analysis_json)
+        cached.hit_count = (cached.hit_count or 0) + 1
+        cached.last_used_at = datetime.utcnow()
+        cache_session.commit()
+        return analysis
+    except Exception as e:
+        print(f"⚠️ Erro ao ler cache de análise visual: {e}")
+        cache_session.rollback()
+        return None
+    finally:
+        cache_session.close()
+
+
+def _store_vision_analysis(image_hash, prompt_version, analysis):
+    from sqlalchemy.orm import sessionmaker
+    from app.extensions import db
+    from app.models import VisionAnalysis
+
+    Session = sessionmaker(bind=db.engine)
+    cache_session = Session()
+    try:
+        cache_session.add(VisionAnalysis(
+            image_hash=image_hash,
+            prompt_version=prompt_version,
+            model=VISION_MODEL,
+            analysis_json=json.dumps(analysis, ensure_ascii=False),
+        ))
+        cache_session.commit()
+    except Exception as e:
+        # Outra thread pode ter gravado a mesma chave (uq_vision_analysis_key)
+        print(f"⚠️ Cache de análise visual não gravado: {e}")
+        cache_session.rollback()
+    finally:
+        cache_session.close()
+
+
+def analyze_images_with_gpt4_vision(images_base64, preprocess=True, use_cache=True):
     if not images_base64:
         print("No images provided for GPT-4 Vision analysis")
         return None
 
+    image_hash = None
+    prompt_version = _vision_cache_version(preprocess)
+    if use_cache:
+        image_hash = vision_image_hash(images_base64, limit=VISION_MAX_IMAGES)
+        cached = _load_cached_vision_analysis(image_hash, prompt_version)
+        if cached is not None:
+            print(f"✓ Análise visual reaproveitada do cache ({image_hash[:12]}, {prompt_version})")
+            return cached
+
     openai_client = get_openai_client()
     if not openai_client:
         print("OpenAI client not initialized")
@@ -399,11 +468,17 @@ SAÍDA: responda SOMENTE um JSON válido com este esquema (preencha tudo que con
 Retorne SOMENTE o JSON, sem texto adicional."""
         }]
 
-        for img_b64 in images_base64[:3]:
-            if isinstance(img_b64, str) and img_b64.startswith("data:"):
-                image_url = img_b64
-            else:
-                image_url = f"data:image/png;base64,{img_b64}"
+        if preprocess:
+            image_urls, _ = prepare_images_for_vision(images_base64, detail="high", limit=VISION_MAX_IMAGES)
+        else:
+            image_urls = []
+            for img_b64 in images_base64[:VISION_MAX_IMAGES]:
+                if isinstance(img_b64, str) and img_b64.startswith("data:"):
+                    image_urls.append(img_b64)
+                else:
+                    image_urls.append(f"data:image/png;base64,{img_b64}")
+
+        for image_url in image_urls:
             content.append({
                 "type": "image_url",
                 "image_url": {
@@ -413,7 +488,7 @@ Retorne SOMENTE o JSON, sem texto adicional."""
             })
 
         response = openai_client.chat.completions.create(
-            model="gpt-4o",
+            model=VISION_MODEL,
             messages=[{"role": "user", "content": content}],
             response_format={"type": "json_object"},
             max_tokens=3000
@@ -435,6 +510,8 @@ Retorne SOMENTE o JSON, sem texto adicional."""
             print(f"Mangas: {analysis_data.get('mangas', {}).get('comprimento', 'N/A')} - {analysis_data.get('mangas', {}).get('modelo', 'N/A')}")
             print(f"Fechamentos: {analysis_data.get('fechamentos', {}).get('tipo', 'N/A')}")
             print(f"{'='*80}\n")
+            if use_cache and isinstance(analysis_data, dict):
+                _store_vision_analysis(image_hash, prompt_version, analysis_data)
             return analysis_data
         except json.JSONDecodeError as e:
             print(f"⚠️ Erro ao parsear JSON - usando fallback para texto bruto")
@@ -659,64 +736,243 @@ NÃO FAZER:
     return prompt
 
 
-def process_specification_with_openai(text_content):
-    openai_client = get_openai_client()
-    if not openai_client:
-        print("OpenAI client not initialized")
-        return None
+# Campos extraídos da ficha (colunas de Specification), na ordem em que o
+# modelo deve emiti-los: identificação primeiro, para o status mostrar cedo.
+SPEC_EXTRACTION_FIELDS = [
+    'ref_souq', 'description', 'collection', 'supplier', 'corner',
+    'main_fabric', 'main_group', 'sub_group',
+    'target_price', 'store_month', 'delivery_cd_month',
+    'tech_sheet_delivery_date', 'pilot_delivery_date', 'showcase_for',
+    'stylists',
+    'composition', 'pattern', 'colors', 'tags_kit',
+    'pilot_size', 'body_length', 'sleeve_length', 'hem_width',
+    'shoulder_to_shoulder', 'bust', 'waist', 'straight_armhole',
+    'neckline_depth', 'openings_details', 'finishes',
+    'technical_drawing', 'reference_photos', 'specific_details',
+]
+
+SPEC_MAIN_GROUPS = ['TECIDO PLANO', 'MALHA', 'TRICOT', 'JEANS']
+SPEC_SUB_GROUPS = [
+    'BLAZER', 'BLUSA', 'BRINCO', 'CALÇA', 'CAMISA', 'CAMISA/CAMISÃO', 'CAMISETA',
+    'CARDIGÃ', 'JAQUETA', 'KAFTAN', 'REGATA', 'SAIA', 'TÚNICA',
+]
+
+SPEC_STRUCTURED_OUTPUT = os.environ.get('OPENAI_STRUCTURED_OUTPUT', '1').strip().lower() not in ('0', 'false', 'no')
+
+
+def _spec_extraction_schema():
+    properties = {}
+    for field in SPEC_EXTRACTION_FIELDS:
+        prop = {"type": ["string", "null"]}
+        if field == 'main_group':
+            prop["enum"] = SPEC_MAIN_GROUPS + [None]
+        elif field == 'sub_group':
+            prop["enum"] = SPEC_SUB_GROUPS + [None]
+        elif field in ('tech_sheet_delivery_date', 'pilot_delivery_date'):
+            prop["description"] = "Data no formato YYYY-MM-DD"
+        properties[field] = prop
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(SPEC_EXTRACTION_FIELDS),
+        "additionalProperties": False,
+    }
+
 
+class _PartialJsonObjectParser:
+    """Parser incremental de um objeto JSON de primeiro nível.
+
+    Recebe o texto em pedaços (streaming) e devolve os pares chave/valor
+    assim que cada valor está completo, sem esperar o fechamento do objeto.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.fields = {}
+        self._decoder = json.JSONDecoder()
+
+    def _skip_ws(self, idx):
+        while idx < len(self.buffer) and self.buffer[idx] in " \t\r\n":
+            idx += 1
+        return idx
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        new_fields = []
+        while not self.finished:
+            i = self._skip_ws(self.pos)
+            if i >= len(self.buffer):
+                break
+            if not self.started:
+                if self.buffer[i] != "{":
+                    break
+                self.started = True
+                self.pos = i + 1
+                continue
+            if self.buffer[i] == ",":
+                self.pos = i + 1
+                continue
+            if self.buffer[i] == "}":
+                self.pos = i + 1
+                self.finished = True
+                break
+            try:
+                key, j = self._decoder.raw_decode(self.buffer, i)
+            except json.JSONDecodeError:
+                break
+            j = self._skip_ws(j)
+            if j >= len(self.buffer) or self.buffer[j] != ":":
+                break
+            k = self._skip_ws(j + 1)
+            if k >= len(self.buffer):
+                break
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, k)
+            except json.JSONDecodeError:
+                break
+            # Número no fim do buffer pode continuar no próximo pedaço
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and end >= len(self.buffer):
+                break
+            self.fields[key] = value
+            new_fields.append((key, value))
+            self.pos = end
+        return new_fields
+
+
+def _stream_structured_extraction(openai_client, messages, on_field=None):
+    """Extração com JSON schema estrito (Structured Outputs) via streaming.
+
+    Cada campo é repassado a `on_field(key, value)` assim que chega. Se o
+    stream for interrompido ou truncado, devolve os campos já recebidos em
+    vez de descartar a chamada inteira.
+    """
+    parser = _PartialJsonObjectParser()
+    finish_reason = None
     try:
-        labeled_fallback = _extract_labeled_fields(text_content)
-        extra_fields = _extract_extra_fields(text_content)
-
-        # --- Extração robusta por label (multi-estratégia) ---
-        norm = _normalize_pdf_text(text_content)
-        ROBUST_LABELS = {
-            "ref_souq": ["REF SOUQ", "REF. SOUQ", "REF SOUQ (SOUQ)"],
-            "target_price": ["TARGET PRICE", "PRECO ALVO", "TARGET PRICE (R$)"],
-            "pilot_delivery_date": ["DATA ENTREGA PILOTO"],
-            "tech_sheet_delivery_date": ["DATA ENTREGA FICHA-TECNICA", "DATA ENTREGA FICHA TECNICA"],
-            "showcase_for": ["MOSTRUARIO PARA", "MOSTRUARIO PARA"],
-            "collection": ["COLECAO", "COLECAO"],
-            "corner": ["CORNER"],
-            "supplier": ["FORNECEDOR"],
-        }
-        robust_fallback = {}
-        for field, lbs in ROBUST_LABELS.items():
-            val = _extract_label_value(norm, lbs)
-            if val:
-                robust_fallback[field] = val
-
-        # Heurística para REF SOUQ quando o rótulo não captura
-        if not robust_fallback.get("ref_souq") and not labeled_fallback.get("ref_souq"):
-            guessed = _guess_ref_souq(norm)
-            if guessed:
-                robust_fallback["ref_souq"] = guessed
-                print(f"  [HEURISTIC] REF SOUQ detectada por padrao: {guessed}")
-
-        # Heurística para TARGET PRICE (R$ no texto)
-        if not robust_fallback.get("target_price"):
-            guessed_price = _guess_target_price(norm)
-            if guessed_price:
-                robust_fallback["target_price"] = guessed_price
-                print(f"  [HEURISTIC] TARGET PRICE detectado: {guessed_price}")
-
-        # Coletar datas brutas encontradas no texto (sem atribuir a campos)
-        raw_dates_found = _guess_dates_from_text(norm)
-        if raw_dates_found:
-            print(f"  [DATES] Datas encontradas no texto (sem atribuicao): {raw_dates_found}")
-
-        # Normalizar datas BR para YYYY-MM-DD (quando extraídas por label)
-        for date_field in ("pilot_delivery_date", "tech_sheet_delivery_date"):
-            raw_date = robust_fallback.get(date_field)
-            if raw_date and re.search(r'\d{2}/\d{2}/\d{2,4}', raw_date):
-                parsed = _parse_br_date(raw_date)
-                if parsed:
-                    robust_fallback[date_field] = parsed
-
-        print(f"\n[FALLBACK] Fallback robusto (regex multi-estrategia): {robust_fallback}")
-
-        prompt = f"""Você é um especialista em análise de fichas técnicas de vestuário da marca SOUQ. Extraia TODAS as informações disponíveis do texto abaixo e retorne em formato JSON estruturado.
+        stream = openai_client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "ficha_tecnica",
+                    "strict": True,
+                    "schema": _spec_extraction_schema(),
+                },
+            },
+            max_tokens=2500,
+            stream=True,
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+            delta = choice.delta.content if choice.delta else None
+            if not delta:
+                continue
+            for key, value in parser.feed(delta):
+                if on_field:
+                    try:
+                        on_field(key, value)
+                    except Exception as cb_error:
+                        print(f"  ⚠️ Erro ao aplicar campo parcial {key}: {cb_error}")
+    except Exception as e:
+        if not parser.fields:
+            raise
+        print(f"  ⚠️ Stream interrompido ({e}); usando {len(parser.fields)} campos recebidos")
+
+    if finish_reason and finish_reason != "stop":
+        print(f"  ⚠️ Resposta estruturada encerrada por '{finish_reason}'; usando {len(parser.fields)} campos recebidos")
+    if not parser.fields:
+        print("  ⚠️ Nenhum campo recebido na resposta estruturada")
+        return None
+    return parser.fields
+
+
+def _request_json_object_extraction(openai_client, messages):
+    """Modo legado: response_format json_object, sem streaming."""
+    response = openai_client.chat.completions.create(
+        model="gpt-4o",
+        messages=messages,
+        response_format={"type": "json_object"},
+        max_tokens=2500
+    )
+    content = response.choices[0].message.content
+    if not content:
+        return None
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError as je:
+        print(f"JSON parsing error: {je}")
+        return None
+
+
+def _prepare_extraction_context(text_content):
+    """Fallbacks por regex/rótulo calculados antes da chamada ao OpenAI."""
+    labeled_fallback = _extract_labeled_fields(text_content)
+    extra_fields = _extract_extra_fields(text_content)
+
+    # --- Extração robusta por label (multi-estratégia) ---
+    norm = _normalize_pdf_text(text_content)
+    ROBUST_LABELS = {
+        "ref_souq": ["REF SOUQ", "REF. SOUQ", "REF SOUQ (SOUQ)"],
+        "target_price": ["TARGET PRICE", "PRECO ALVO", "TARGET PRICE (R$)"],
+        "pilot_delivery_date": ["DATA ENTREGA PILOTO"],
+        "tech_sheet_delivery_date": ["DATA ENTREGA FICHA-TECNICA", "DATA ENTREGA FICHA TECNICA"],
+        "showcase_for": ["MOSTRUARIO PARA", "MOSTRUARIO PARA"],
+        "collection": ["COLECAO", "COLECAO"],
+        "corner": ["CORNER"],
+        "supplier": ["FORNECEDOR"],
+    }
+    robust_fallback = {}
+    for field, lbs in ROBUST_LABELS.items():
+        val = _extract_label_value(norm, lbs)
+        if val:
+            robust_fallback[field] = val
+
+    # Heurística para REF SOUQ quando o rótulo não captura
+    if not robust_fallback.get("ref_souq") and not labeled_fallback.get("ref_souq"):
+        guessed = _guess_ref_souq(norm)
+        if guessed:
+            robust_fallback["ref_souq"] = guessed
+            print(f"  [HEURISTIC] REF SOUQ detectada por padrao: {guessed}")
+
+    # Heurística para TARGET PRICE (R$ no texto)
+    if not robust_fallback.get("target_price"):
+        guessed_price = _guess_target_price(norm)
+        if guessed_price:
+            robust_fallback["target_price"] = guessed_price
+            print(f"  [HEURISTIC] TARGET PRICE detectado: {guessed_price}")
+
+    # Coletar datas brutas encontradas no texto (sem atribuir a campos)
+    raw_dates_found = _guess_dates_from_text(norm)
+    if raw_dates_found:
+        print(f"  [DATES] Datas encontradas no texto (sem atribuicao): {raw_dates_found}")
+
+    # Normalizar datas BR para YYYY-MM-DD (quando extraídas por label)
+    for date_field in ("pilot_delivery_date", "tech_sheet_delivery_date"):
+        raw_date = robust_fallback.get(date_field)
+        if raw_date and re.search(r'\d{2}/\d{2}/\d{2,4}', raw_date):
+            parsed = _parse_br_date(raw_date)
+            if parsed:
+                robust_fallback[date_field] = parsed
+
+    print(f"\n[FALLBACK] Fallback robusto (regex multi-estrategia): {robust_fallback}")
+
+    return {
+        'labeled_fallback': labeled_fallback,
+        'extra_fields': extra_fields,
+        'robust_fallback': robust_fallback,
+        'raw_dates_found': raw_dates_found,
+    }
+
+
+SPEC_EXTRACTION_INSTRUCTIONS = """Você é um especialista em análise de fichas técnicas de vestuário da marca SOUQ. Extraia TODAS as informações disponíveis do texto abaixo e retorne em formato JSON estruturado.
 
 ESTRUTURA TÍPICA DA FICHA TÉCNICA SOUQ:
 - Cabeçalho contém: REF SOUQ, COLEÇÃO, FORNECEDOR, CORNER, DESCRIÇÃO, ESTILISTA
@@ -811,143 +1067,329 @@ CAMPOS OBRIGATÓRIOS A EXTRAIR:
    - reference_photos: Referências de fotos
    - specific_details: Detalhes específicos
 
-**DATAS ENCONTRADAS NO TEXTO (em ordem de aparição):**
-{', '.join(raw_dates_found) if raw_dates_found else 'Nenhuma data encontrada'}
+"""
 
-ATENÇÃO SOBRE DATAS: As datas acima foram encontradas no texto mas NÃO sabemos qual corresponde a qual campo.
+
+SPEC_DATES_GUIDANCE = """ATENÇÃO SOBRE DATAS: As datas acima foram encontradas no texto mas NÃO sabemos qual corresponde a qual campo.
 Você DEVE analisar o contexto do texto (rótulos "DATA ENTREGA FICHA-TÉCNICA", "DATA ENTREGA PILOTO", "MOSTRUÁRIO PARA")
 para determinar CORRETAMENTE qual data pertence a qual campo.
 - A data mais PRÓXIMA ao mês da loja geralmente é a DATA ENTREGA FICHA-TÉCNICA (vem ANTES da piloto)
 - A DATA ENTREGA PILOTO é a entrega da amostra/peça piloto
 - MOSTRUÁRIO PARA é a última data (mostruário)
-Retorne as datas no formato YYYY-MM-DD.
+Retorne as datas no formato YYYY-MM-DD."""
+
+
+def _spec_dates_line(raw_dates_found):
+    return ', '.join(raw_dates_found) if raw_dates_found else 'Nenhuma data encontrada'
+
+
+def _spec_document_section(text_content, raw_dates_found):
+    return f"""**DATAS ENCONTRADAS NO TEXTO (em ordem de aparição):**
+{_spec_dates_line(raw_dates_found)}
+
+{SPEC_DATES_GUIDANCE}
 
 **TEXTO DA FICHA TÉCNICA:**
 {text_content}
 
 Retorne um objeto JSON com TODOS os campos acima, usando null para informações não disponíveis."""
 
+
+def _finalize_extracted_fields(parsed_json, ctx):
+    """Achata o JSON do modelo e aplica os fallbacks de regex e a normalização de datas."""
+    labeled_fallback = ctx['labeled_fallback']
+    robust_fallback = ctx['robust_fallback']
+    extra_fields = ctx['extra_fields']
+
+    flattened = {}
+    for key, value in parsed_json.items():
+        if isinstance(value, dict):
+            flattened.update(value)
+        else:
+            flattened[key] = value
+
+    print(f"\n{'='*80}")
+    print(f"DADOS EXTRAÍDOS PELO OPENAI")
+    print(f"{'='*80}")
+    print(f"Total de campos: {len(flattened)}")
+
+    campos_importantes = [
+        'ref_souq', 'description', 'collection', 'supplier',
+        'corner', 'main_fabric', 'stylists', 'composition',
+        'main_group', 'sub_group', 'pilot_size', 'body_length',
+        'bust', 'sleeve_length'
+    ]
+
+    print("\n📋 CAMPOS PRINCIPAIS:")
+    for key in campos_importantes:
+        value = flattened.get(key)
+        if value is not None and value != "":
+            print(f"  ✓ {key}: {str(value)}")
+        else:
+            print(f"  ✗ {key}: (vazio/não encontrado)")
+
+    print("\n📏 OUTROS CAMPOS:")
+    for key, value in flattened.items():
+        if key not in campos_importantes and value is not None and value != "":
+            print(f"  - {key}: {str(value)[:80]}...")
+
+    print(f"{'='*80}\n")
+    if labeled_fallback:
+        supplier_fallback = labeled_fallback.get('supplier')
+        corner_fallback = labeled_fallback.get('corner')
+
+        if supplier_fallback:
+            flattened['supplier'] = supplier_fallback
+        if corner_fallback:
+            flattened['corner'] = corner_fallback
+
+    # --- Aplicar fallback robusto (regex multi-estratégia) ---
+    # Para campos simples (não-datas), sobrescreve vazios com regex
+    fallback_fields_simple = [
+        'ref_souq', 'target_price', 'showcase_for',
+        'supplier', 'corner', 'collection'
+    ]
+    for fb_key in fallback_fields_simple:
+        if _is_blank(flattened.get(fb_key)) and robust_fallback.get(fb_key):
+            flattened[fb_key] = robust_fallback[fb_key]
+            print(f"  🔄 Fallback regex aplicado: {fb_key} = {robust_fallback[fb_key]}")
+
+    # --- DUPLA VALIDAÇÃO: Datas (OpenAI é autoridade) ---
+    # OpenAI decide qual data é qual. Regex só normaliza o formato.
+    for date_key in ('pilot_delivery_date', 'tech_sheet_delivery_date'):
+        ai_date = flattened.get(date_key)
+        if ai_date and isinstance(ai_date, str):
+            # Normalizar formato: DD/MM/YY → YYYY-MM-DD
+            if not re.match(r'^\d{4}-\d{2}-\d{2}$', ai_date):
+                parsed_ai = _parse_br_date(ai_date)
+                if parsed_ai:
+                    flattened[date_key] = parsed_ai
+                    print(f"  📅 Data OpenAI normalizada: {date_key} = {parsed_ai}")
+        elif _is_blank(ai_date) and robust_fallback.get(date_key):
+            # Só usa regex como fallback se OpenAI não retornou nada
+            flattened[date_key] = robust_fallback[date_key]
+            print(f"  📅 Data fallback regex (OpenAI vazio): {date_key} = {robust_fallback[date_key]}")
+
+    print(f"  📅 RESULTADO DATAS: pilot={flattened.get('pilot_delivery_date')}, ficha={flattened.get('tech_sheet_delivery_date')}")
+
+    if extra_fields:
+        flattened['extra_fields'] = extra_fields
+
+    corner_value = flattened.get('corner')
+    corner_value = _trim_value_at_labels(
+        corner_value,
+        [
+            "MES PLANEJADO",
+            "ENTRADA",
+            "MARCA",
+            "LINHA",
+            "COLECAO",
+            "REFERENCIA",
+            "REF ESTILO",
+            "GRUPO",
+            "SUB GRUPO",
+            "GRADE",
+            "SUB GRADE",
+        ],
+    )
+    if corner_value is None:
+        flattened['corner'] = None
+    else:
+        flattened['corner'] = corner_value
+    return flattened
+
+
+def process_specification_with_openai(text_content, on_field=None, structured=None):
+    openai_client = get_openai_client()
+    if not openai_client:
+        print("OpenAI client not initialized")
+        return None
+
+    try:
+        ctx = _prepare_extraction_context(text_content)
+
+        messages = [{
+            "role": "system",
+            "content": "Você é um especialista em análise de fichas técnicas de vestuário. Extraia TODAS as informações estruturadas encontradas no texto e retorne SOMENTE em formato JSON válido, sem texto adicional. Seja preciso na extração de medidas e valores numéricos."
+        }, {
+            "role": "user",
+            "content": SPEC_EXTRACTION_INSTRUCTIONS + _spec_document_section(text_content, ctx['raw_dates_found'])
+        }]
+
+        if structured is None:
+            structured = SPEC_STRUCTURED_OUTPUT
+        if structured:
+            parsed_json = _stream_structured_extraction(openai_client, messages, on_field=on_field)
+        else:
+            parsed_json = _request_json_object_extraction(openai_client, messages)
+
+        if not parsed_json:
+            return None
+
+        return _finalize_extracted_fields(parsed_json, ctx)
+    except Exception as e:
+        print(f"Error processing with OpenAI: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+# --- Micro-batching de fichas curtas ---------------------------------------
+# Fichas pequenas (OCR de imagem, derivadas de Compras) pagam o prompt de
+# instruções inteiro a cada chamada. Aqui várias delas vão em um único request,
+# cada uma identificada por doc_id, e a resposta é separada por documento.
+
+SPEC_BATCH_MAX_CHARS = int(os.environ.get('SPEC_BATCH_MAX_CHARS', '2500'))
+SPEC_BATCH_MAX_DOCS = int(os.environ.get('SPEC_BATCH_MAX_DOCS', '8'))
+SPEC_BATCH_TOKEN_BUDGET = int(os.environ.get('SPEC_BATCH_TOKEN_BUDGET', '6000'))
+SPEC_BATCH_OUTPUT_TOKENS_PER_DOC = 700
+
+
+def estimate_text_tokens(text):
+    """Estimativa grosseira (~4 caracteres por token) usada para montar os lotes."""
+    return len(text or "") // 4 + 1
+
+
+def plan_spec_batches(docs, max_docs=None, token_budget=None):
+    """Agrupa [(doc_id, texto)] em lotes respeitando o orçamento de tokens.
+
+    Documentos maiores que o orçamento ficam sozinhos em seu lote.
+    """
+    max_docs = max_docs or SPEC_BATCH_MAX_DOCS
+    token_budget = token_budget or SPEC_BATCH_TOKEN_BUDGET
+    batches = []
+    current = []
+    current_tokens = 0
+    for doc_id, text in docs:
+        tokens = estimate_text_tokens(text)
+        if current and (len(current) >= max_docs or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append((doc_id, text))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _spec_batch_schema():
+    document = _spec_extraction_schema()
+    document["properties"] = {"doc_id": {"type": "string"}, **document["properties"]}
+    document["required"] = ["doc_id"] + document["required"]
+    return {
+        "type": "object",
+        "properties": {
+            "documents": {"type": "array", "items": document},
+        },
+        "required": ["documents"],
+        "additionalProperties": False,
+    }
+
+
+def _spec_batch_section(docs_with_ctx):
+    parts = [SPEC_DATES_GUIDANCE, ""]
+    for doc_id, text_content, ctx in docs_with_ctx:
+        parts.append(f"""=== DOCUMENTO doc_id: {doc_id} ===
+**DATAS ENCONTRADAS NO TEXTO (em ordem de aparição):**
+{_spec_dates_line(ctx['raw_dates_found'])}
+
+**TEXTO DA FICHA TÉCNICA:**
+{text_content}
+=== FIM DO DOCUMENTO {doc_id} ===
+""")
+    parts.append(
+        f'Retorne um objeto JSON com a chave "documents": uma entrada para CADA um dos '
+        f'{len(docs_with_ctx)} documentos acima, com "doc_id" exatamente igual ao informado e '
+        'TODOS os campos acima, usando null para informações não disponíveis. '
+        'Cada documento é uma ficha independente: NÃO misture informações entre documentos.'
+    )
+    return "\n".join(parts)
+
+
+def process_specifications_batch_with_openai(docs, structured=None):
+    """Extrai várias fichas curtas em um único request.
+
+    `docs` é uma lista de (doc_id, texto). Retorna {doc_id: campos extraídos}
+    apenas para os documentos presentes na resposta; os ausentes devem seguir
+    pelo caminho individual (process_specification_with_openai).
+    Como no caminho individual, OPENAI_STRUCTURED_OUTPUT=0 troca o JSON schema
+    estrito por json_object.
+    """
+    if not docs:
+        return {}
+    if structured is None:
+        structured = SPEC_STRUCTURED_OUTPUT
+    if len(docs) == 1:
+        doc_id, text_content = docs[0]
+        result = process_specification_with_openai(text_content, structured=structured)
+        return {str(doc_id): result} if result else {}
+
+    openai_client = get_openai_client()
+    if not openai_client:
+        print("OpenAI client not initialized")
+        return {}
+
+    try:
+        docs_with_ctx = [
+            (str(doc_id), text_content, _prepare_extraction_context(text_content))
+            for doc_id, text_content in docs
+        ]
+        contexts = {doc_id: ctx for doc_id, _, ctx in docs_with_ctx}
+
+        print(f"\n[BATCH] Extraindo {len(docs_with_ctx)} fichas em um único request "
+              f"(~{sum(estimate_text_tokens(t) for _, t, _ in docs_with_ctx)} tokens de texto)")
+
+        if structured:
+            response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "fichas_tecnicas",
+                    "strict": True,
+                    "schema": _spec_batch_schema(),
+                },
+            }
+        else:
+            response_format = {"type": "json_object"}
+
         response = openai_client.chat.completions.create(
             model="gpt-4o",
             messages=[{
                 "role": "system",
-                "content": "Você é um especialista em análise de fichas técnicas de vestuário. Extraia TODAS as informações estruturadas encontradas no texto e retorne SOMENTE em formato JSON válido, sem texto adicional. Seja preciso na extração de medidas e valores numéricos."
+                "content": "Você é um especialista em análise de fichas técnicas de vestuário. Extraia TODAS as informações estruturadas de CADA documento separadamente e retorne SOMENTE JSON válido. Seja preciso na extração de medidas e valores numéricos."
             }, {
                 "role": "user",
-                "content": prompt
+                "content": SPEC_EXTRACTION_INSTRUCTIONS + _spec_batch_section(docs_with_ctx)
             }],
-            response_format={"type": "json_object"},
-            max_tokens=2500
+            response_format=response_format,
+            max_tokens=min(16000, 200 + SPEC_BATCH_OUTPUT_TOKENS_PER_DOC * len(docs_with_ctx)),
         )
 
         content = response.choices[0].message.content
-        if content:
-            try:
-                parsed_json = json.loads(content)
-
-                flattened = {}
-                for key, value in parsed_json.items():
-                    if isinstance(value, dict):
-                        flattened.update(value)
-                    else:
-                        flattened[key] = value
-
-                print(f"\n{'='*80}")
-                print(f"DADOS EXTRAÍDOS PELO OPENAI")
-                print(f"{'='*80}")
-                print(f"Total de campos: {len(flattened)}")
-
-                campos_importantes = [
-                    'ref_souq', 'description', 'collection', 'supplier',
-                    'corner', 'main_fabric', 'stylists', 'composition',
-                    'main_group', 'sub_group', 'pilot_size', 'body_length',
-                    'bust', 'sleeve_length'
-                ]
-
-                print("\n📋 CAMPOS PRINCIPAIS:")
-                for key in campos_importantes:
-                    value = flattened.get(key)
-                    if value is not None and value != "":
-                        print(f"  ✓ {key}: {str(value)}")
-                    else:
-                        print(f"  ✗ {key}: (vazio/não encontrado)")
-
-                print("\n📏 OUTROS CAMPOS:")
-                for key, value in flattened.items():
-                    if key not in campos_importantes and value is not None and value != "":
-                        print(f"  - {key}: {str(value)[:80]}...")
-
-                print(f"{'='*80}\n")
-                if labeled_fallback:
-                    supplier_fallback = labeled_fallback.get('supplier')
-                    corner_fallback = labeled_fallback.get('corner')
-
-                    if supplier_fallback:
-                        flattened['supplier'] = supplier_fallback
-                    if corner_fallback:
-                        flattened['corner'] = corner_fallback
-
-                # --- Aplicar fallback robusto (regex multi-estratégia) ---
-                # Para campos simples (não-datas), sobrescreve vazios com regex
-                fallback_fields_simple = [
-                    'ref_souq', 'target_price', 'showcase_for',
-                    'supplier', 'corner', 'collection'
-                ]
-                for fb_key in fallback_fields_simple:
-                    if _is_blank(flattened.get(fb_key)) and robust_fallback.get(fb_key):
-                        flattened[fb_key] = robust_fallback[fb_key]
-                        print(f"  🔄 Fallback regex aplicado: {fb_key} = {robust_fallback[fb_key]}")
-
-                # --- DUPLA VALIDAÇÃO: Datas (OpenAI é autoridade) ---
-                # OpenAI decide qual data é qual. Regex só normaliza o formato.
-                for date_key in ('pilot_delivery_date', 'tech_sheet_delivery_date'):
-                    ai_date = flattened.get(date_key)
-                    if ai_date and isinstance(ai_date, str):
-                        # Normalizar formato: DD/MM/YY → YYYY-MM-DD
-                        if not re.match(r'^\d{4}-\d{2}-\d{2}$', ai_date):
-                            parsed_ai = _parse_br_date(ai_date)
-                            if parsed_ai:
-                                flattened[date_key] = parsed_ai
-                                print(f"  📅 Data OpenAI normalizada: {date_key} = {parsed_ai}")
-                    elif _is_blank(ai_date) and robust_fallback.get(date_key):
-                        # Só usa regex como fallback se OpenAI não retornou nada
-                        flattened[date_key] = robust_fallback[date_key]
-                        print(f"  📅 Data fallback regex (OpenAI vazio): {date_key} = {robust_fallback[date_key]}")
-
-                print(f"  📅 RESULTADO DATAS: pilot={flattened.get('pilot_delivery_date')}, ficha={flattened.get('tech_sheet_delivery_date')}")
-
-                if extra_fields:
-                    flattened['extra_fields'] = extra_fields
-
-                corner_value = flattened.get('corner')
-                corner_value = _trim_value_at_labels(
-                    corner_value,
-                    [
-                        "MES PLANEJADO",
-                        "ENTRADA",
-                        "MARCA",
-                        "LINHA",
-                        "COLECAO",
-                        "REFERENCIA",
-                        "REF ESTILO",
-                        "GRUPO",
-                        "SUB GRUPO",
-                        "GRADE",
-                        "SUB GRADE",
-                    ],
-                )
-                if corner_value is None:
-                    flattened['corner'] = None
-                else:
-                    flattened['corner'] = corner_value
-                return flattened
-            except json.JSONDecodeError as je:
-                print(f"JSON parsing error: {je}")
-                return None
-        else:
-            return None
+        if not content:
+            return {}
+        try:
+            documents = json.loads(content).get("documents") or []
+        except json.JSONDecodeError as je:
+            print(f"[BATCH] JSON parsing error: {je}")
+            return {}
+
+        results = {}
+        for document in documents:
+            if not isinstance(document, dict):
+                continue
+            doc_id = str(document.pop("doc_id", ""))
+            if doc_id not in contexts or doc_id in results:
+                continue
+            print(f"[BATCH] Documento {doc_id}:")
+            results[doc_id] = _finalize_extracted_fields(document, contexts[doc_id])
+
+        missing = [doc_id for doc_id in contexts if doc_id not in results]
+        if missing:
+            print(f"[BATCH] Documentos sem resposta (seguirão individualmente): {missing}")
+        return results
     except Exception as e:
-        print(f"Error processing with OpenAI: {e}")
+        print(f"[BATCH] Error processing batch with OpenAI: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        return {}
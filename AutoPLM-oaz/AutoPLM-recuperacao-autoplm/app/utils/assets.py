@@ -0,0 +1,397 @@
+"""
+Asset store endereçado por conteúdo para desenhos, thumbnails e capas.
+
+Cada arquivo é gravado uma única vez em
+static/assets/<aa>/<bb>/<sha256>.<ext> (aa/bb = primeiros bytes do hash),
+então conteúdos iguais são deduplicados e o nome nunca colide entre fichas
+ou coleções. Como a URL muda sempre que o conteúdo muda, os assets são
+servidos com Cache-Control imutável.
+
+A contagem de referências fica na tabela static_asset e é ajustada a cada
+flush do ORM a partir das colunas em _asset_references(). O GC
+(collect_garbage / gc_assets.py) recalcula as contagens a partir do banco e
+remove os arquivos sem referência.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.extensions import db
+
+ASSET_URL_PREFIX = '/static/assets/'
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Pastas antigas (nomes com id/uuid) que o GC pode limpar com legacy=True
+LEGACY_ASSET_DIRS = ('drawings', 'thumbnails', 'covers')
+
+_ASSET_URL_RE = re.compile(r'^/static/assets/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.([a-z0-9]{1,10})$')
+
+
+def _get_static_dir():
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'static'))
+
+
+def _asset_references():
+    """(modelo, coluna) que guardam URLs de assets."""
+    from app.models import Specification, Collection, DrawingCandidate
+    return (
+        (Specification, 'technical_drawing_url'),
+        (Specification, 'pdf_thumbnail'),
+        (Collection, 'cover_image'),
+        (DrawingCandidate, 'image_url'),
+    )
+
+
+def parse_asset_url(url):
+    """(digest, extensão) de uma URL do asset store, ou None."""
+    if not url or not isinstance(url, str):
+        return None
+    match = _ASSET_URL_RE.match(url)
+    if not match:
+        return None
+    return match.group(1), match.group(2)
+
+
+def asset_url(digest, extension):
+    return f"{ASSET_URL_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+
+def asset_path(digest, extension, static_dir=None):
+    static_dir = static_dir or _get_static_dir()
+    return os.path.join(static_dir, 'assets', digest[:2], digest[2:4], f"{digest}.{extension}")
+
+
+def asset_exists(url, static_dir=None):
+    parsed = parse_asset_url(url)
+    return bool(parsed) and os.path.isfile(asset_path(*parsed, static_dir=static_dir))
+
+
+def _normalize_extension(extension):
+    extension = (extension or 'bin').lower().lstrip('.')
+    if extension == 'jpeg':
+        extension = 'jpg'
+    return extension if re.match(r'^[a-z0-9]{1,10}$', extension) else 'bin'
+
+
+def store_asset(data, extension, static_dir=None):
+    """Grava `data` no asset store (se ainda não existir) e retorna a URL pública."""
+    extension = _normalize_extension(extension)
+    digest = hashlib.sha256(data).hexdigest()
+    path = asset_path(digest, extension, static_dir)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    _register_asset(digest, extension, len(data))
+    return asset_url(digest, extension)
+
+
+def store_asset_file(file_path, extension=None, static_dir=None):
+    if extension is None:
+        extension = os.path.splitext(file_path)[1]
+    with open(file_path, 'rb') as f:
+        return store_asset(f.read(), extension, static_dir)
+
+
+def _register_asset(digest, extension, size_bytes):
+    """Cria a linha de static_asset (ref_count 0) numa sessão própria.
+
+    Falhas (sem contexto de app, corrida com outro worker) são ignoradas:
+    o GC reconcilia as linhas com o disco.
+    """
+    try:
+        from app.models import StaticAsset
+        Session_ = sessionmaker(bind=db.engine)
+        session = Session_()
+        try:
+            if session.query(StaticAsset.digest).filter_by(digest=digest).first() is None:
+                session.add(StaticAsset(digest=digest, extension=extension, size_bytes=size_bytes, ref_count=0))
+                session.commit()
+        except IntegrityError:
+            session.rollback()
+        finally:
+            session.close()
+    except Exception as e:
+        print(f"⚠️ [ASSETS] Não foi possível registrar asset {digest[:12]}: {e}")
+
+
+def _reference_deltas(session):
+    deltas = Counter()
+    references = _asset_references()
+
+    def tracked_columns(obj):
+        return [column for model, column in references if isinstance(obj, model)]
+
+    for obj in session.new:
+        for column in tracked_columns(obj):
+            parsed = parse_asset_url(getattr(obj, column, None))
+            if parsed:
+                deltas[parsed[0]] += 1
+
+    for obj in session.dirty:
+        columns = tracked_columns(obj)
+        if not columns:
+            continue
+        state = inspect(obj)
+        for column in columns:
+            history = state.attrs[column].history
+            for value in history.added or ():
+                parsed = parse_asset_url(value)
+                if parsed:
+                    deltas[parsed[0]] += 1
+            for value in history.deleted or ():
+                parsed = parse_asset_url(value)
+                if parsed:
+                    deltas[parsed[0]] -= 1
+
+    for obj in session.deleted:
+        state = inspect(obj)
+        for column in tracked_columns(obj):
+            history = state.attrs[column].history
+            values = list(history.unchanged or ()) + list(history.deleted or ())
+            for value in values:
+                parsed = parse_asset_url(value)
+                if parsed:
+                    deltas[parsed[0]] -= 1
+
+    return {digest: delta for digest, delta in deltas.items() if delta}
+
+
+def _after_flush(session, flush_context):
+    try:
+        deltas = _reference_deltas(session)
+    except Exception as e:
+        print(f"⚠️ [ASSETS] Erro ao calcular referências: {e}")
+        return
+    if not deltas:
+        return
+
+    from app.models import StaticAsset
+    table = StaticAsset.__table__
+    connection = session.connection()
+    now = datetime.utcnow()
+    for digest, delta in deltas.items():
+        connection.execute(
+            update(table)
+            .where(table.c.digest == digest)
+            .values(ref_count=table.c.ref_count + delta, updated_at=now)
+        )
+
+
+_refcounting_registered = False
+
+
+def register_asset_refcounting():
+    """Liga o ajuste de ref_count a todas as sessões do ORM (uma vez)."""
+    global _refcounting_registered
+    if _refcounting_registered:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    # active_history carrega o valor antigo ao sobrescrever uma coluna já
+    # expirada (após commit), para que a referência antiga seja descontada
+    for model, column in _asset_references():
+        event.listen(getattr(model, column), 'set', _noop_set_listener, active_history=True)
+    _refcounting_registered = True
+
+
+def _noop_set_listener(target, value, oldvalue, initiator):
+    return value
+
+
+def _prune_old_candidates(session, dry_run):
+    """Remove candidatos de jobs antigos: fica só o conjunto mais recente de
+    cada ficha e o candidato que estiver em uso como desenho."""
+    from app.models import Specification, DrawingCandidate
+    from sqlalchemy import func
+
+    latest_jobs = session.query(
+        DrawingCandidate.specification_id,
+        func.max(DrawingCandidate.job_id),
+    ).group_by(DrawingCandidate.specification_id).all()
+    latest_by_spec = {spec_id: job_id for spec_id, job_id in latest_jobs}
+
+    current_urls = {
+        spec_id: url for spec_id, url in session.query(
+            Specification.id, Specification.technical_drawing_url
+        ).filter(Specification.id.in_(list(latest_by_spec.keys()) or [0])).all()
+    }
+
+    pruned = 0
+    for candidate in session.query(DrawingCandidate).yield_per(500):
+        if candidate.job_id == latest_by_spec.get(candidate.specification_id):
+            continue
+        if candidate.image_url == current_urls.get(candidate.specification_id):
+            continue
+        pruned += 1
+        if not dry_run:
+            session.delete(candidate)
+    if not dry_run:
+        session.commit()
+    return pruned
+
+
+def count_asset_references(session):
+    """Contagem autoritativa de referências por digest + conjunto de todas as
+    URLs locais referenciadas (inclusive nomes antigos fora do asset store)."""
+    counts = Counter()
+    referenced_urls = set()
+    for model, column in _asset_references():
+        attr = getattr(model, column)
+        for (value,) in session.query(attr).filter(attr.isnot(None)).yield_per(1000):
+            referenced_urls.add(value)
+            parsed = parse_asset_url(value)
+            if parsed:
+                counts[parsed[0]] += 1
+    return counts, referenced_urls
+
+
+def _remove_empty_shards(directory, assets_root):
+    while os.path.abspath(directory) != os.path.abspath(assets_root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+def collect_garbage(dry_run=True, grace_seconds=86400, legacy=False, prune_candidates=True, static_dir=None):
+    """Recalcula ref_count e remove assets sem referência.
+
+    Arquivos mais novos que `grace_seconds` nunca são removidos (podem ter
+    sido gravados por um job cuja transação ainda não foi confirmada).
+    Com legacy=True também remove arquivos das pastas antigas
+    (static/drawings, thumbnails, covers) que nenhuma linha referencia.
+    Retorna um dict com o relatório.
+    """
+    from app.models import StaticAsset
+
+    static_dir = static_dir or _get_static_dir()
+    assets_root = os.path.join(static_dir, 'assets')
+    cutoff = time.time() - grace_seconds
+
+    Session_ = sessionmaker(bind=db.engine)
+    session = Session_()
+    report = {
+        'dry_run': dry_run,
+        'candidates_pruned': 0,
+        'refcounts_fixed': 0,
+        'rows_created': 0,
+        'assets_scanned': 0,
+        'assets_removed': 0,
+        'legacy_removed': 0,
+        'manifests_removed': 0,
+        'bytes_freed': 0,
+        'kept_in_grace': 0,
+    }
+
+    try:
+        if prune_candidates:
+            report['candidates_pruned'] = _prune_old_candidates(session, dry_run)
+
+        counts, referenced_urls = count_asset_references(session)
+        rows = {row.digest: row for row in session.query(StaticAsset).all()}
+
+        for digest, row in rows.items():
+            expected = counts.get(digest, 0)
+            if row.ref_count != expected:
+                report['refcounts_fixed'] += 1
+                if not dry_run:
+                    row.ref_count = expected
+                    row.updated_at = datetime.utcnow()
+
+        if os.path.isdir(assets_root):
+            for dirpath, _, filenames in os.walk(assets_root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if filename.startswith('.tmp-'):
+                        if os.path.getmtime(path) < cutoff and not dry_run:
+                            os.remove(path)
+                        continue
+                    digest, _, extension = filename.partition('.')
+                    if len(digest) != 64:
+                        continue
+                    report['assets_scanned'] += 1
+                    size = os.path.getsize(path)
+
+                    if counts.get(digest, 0) > 0:
+                        if digest not in rows and not dry_run:
+                            session.add(StaticAsset(digest=digest, extension=extension,
+                                                    size_bytes=size, ref_count=counts[digest]))
+                            report['rows_created'] += 1
+                        continue
+                    if os.path.getmtime(path) >= cutoff:
+                        report['kept_in_grace'] += 1
+                        continue
+
+                    report['assets_removed'] += 1
+                    report['bytes_freed'] += size
+                    if not dry_run:
+                        os.remove(path)
+                        if digest in rows:
+                            session.delete(rows[digest])
+                        _remove_empty_shards(os.path.dirname(path), assets_root)
+
+        if legacy:
+            for folder in LEGACY_ASSET_DIRS:
+                folder_path = os.path.join(static_dir, folder)
+                if not os.path.isdir(folder_path):
+                    continue
+                for filename in os.listdir(folder_path):
+                    path = os.path.join(folder_path, filename)
+                    if not os.path.isfile(path):
+                        continue
+                    if f"/static/{folder}/{filename}" in referenced_urls:
+                        continue
+                    if os.path.getmtime(path) >= cutoff:
+                        report['kept_in_grace'] += 1
+                        continue
+                    report['legacy_removed'] += 1
+                    report['bytes_freed'] += os.path.getsize(path)
+                    if not dry_run:
+                        os.remove(path)
+
+        # Manifestos do cache de variantes (app.utils.drawing_cache) que
+        # apontam para assets removidos deixam de ter utilidade
+        variants_root = os.path.join(static_dir, 'drawings', 'variants')
+        if not dry_run and os.path.isdir(variants_root):
+            for dirpath, _, filenames in os.walk(variants_root):
+                for filename in filenames:
+                    if not filename.endswith('.json'):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            urls = json.load(f).get('urls') or []
+                    except (OSError, ValueError):
+                        urls = []
+                    if not urls or not all(asset_exists(url, static_dir) for url in urls):
+                        os.remove(path)
+                        report['manifests_removed'] += 1
+
+        if dry_run:
+            session.rollback()
+        else:
+            session.commit()
+    finally:
+        session.close()
+
+    return report
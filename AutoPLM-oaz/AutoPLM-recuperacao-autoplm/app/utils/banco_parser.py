@@ -4,11 +4,12 @@ Parser for Fluxogama 'Banco de Dados' XLSX files.
 These files contain WSID mappings for materials, lines, groups, etc.
 Typical columns: Código | WSID | Descrição | Status | ...
 """
-import io
 import re
 import unicodedata
 import pandas as pd
 
+from app.utils.xlsx_reader import open_sheet, detect_header
+
 
 # Column name variations we accept (normalized → canonical)
 _CODIGO_NAMES = {'codigo', 'cod', 'code', 'id'}
@@ -52,7 +53,7 @@ def _safe_str(value):
 
 def parse_banco_xlsx(file_bytes):
     """
-    Parse a Banco de Dados XLSX file.
+    Parse a Banco de Dados XLSX file (bytes or a path to it).
 
     Returns dict with:
         success: bool
@@ -64,10 +65,8 @@ def parse_banco_xlsx(file_bytes):
         sheet_name: str
     """
     try:
-        stream = io.BytesIO(file_bytes)
-        xl = pd.ExcelFile(stream, engine='openpyxl')
-        sheet = xl.sheet_names[0]
-        df = xl.parse(sheet_name=sheet, header=None)
+        with open_sheet(file_bytes) as sheet:
+            return _parse_rows(sheet.rows, sheet.name)
     except Exception as e:
         return {
             'success': False,
@@ -79,7 +78,22 @@ def parse_banco_xlsx(file_bytes):
             'sheet_name': '',
         }
 
-    if len(df) < 2:
+
+def _header_score(row):
+    """1 for the first row with a Código/WSID column, None otherwise."""
+    norms = [_normalize_col(v) for v in row]
+    has_codigo = any(n in _CODIGO_NAMES for n in norms)
+    has_wsid = any(n in _WSID_NAMES for n in norms)
+    return 1 if has_codigo or has_wsid else None
+
+
+def _parse_rows(rows, sheet):
+    """Parse the sheet rows (tuples, consumed lazily)."""
+    # --- Find header row (first row with Código/WSID match) ---
+    scan = detect_header(rows, _header_score, max_rows=10)
+    header_row = scan.index
+
+    if len(scan.head) < 2:
         return {
             'success': False,
             'items': [],
@@ -90,22 +104,11 @@ def parse_banco_xlsx(file_bytes):
             'sheet_name': sheet,
         }
 
-    # --- Find header row (first row with Código/WSID match) ---
-    header_row = None
-    for i in range(min(10, len(df))):
-        row_vals = df.iloc[i].tolist()
-        norms = [_normalize_col(v) for v in row_vals]
-        has_codigo = any(n in _CODIGO_NAMES for n in norms)
-        has_wsid = any(n in _WSID_NAMES for n in norms)
-        if has_codigo or has_wsid:
-            header_row = i
-            break
-
     if header_row is None:
         return {
             'success': False,
             'items': [],
-            'total_rows': len(df),
+            'total_rows': len(scan.head) + sum(1 for _ in scan.rest),
             'skipped_inactive': 0,
             'skipped_invalid': 0,
             'error': 'Coluna "Código" ou "WSID" não encontrada.',
@@ -113,7 +116,7 @@ def parse_banco_xlsx(file_bytes):
         }
 
     # --- Map columns ---
-    header_vals = df.iloc[header_row].tolist()
+    header_vals = list(scan.head[header_row])
     cols_norm = [_normalize_col(v) for v in header_vals]
 
     codigo_idx = _find_col(cols_norm, _CODIGO_NAMES)
@@ -125,7 +128,7 @@ def parse_banco_xlsx(file_bytes):
         return {
             'success': False,
             'items': [],
-            'total_rows': len(df),
+            'total_rows': len(scan.head) + sum(1 for _ in scan.rest),
             'skipped_inactive': 0,
             'skipped_invalid': 0,
             'invalid_examples': [],
@@ -146,15 +149,15 @@ def parse_banco_xlsx(file_bytes):
         detected_columns['status'] = str(header_vals[status_idx])
 
     # --- Parse data rows ---
-    data = df.iloc[header_row + 1:]
     items = []
+    total_rows = 0
     skipped_inactive = 0
     skipped_invalid = 0
     invalid_examples = []  # up to 10, with reason
     _MAX_INVALID_EXAMPLES = 10
 
-    for _, row in data.iterrows():
-        vals = row.tolist()
+    for vals in scan.rest:
+        total_rows += 1
 
         # Skip inactive rows (if status column exists)
         if status_idx is not None:
@@ -202,7 +205,7 @@ def parse_banco_xlsx(file_bytes):
     return {
         'success': True,
         'items': items,
-        'total_rows': len(data),
+        'total_rows': total_rows,
         'skipped_inactive': skipped_inactive,
         'skipped_invalid': skipped_invalid,
         'invalid_examples': invalid_examples,
@@ -121,7 +121,7 @@ def process_stage_openai_parse(spec, file_path, thread_session):
         extracted_data = None
         if text_content and len(text_content.strip()) >= 50:
             print(f"[ETAPA 4] Processando OCR com OpenAI: {filename}")
-            extracted_data = process_specification_with_openai(text_content)
+            extracted_data = _extract_with_partial_fields(spec, thread_session, text_content)
 
         if extracted_data:
             _apply_extracted_data_to_spec(spec, extracted_data)
@@ -152,7 +152,7 @@ def process_stage_openai_parse(spec, file_path, thread_session):
         if not text_content:
             raise Exception("Texto nao encontrado - etapa 3 nao foi concluida")
 
-        extracted_data = process_specification_with_openai(text_content)
+        extracted_data = _extract_with_partial_fields(spec, thread_session, text_content)
 
         if not extracted_data:
             raise Exception("OpenAI nao retornou dados extraidos")
@@ -269,21 +269,99 @@ def _apply_visual_analysis_to_spec(spec, visual_analysis):
     print(f"  [OK] Dados extraídos: {spec.description}, Grupo: {spec.main_group}")
 
 
-def _apply_extracted_data_to_spec(spec, extracted_data):
+def _apply_extracted_field(spec, key, value):
     from app.utils.helpers import convert_value_to_string
-    
+
+    if not hasattr(spec, key) or value is None:
+        return False
+    if key in ['tech_sheet_delivery_date', 'pilot_delivery_date']:
+        if isinstance(value, str):
+            if not re.match(r'^\d{4}-\d{2}-\d{2}$', value):
+                return False
+            try:
+                value = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                return False
+    setattr(spec, key, convert_value_to_string(value))
+    return True
+
+
+def _apply_extracted_data_to_spec(spec, extracted_data):
     for key, value in extracted_data.items():
-        if hasattr(spec, key) and value is not None:
-            if key in ['tech_sheet_delivery_date', 'pilot_delivery_date']:
-                if isinstance(value, str):
-                    if not re.match(r'^\d{4}-\d{2}-\d{2}$', value):
-                        continue
-            setattr(spec, key, convert_value_to_string(value))
+        _apply_extracted_field(spec, key, value)
     
     print(f"  [OK] Dados extraídos: {spec.description}, Fornecedor: {spec.supplier}")
 
 
-def advance_spec_processing(spec_id, upload_folder, app):
+class _PartialFieldApplier:
+    """Callback para o streaming da etapa 4: aplica cada campo assim que chega
+    e faz commit no máximo a cada `min_interval`s, para o status mostrar
+    resultados parciais.
+
+    Os valores brutos do stream ainda não passaram pelo pós-processamento
+    (_finalize_extracted_fields), então guarda o valor anterior de cada campo
+    tocado: finalize() grava em todos eles o valor final (inclusive None) e
+    restore() devolve os valores de antes do stream quando a extração falha.
+    """
+
+    def __init__(self, spec, thread_session, min_interval=1.0):
+        self.spec = spec
+        self.thread_session = thread_session
+        self.min_interval = min_interval
+        self.original = {}
+        self.last_commit = 0.0
+
+    def __call__(self, key, value):
+        if not hasattr(self.spec, key):
+            return
+        previous = getattr(self.spec, key)
+        if not _apply_extracted_field(self.spec, key, value):
+            return
+        self.original.setdefault(key, previous)
+        now = time.monotonic()
+        if now - self.last_commit >= self.min_interval:
+            self.thread_session.commit()
+            self.last_commit = now
+
+    def finalize(self, extracted_data):
+        """Campos do stream recebem o valor final; ausentes ou inválidos voltam ao anterior."""
+        for key, previous in self.original.items():
+            if key in extracted_data and extracted_data[key] is None:
+                setattr(self.spec, key, None)
+            elif key not in extracted_data or not _apply_extracted_field(self.spec, key, extracted_data[key]):
+                setattr(self.spec, key, previous)
+        self.original = {}
+
+    def restore(self):
+        for key, previous in self.original.items():
+            setattr(self.spec, key, previous)
+        self.original = {}
+
+
+def _extract_with_partial_fields(spec, thread_session, text_content):
+    """process_specification_with_openai com campos parciais no spec.
+
+    Sem resultado (None) ou com erro, os campos tocados pelo stream voltam ao
+    valor anterior antes de seguir para o fallback / propagar o erro.
+    """
+    from app.utils.ai import process_specification_with_openai
+
+    applier = _PartialFieldApplier(spec, thread_session)
+    try:
+        extracted_data = process_specification_with_openai(text_content, on_field=applier)
+    except Exception:
+        applier.restore()
+        thread_session.commit()
+        raise
+    if extracted_data:
+        applier.finalize(extracted_data)
+    else:
+        applier.restore()
+        thread_session.commit()
+    return extracted_data
+
+
+def advance_spec_processing(spec_id, upload_folder, app, stop_stage=None):
     from sqlalchemy.orm import sessionmaker
     from app.extensions import db
     from app.models import Specification
@@ -318,6 +396,8 @@ def advance_spec_processing(spec_id, upload_folder, app):
         ]
         
         for from_stage, to_stage, stage_func in stages:
+            if stop_stage is not None and to_stage > stop_stage:
+                break
             if current_stage <= from_stage:
                 try:
                     spec.processing_status = 'processing'
@@ -357,6 +437,52 @@ def advance_spec_processing(spec_id, upload_folder, app):
         return False
 
 
+def process_short_specs_batched(spec_ids):
+    """Etapa 4 em lote para fichas curtas (texto extraído <= SPEC_BATCH_MAX_CHARS).
+
+    Só considera specs paradas na etapa 3 sem erro. As que o modelo não devolver
+    continuam na etapa 3 e seguem pelo caminho individual normalmente.
+    """
+    from sqlalchemy.orm import sessionmaker
+    from app.extensions import db
+    from app.models import Specification
+    from app.utils.ai import SPEC_BATCH_MAX_CHARS, plan_spec_batches, process_specifications_batch_with_openai
+
+    Session = sessionmaker(bind=db.engine)
+    batch_session = Session()
+    try:
+        specs = batch_session.query(Specification).filter(
+            Specification.id.in_(spec_ids),
+            Specification.processing_stage == STAGE_EXTRACT_TEXT,
+            Specification.processing_status != 'error',
+        ).all()
+        eligible = [
+            s for s in specs
+            if s.raw_extracted_text and 50 <= len(s.raw_extracted_text.strip()) <= SPEC_BATCH_MAX_CHARS
+        ]
+        if len(eligible) < 2:
+            return 0
+
+        by_id = {str(s.id): s for s in eligible}
+        processed = 0
+        for batch in plan_spec_batches([(str(s.id), s.raw_extracted_text) for s in eligible]):
+            if len(batch) < 2:
+                continue
+            print(f"[ETAPA 4] Extração em lote: specs {[doc_id for doc_id, _ in batch]}")
+            results = process_specifications_batch_with_openai(batch)
+            for doc_id, extracted_data in results.items():
+                spec = by_id.get(doc_id)
+                if not spec or not extracted_data:
+                    continue
+                _apply_extracted_data_to_spec(spec, extracted_data)
+                spec.processing_stage = STAGE_OPENAI_PARSE
+                processed += 1
+            batch_session.commit()
+        return processed
+    finally:
+        batch_session.close()
+
+
 def process_batch_queue(batch_id, upload_folder, app, batch_size=5):
     from sqlalchemy.orm import sessionmaker
     from app.extensions import db
@@ -389,6 +515,18 @@ def process_batch_queue(batch_id, upload_folder, app, batch_size=5):
             
             print(f"\nProcessando bloco de {len(spec_ids)} arquivos: {spec_ids}")
             
+            # Etapas 1-3 primeiro, para que as fichas curtas do bloco sejam
+            # extraídas juntas em um único request (etapa 4 em lote)
+            for spec_id in spec_ids:
+                try:
+                    advance_spec_processing(spec_id, upload_folder, app, stop_stage=STAGE_EXTRACT_TEXT)
+                except Exception as e:
+                    print(f"  [X] Erro ao preparar spec {spec_id}: {e}")
+            try:
+                process_short_specs_batched(spec_ids)
+            except Exception as e:
+                print(f"  [!] Extração em lote falhou - seguindo individualmente: {e}")
+            
             for spec_id in spec_ids:
                 try:
                     success = advance_spec_processing(spec_id, upload_folder, app)
@@ -0,0 +1,141 @@
+"""
+Inserção em massa para as importações (itens de ficha, especificações de compras).
+
+Em vez de um objeto ORM por linha + um flush gigante, as linhas (dicts com
+nomes de coluna) são consumidas em blocos de `chunk_size`:
+
+- PostgreSQL + psycopg2: COPY ... FROM STDIN (CSV), direto na conexão da sessão;
+- outros bancos: insert().execute com a lista do bloco (executemany do Core).
+
+Os defaults Python das colunas (created_at=datetime.utcnow, status, ...) são
+aplicados aqui, porque o COPY não passa pelo SQLAlchemy. Cada bloco usa a
+transação da sessão: por padrão o chamador faz o commit no fim (importação
+tudo-ou-nada); com commit_every=True cada bloco é confirmado ao terminar.
+
+    inserted = bulk_insert(FichaTecnicaItem.__table__, rows, progress=report)
+"""
+
+import io
+import json
+from datetime import datetime, date
+from itertools import islice
+
+from app.extensions import db
+
+BULK_CHUNK_SIZE = 2000
+
+
+def _column_defaults(table):
+    """{coluna: default} das colunas com default Python escalar ou chamável."""
+    defaults = {}
+    for column in table.columns:
+        default = column.default
+        if default is None or column.primary_key:
+            continue
+        if default.is_scalar or default.is_callable:
+            defaults[column.name] = default.arg
+    return defaults
+
+
+def _resolve_defaults(defaults):
+    """Valores dos defaults para um bloco (os chamáveis são avaliados uma vez)."""
+    return {name: (arg(None) if callable(arg) else arg) for name, arg in defaults.items()}
+
+
+def _complete_rows(table, chunk, defaults):
+    """Mesmas colunas em todas as linhas do bloco; ausentes recebem o default (ou None)."""
+    names = set()
+    for row in chunk:
+        names.update(row)
+    unknown = names - set(table.columns.keys())
+    if unknown:
+        raise ValueError(f"Colunas inexistentes em {table.name}: {sorted(unknown)}")
+
+    values = _resolve_defaults(defaults)
+    columns = [c.name for c in table.columns if c.name in names or c.name in values]
+    fill = {name: values.get(name) for name in columns}
+    return columns, [{**fill, **row} for row in chunk]
+
+
+def _csv_field(value):
+    """Campo CSV do COPY: vazio sem aspas é NULL, texto vai sempre entre aspas."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=' ')
+    elif isinstance(value, date):
+        value = value.isoformat()
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def rows_to_csv(columns, rows):
+    """Bloco em CSV para COPY ... WITH (FORMAT csv)."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write(','.join(_csv_field(row[name]) for name in columns))
+        buf.write('\n')
+    buf.seek(0)
+    return buf
+
+
+def _copy_chunk(connection, table, columns, rows):
+    raw = connection.connection.dbapi_connection
+    cursor = raw.cursor()
+    try:
+        column_list = ', '.join(f'"{name}"' for name in columns)
+        cursor.copy_expert(
+            f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv)',
+            rows_to_csv(columns, rows),
+        )
+    finally:
+        cursor.close()
+
+
+def _supports_copy(connection):
+    dialect = connection.dialect
+    return dialect.name == 'postgresql' and dialect.driver == 'psycopg2'
+
+
+def bulk_insert(table, rows, chunk_size=BULK_CHUNK_SIZE, commit_every=False, progress=None, session=None):
+    """
+    Insere `rows` (iterável de dicts coluna→valor) em `table` em blocos.
+
+    Args:
+        table: Table do SQLAlchemy (ex.: FichaTecnicaItem.__table__)
+        rows: iterável consumido aos poucos (gerador, ParsedItems mapeado, ...)
+        chunk_size: linhas por bloco
+        commit_every: confirma a transação a cada bloco (senão o chamador faz o commit)
+        progress: callback(inseridas_ate_agora) chamado a cada bloco
+        session: sessão a usar (padrão: db.session)
+
+    Returns:
+        número de linhas inseridas
+    """
+    session = session or db.session
+    defaults = _column_defaults(table)
+    rows = iter(rows)
+    inserted = 0
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        columns, chunk = _complete_rows(table, chunk, defaults)
+        connection = session.connection()
+        if _supports_copy(connection):
+            _copy_chunk(connection, table, columns, chunk)
+        else:
+            connection.execute(table.insert(), chunk)
+        inserted += len(chunk)
+        if commit_every:
+            session.commit()
+        if progress:
+            progress(inserted)
+
+    return inserted
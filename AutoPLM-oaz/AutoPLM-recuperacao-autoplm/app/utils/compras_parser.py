@@ -2,9 +2,9 @@
 Parser for 'Coleção Picking / Fornecedores' XLSX files (purchased products).
 Reads product rows and maps them to Specification-compatible dicts.
 """
-import io
 import logging
-import pandas as pd
+
+from app.utils.xlsx_reader import read_sheet_names, open_sheet, detect_header
 
 logger = logging.getLogger('compras_parser')
 
@@ -143,16 +143,14 @@ def parse_compras_xlsx(file_bytes, sheet_name=None):
     Parse a 'Compras' XLSX file.
 
     Args:
-        file_bytes: bytes of the XLSX file
+        file_bytes: bytes of the XLSX file, or a path to it
         sheet_name: name of the sheet to parse (default: first suitable sheet)
 
     Returns:
         dict with keys: items, sheet_names, selected_sheet, total_rows, errors
     """
-    stream = io.BytesIO(file_bytes)
-
     try:
-        xl = pd.ExcelFile(stream, engine='openpyxl')
+        sheet_names = read_sheet_names(file_bytes)
     except Exception as e:
         return {
             'items': [],
@@ -162,32 +160,50 @@ def parse_compras_xlsx(file_bytes, sheet_name=None):
             'total_rows': 0,
         }
 
-    sheet_names = xl.sheet_names
+    sheet_name = sheet_name or default_compras_sheet(sheet_names)
+    if sheet_name not in sheet_names:
+        return _missing_sheet(sheet_name, sheet_names)
 
-    # Auto-select the best sheet if not specified
-    if not sheet_name:
-        preferred = ['TESTE PLM', 'Compra Total']
-        for pref in preferred:
-            if pref in sheet_names:
-                sheet_name = pref
-                break
-        if not sheet_name:
-            sheet_name = sheet_names[0]
+    # Read the sheet row by row (streaming)
+    with open_sheet(file_bytes, sheet_name=sheet_name) as sheet:
+        return _parse_rows(sheet.rows, sheet_name, sheet_names)
 
-    if sheet_name not in sheet_names:
-        return {
-            'items': [],
-            'errors': [f'Aba "{sheet_name}" não encontrada. Disponíveis: {sheet_names}'],
-            'sheet_names': sheet_names,
-            'selected_sheet': sheet_name,
-            'total_rows': 0,
-        }
 
-    # Read the sheet
-    df = pd.read_excel(xl, sheet_name=sheet_name, header=None, dtype=str)
+def parse_compras_columns(columns, sheet_names, sheet_name=None):
+    """
+    Parse a sheet already decoded into columns (SheetColumns from the workbook cache).
+
+    Same result as parse_compras_xlsx for that sheet, without reopening the XLSX.
+    columns=None means the sheet `sheet_name` does not exist in the workbook.
+    """
+    if columns is None:
+        return _missing_sheet(sheet_name, sheet_names)
+    return _parse_rows(columns.rows(), columns.name, sheet_names)
+
+
+def default_compras_sheet(sheet_names):
+    """Auto-select the best sheet when none is specified."""
+    preferred = ['TESTE PLM', 'Compra Total']
+    for pref in preferred:
+        if pref in sheet_names:
+            return pref
+    return sheet_names[0] if sheet_names else None
+
+
+def _missing_sheet(sheet_name, sheet_names):
+    return {
+        'items': [],
+        'errors': [f'Aba "{sheet_name}" não encontrada. Disponíveis: {sheet_names}'],
+        'sheet_names': sheet_names,
+        'selected_sheet': sheet_name,
+        'total_rows': 0,
+    }
 
+
+def _parse_rows(rows, sheet_name, sheet_names):
     # Find the header row by looking for known column names
-    header_row = _find_header_row(df)
+    scan = detect_header(rows, _header_score, max_rows=5)
+    header_row = scan.index
     if header_row is None:
         return {
             'items': [],
@@ -197,15 +213,13 @@ def parse_compras_xlsx(file_bytes, sheet_name=None):
             'total_rows': 0,
         }
 
-    # Set headers and slice data
-    headers_raw = df.iloc[header_row].tolist()
-    df_data = df.iloc[header_row + 1:].reset_index(drop=True)
+    headers_raw = scan.head[header_row]
 
     # Map headers to our internal field names
     col_mapping = {}  # Excel col index → internal field name
     mapped_headers = []
     for idx, h in enumerate(headers_raw):
-        norm = _normalize_header(h) if pd.notna(h) else ''
+        norm = _normalize_header(h) if h is not None else ''
         field = _COL_MAP.get(norm)
         if field:
             col_mapping[idx] = field
@@ -216,14 +230,13 @@ def parse_compras_xlsx(file_bytes, sheet_name=None):
     # Parse rows into items
     items = []
     skipped = 0
-    for row_idx in range(len(df_data)):
-        row = df_data.iloc[row_idx]
+    for row_idx, row in enumerate(scan.rest):
         item = {}
         for col_idx, field_name in col_mapping.items():
             if field_name in _SKIP_FIELDS:
                 continue
-            val = row.iloc[col_idx] if col_idx < len(row) else None
-            if pd.notna(val):
+            val = row[col_idx] if col_idx < len(row) else None
+            if val is not None:
                 val_str = str(val).strip()
                 # Skip formula errors
                 if val_str in ('#VALUE!', '#REF!', '#N/A', '#DIV/0!', '#NAME?'):
@@ -281,29 +294,15 @@ def parse_compras_xlsx(file_bytes, sheet_name=None):
     }
 
 
-def _find_header_row(df, max_rows=5):
+_HEADER_NAMES = {'referência', 'referencia', 'artigo', 'composição', 'composicao',
+                 'grupo', 'subgrupo', 'fornecedor', 'cor', 'linha', 'corner',
+                 'composição ', 'preço de venda', 'preco de venda', 'coleção'}
+
+
+def _header_score(row):
     """
-    Find the header row by looking for known column names.
-    Searches the first `max_rows` rows.
+    Number of known column names in the row (header candidates in the first
+    rows of the sheet). Needs at least 3 known columns to be confident.
     """
-    known = {'referência', 'referencia', 'artigo', 'composição', 'composicao',
-             'grupo', 'subgrupo', 'fornecedor', 'cor', 'linha', 'corner',
-             'composição ', 'preço de venda', 'preco de venda', 'coleção'}
-
-    best_row = None
-    best_count = 0
-
-    for row_idx in range(min(max_rows, len(df))):
-        row_vals = df.iloc[row_idx].tolist()
-        count = 0
-        for v in row_vals:
-            if pd.notna(v) and _normalize_header(v) in known:
-                count += 1
-        if count > best_count:
-            best_count = count
-            best_row = row_idx
-
-    # Need at least 3 known columns to be confident
-    if best_count >= 3:
-        return best_row
-    return None
+    count = sum(1 for v in row if v is not None and _normalize_header(v) in _HEADER_NAMES)
+    return count if count >= 3 else None
@@ -0,0 +1,97 @@
+"""
+Cache em disco dos desenhos técnicos gerados pelo gpt-image-1.
+
+A chave é (hash da imagem base, hash do prompt, modelo, tamanho, qualidade):
+regenerar com a mesma ficha, a mesma imagem base e a mesma análise visual
+devolve os candidatos já salvos sem chamar a API. Cada entrada é um manifesto
+static/drawings/variants/<kk>/<chave>.json com as URLs dos PNGs, que ficam
+no asset store (app.utils.assets). Se o GC remover algum PNG, a entrada
+deixa de valer e a próxima geração chama a API de novo.
+
+O manifesto guarda também quantos candidatos foram pedidos: se a API devolveu
+menos que o pedido, a entrada vale para pedidos de até aquele número (não
+adianta chamar de novo esperando mais). "Gerar Novo Desenho" ignora o cache
+(force) e a geração nova substitui a entrada.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+from app.utils.assets import store_asset, asset_exists
+
+DRAWING_MODEL = 'gpt-image-1'
+DRAWING_SIZE = '1024x1024'
+DRAWING_QUALITY = 'high'
+
+DRAWING_VARIANTS = max(1, int(os.environ.get('DRAWING_VARIANTS', '1')))
+DRAWING_MAX_VARIANTS = max(1, int(os.environ.get('DRAWING_MAX_VARIANTS', '4')))
+
+_VARIANTS_DIR = 'variants'
+
+
+def clamp_variants(value):
+    """Número de candidatos pedido pelo usuário, limitado a [1, DRAWING_MAX_VARIANTS]."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = DRAWING_VARIANTS
+    return max(1, min(value, DRAWING_MAX_VARIANTS))
+
+
+def drawing_cache_key(base_image_bytes, prompt, model=DRAWING_MODEL, size=DRAWING_SIZE, quality=DRAWING_QUALITY):
+    base_hash = hashlib.sha256(base_image_bytes).hexdigest() if base_image_bytes else 'generate'
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    raw = f"{base_hash}|{prompt_hash}|{model}|{size}|{quality}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _manifest_path(static_folder, key):
+    return os.path.join(static_folder, 'drawings', _VARIANTS_DIR, key[:2], f"{key}.json")
+
+
+def load_cached_drawings(static_folder, key, n):
+    """URLs de até `n` candidatos em cache para a chave, ou None se a entrada não atende.
+
+    Atende quando tem `n` candidatos ou quando veio de um pedido de `n` ou mais
+    (a API devolveu menos que o pedido).
+    """
+    manifest_path = _manifest_path(static_folder, key)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    urls = manifest.get('urls') or []
+    requested = manifest.get('requested') or len(urls)
+    if not urls or (len(urls) < n and requested < n):
+        return None
+    urls = urls[:n]
+    if not all(asset_exists(url, static_folder) for url in urls):
+        return None
+    return urls
+
+
+def store_drawings(static_folder, key, images, requested=None):
+    """Grava os PNGs (bytes) no asset store e o manifesto da chave; retorna as URLs.
+
+    `requested` é quantos candidatos foram pedidos à API (padrão: len(images)).
+
+    O manifesto é escrito num arquivo temporário e renomeado, para que um
+    leitor concorrente nunca veja uma entrada pela metade.
+    """
+    urls = [store_asset(image_data, 'png', static_folder) for image_data in images]
+
+    manifest_path = _manifest_path(static_folder, key)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(manifest_path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'urls': urls, 'requested': requested or len(urls)}, f)
+        os.replace(tmp_path, manifest_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return urls
@@ -0,0 +1,556 @@
+"""
+Fila de geração de desenho técnico.
+
+Cada clique em "Gerar Desenho" vira um DrawingJob no banco em vez de uma
+thread solta. Pedidos repetidos para a mesma ficha são agrupados no job que
+já está na fila/rodando, e um dispatcher por processo reivindica jobs
+respeitando um limite GLOBAL de gerações simultâneas (contado no banco, então
+vale para todos os workers do gunicorn juntos).
+
+Gerações em massa (DrawingBatch, coleção ou lote de upload) entram na mesma
+fila, mas só são reivindicadas quando não há pedido individual esperando, e
+o limite DRAWING_IMAGES_PER_MINUTE segura o ritmo no limite sustentado da
+API para que uma coleção inteira possa rodar durante a noite.
+
+Variáveis de ambiente:
+- DRAWING_MAX_CONCURRENCY: gerações simultâneas no total (padrão 2)
+- DRAWING_IMAGES_PER_MINUTE: imagens iniciadas por minuto no total (padrão 0 = sem limite)
+- DRAWING_JOB_TIMEOUT: segundos até um job 'running' ser considerado órfão (padrão 600)
+- DRAWING_POLL_INTERVAL: intervalo do dispatcher quando ocioso (padrão 2s)
+- DRAWING_QUEUE_AUTOSTART: sobe o dispatcher junto com o app (padrão 1), para
+  jobs que ficaram na fila num restart/deploy voltarem a andar sozinhos
+
+Cada reivindicação grava um run_id em DrawingJob.worker (mesmo esquema dos
+jobs de importação). O status final só é gravado pela execução dona do
+run_id: se o job foi dado como órfão (_recover_stale_jobs) e a thread
+original ainda termina depois, o resultado dela não sobrescreve o status
+recuperado.
+
+O lote (DrawingBatch) é fechado por quem termina o último job ativo dele:
+_finish_job trava a linha do lote (FOR UPDATE) antes de fechar o job, então
+os últimos jobs de um lote terminando juntos não deixam de se enxergar. Cada
+passada do dispatcher também fecha lotes sem jobs ativos (jobs órfãos, ou um
+lote que ficou aberto por qualquer outro motivo); a consulta de progresso só lê.
+"""
+
+import os
+import uuid
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import update, func, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app.extensions import db
+from app.models import Specification, DrawingJob, DrawingBatch, DrawingCandidate
+from app.utils.logging import rpa_info, rpa_error
+
+DRAWING_MAX_CONCURRENCY = max(1, int(os.environ.get('DRAWING_MAX_CONCURRENCY', '2')))
+DRAWING_IMAGES_PER_MINUTE = max(0, int(os.environ.get('DRAWING_IMAGES_PER_MINUTE', '0')))
+DRAWING_JOB_TIMEOUT = int(os.environ.get('DRAWING_JOB_TIMEOUT', '600'))
+DRAWING_POLL_INTERVAL = float(os.environ.get('DRAWING_POLL_INTERVAL', '2'))
+DRAWING_QUEUE_AUTOSTART = os.environ.get('DRAWING_QUEUE_AUTOSTART', '1') == '1'
+
+# Chave do advisory lock (PostgreSQL) que serializa a reivindicação de jobs
+_CLAIM_LOCK_KEY = 0x0D7A3106
+
+# Tentativas de enfileirar um lote quando pedidos individuais entram no meio
+_ENQUEUE_BATCH_ATTEMPTS = 3
+
+_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_dispatcher_lock = threading.Lock()
+_dispatcher_thread = None
+_dispatcher_pid = None
+_wake_event = threading.Event()
+_executor = None
+_local_running = 0
+_local_running_lock = threading.Lock()
+
+
+def _stale_cutoff():
+    return datetime.utcnow() - timedelta(seconds=DRAWING_JOB_TIMEOUT)
+
+
+def get_active_drawing_job(spec_id, session=None):
+    session = session or db.session
+    return session.query(DrawingJob).filter(
+        DrawingJob.specification_id == spec_id,
+        DrawingJob.status.in_(DrawingJob.ACTIVE_STATUSES),
+    ).order_by(DrawingJob.id.desc()).first()
+
+
+def get_latest_drawing_job(spec_id, session=None):
+    session = session or db.session
+    return session.query(DrawingJob).filter(
+        DrawingJob.specification_id == spec_id
+    ).order_by(DrawingJob.id.desc()).first()
+
+
+def get_queue_position(job, session=None):
+    """Posição 1-based do job entre os que aguardam (0 se não está na fila)."""
+    if not job or job.status != 'queued':
+        return 0
+    session = session or db.session
+    interactive = DrawingJob.drawing_batch_id.is_(None)
+    if job.drawing_batch_id is None:
+        ahead_filter = db.and_(interactive, DrawingJob.id < job.id)
+    else:
+        ahead_filter = db.or_(interactive, DrawingJob.id < job.id)
+    ahead = session.query(func.count(DrawingJob.id)).filter(
+        DrawingJob.status == 'queued',
+        ahead_filter,
+    ).scalar() or 0
+    return ahead + 1
+
+
+def get_queue_stats(session=None):
+    session = session or db.session
+    rows = session.query(DrawingJob.status, func.count(DrawingJob.id)).filter(
+        DrawingJob.status.in_(DrawingJob.ACTIVE_STATUSES)
+    ).group_by(DrawingJob.status).all()
+    counts = dict(rows)
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'max_concurrency': DRAWING_MAX_CONCURRENCY,
+        'images_per_minute': DRAWING_IMAGES_PER_MINUTE,
+    }
+
+
+def get_latest_candidates(spec_id, session=None):
+    """Candidatos do último job concluído da ficha (o conjunto atual de escolha)."""
+    session = session or db.session
+    latest = session.query(DrawingCandidate.job_id).filter(
+        DrawingCandidate.specification_id == spec_id
+    ).order_by(DrawingCandidate.id.desc()).first()
+    if not latest:
+        return []
+    return session.query(DrawingCandidate).filter(
+        DrawingCandidate.specification_id == spec_id,
+        DrawingCandidate.job_id == latest.job_id,
+    ).order_by(DrawingCandidate.variant_index).all()
+
+
+def drawing_job_payload(job, session=None, selected_url=None):
+    """Dict de status usado pelas rotas (inclui posição na fila e candidatos)."""
+    if not job:
+        return {'status': 'idle', 'queue_position': 0, 'candidates': []}
+    session = session or db.session
+    payload = job.to_dict()
+    payload['queue_position'] = get_queue_position(job, session)
+    payload['candidates'] = []
+    if job.status == 'completed':
+        candidates = session.query(DrawingCandidate).filter_by(job_id=job.id).order_by(DrawingCandidate.variant_index).all()
+        payload['candidates'] = [c.to_dict(selected_url or job.drawing_url) for c in candidates]
+    return payload
+
+
+def enqueue_drawing_job(spec_id, user_id, app, variants=1, force_new=False):
+    """Enfileira a geração de `variants` candidatos de desenho para a ficha.
+
+    Com force_new o job ignora o cache de desenhos (regeneração pedida pelo
+    usuário). Se já existe job ativo para a ficha, o pedido é agrupado nele
+    (um job ainda na fila passa a ignorar o cache também).
+    Retorna (job, coalesced).
+    """
+    job = get_active_drawing_job(spec_id)
+    if job:
+        job.request_count = (job.request_count or 1) + 1
+        if force_new and job.status == 'queued':
+            job.force_new = True
+        db.session.commit()
+        ensure_drawing_dispatcher(app)
+        return job, True
+
+    job = DrawingJob(specification_id=spec_id, user_id=user_id, status='queued', variants=variants,
+                     force_new=bool(force_new))
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro worker criou o job ativo entre a consulta e o insert
+        db.session.rollback()
+        job = get_active_drawing_job(spec_id)
+        if not job:
+            raise
+        ensure_drawing_dispatcher(app)
+        return job, True
+
+    ensure_drawing_dispatcher(app)
+    _wake_event.set()
+    return job, False
+
+
+def enqueue_drawing_batch(specs_query, user_id, app, scope, variants=1,
+                          collection_id=None, upload_batch_id=None, label=None):
+    """Enfileira a geração de desenho para todas as fichas de `specs_query`.
+
+    Pula fichas que já têm desenho, que já estão na fila e cujo arquivo de
+    origem não existe. Os jobs entram com prioridade menor que os pedidos
+    individuais. Retorna o DrawingBatch.
+    """
+    for attempt in range(1, _ENQUEUE_BATCH_ATTEMPTS + 1):
+        batch = _build_drawing_batch(specs_query, user_id, app, scope, variants,
+                                     collection_id, upload_batch_id, label)
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            # Um pedido individual entrou na fila no meio do caminho; refaz sem as fichas já ativas
+            db.session.rollback()
+            if attempt == _ENQUEUE_BATCH_ATTEMPTS:
+                raise
+
+    if batch.queued_count:
+        ensure_drawing_dispatcher(app)
+        _wake_event.set()
+    return batch
+
+
+def _build_drawing_batch(specs_query, user_id, app, scope, variants,
+                         collection_id, upload_batch_id, label):
+    """Monta o DrawingBatch e seus jobs na sessão (sem commit)."""
+    rows = specs_query.with_entities(
+        Specification.id, Specification.technical_drawing_url, Specification.pdf_filename
+    ).order_by(Specification.id).all()
+
+    active_ids = set()
+    spec_ids = [row.id for row in rows]
+    for start in range(0, len(spec_ids), 500):
+        chunk = spec_ids[start:start + 500]
+        active_ids.update(row[0] for row in db.session.query(DrawingJob.specification_id).filter(
+            DrawingJob.specification_id.in_(chunk),
+            DrawingJob.status.in_(DrawingJob.ACTIVE_STATUSES),
+        ).all())
+
+    batch = DrawingBatch(
+        user_id=user_id, scope=scope, collection_id=collection_id, upload_batch_id=upload_batch_id,
+        label=label, variants=variants, status='running', total_specs=len(rows),
+        skipped_existing=0, skipped_active=0, skipped_missing=0, queued_count=0,
+    )
+    db.session.add(batch)
+    db.session.flush()
+
+    upload_folder = app.config['UPLOAD_FOLDER']
+    for row in rows:
+        if row.technical_drawing_url:
+            batch.skipped_existing += 1
+        elif row.id in active_ids:
+            batch.skipped_active += 1
+        elif not row.pdf_filename or not os.path.exists(os.path.join(upload_folder, row.pdf_filename)):
+            batch.skipped_missing += 1
+        else:
+            db.session.add(DrawingJob(
+                specification_id=row.id, user_id=user_id, status='queued',
+                variants=variants, drawing_batch_id=batch.id,
+            ))
+            batch.queued_count += 1
+
+    if not batch.queued_count:
+        batch.status = 'completed'
+        batch.finished_at = datetime.utcnow()
+
+    return batch
+
+
+def get_drawing_batch_progress(batch, session=None):
+    """Contagens por status, vazão (imagens/min) e ETA de um DrawingBatch."""
+    session = session or db.session
+    counts = dict(session.query(DrawingJob.status, func.count(DrawingJob.id)).filter(
+        DrawingJob.drawing_batch_id == batch.id
+    ).group_by(DrawingJob.status).all())
+    first_started, last_finished = session.query(
+        func.min(DrawingJob.started_at), func.max(DrawingJob.finished_at)
+    ).filter(DrawingJob.drawing_batch_id == batch.id).one()
+
+    queued = counts.get('queued', 0)
+    running = counts.get('running', 0)
+    completed = counts.get('completed', 0)
+    failed = counts.get('error', 0)
+    cancelled = counts.get('cancelled', 0)
+    done = completed + failed
+    remaining = queued + running
+    variants = batch.variants or 1
+
+    elapsed = None
+    jobs_per_minute = None
+    eta_seconds = None
+    if first_started:
+        if batch.status != 'running' and batch.finished_at:
+            end = batch.finished_at
+        elif not remaining and last_finished:
+            end = last_finished
+        else:
+            end = datetime.utcnow()
+        elapsed = max((end - first_started).total_seconds(), 1.0)
+        if done:
+            jobs_per_minute = done / elapsed * 60
+    if remaining:
+        rates = []
+        if jobs_per_minute:
+            rates.append(jobs_per_minute)
+        if DRAWING_IMAGES_PER_MINUTE:
+            rates.append(DRAWING_IMAGES_PER_MINUTE / variants)
+        if rates:
+            eta_seconds = int(remaining / min(rates) * 60)
+
+    total = batch.queued_count or 0
+    payload = batch.to_dict()
+    payload.update({
+        'pending': queued,
+        'running': running,
+        'completed': completed,
+        'failed': failed,
+        'cancelled': cancelled,
+        'percent': round(100.0 * (done + cancelled) / total, 1) if total else 100.0,
+        'elapsed_seconds': int(elapsed) if elapsed else None,
+        'jobs_per_minute': round(jobs_per_minute, 2) if jobs_per_minute else None,
+        'images_per_minute': round(jobs_per_minute * variants, 2) if jobs_per_minute else None,
+        'eta_seconds': eta_seconds,
+        'rate_limit_images_per_minute': DRAWING_IMAGES_PER_MINUTE or None,
+    })
+    return payload
+
+
+def cancel_drawing_batch(batch):
+    """Cancela os jobs ainda na fila do lote (os que estão rodando terminam)."""
+    result = db.session.execute(
+        update(DrawingJob)
+        .where(DrawingJob.drawing_batch_id == batch.id, DrawingJob.status == 'queued')
+        .values(status='cancelled', finished_at=datetime.utcnow())
+    )
+    batch.status = 'cancelled'
+    batch.finished_at = datetime.utcnow()
+    db.session.commit()
+    return result.rowcount
+
+
+def ensure_drawing_dispatcher(app):
+    """Inicia (uma vez por processo) a thread que consome a fila."""
+    global _dispatcher_thread, _dispatcher_pid, _executor
+    with _dispatcher_lock:
+        pid = os.getpid()
+        if _dispatcher_thread and _dispatcher_thread.is_alive() and _dispatcher_pid == pid:
+            return
+        _executor = ThreadPoolExecutor(max_workers=DRAWING_MAX_CONCURRENCY, thread_name_prefix='drawing-job')
+        _dispatcher_pid = pid
+        _dispatcher_thread = threading.Thread(
+            target=_dispatcher_loop, args=(app,), name='drawing-dispatcher', daemon=True
+        )
+        _dispatcher_thread.start()
+        print(f"🖌️ [DRAWING QUEUE] Dispatcher iniciado ({_WORKER_ID}, máx {DRAWING_MAX_CONCURRENCY} simultâneos)")
+
+
+def start_drawing_queue(app):
+    """Sobe o dispatcher na inicialização do processo (run.py, post_fork do gunicorn)."""
+    if DRAWING_QUEUE_AUTOSTART:
+        ensure_drawing_dispatcher(app)
+        _wake_event.set()
+
+
+def _dispatcher_loop(app):
+    global _local_running
+    while True:
+        _wake_event.clear()
+        try:
+            with app.app_context():
+                _recover_stale_jobs()
+                while _local_slots_available():
+                    claimed = _claim_next_job()
+                    if not claimed:
+                        break
+                    job_id, run_id = claimed
+                    with _local_running_lock:
+                        _local_running += 1
+                    _executor.submit(_run_job, job_id, run_id, app)
+        except Exception as e:
+            print(f"❌ [DRAWING QUEUE] Erro no dispatcher: {e}")
+            traceback.print_exc()
+        _wake_event.wait(DRAWING_POLL_INTERVAL)
+
+
+def _local_slots_available():
+    with _local_running_lock:
+        return _local_running < DRAWING_MAX_CONCURRENCY
+
+
+def _close_finished_batches(session, batch_ids=None):
+    """Marca como 'completed' os lotes em andamento sem jobs ativos (sem commit).
+
+    Args:
+        batch_ids: lotes a verificar; None = todos os lotes 'running'
+    """
+    active_jobs = db.select(DrawingJob.id).where(
+        DrawingJob.drawing_batch_id == DrawingBatch.id,
+        DrawingJob.status.in_(DrawingJob.ACTIVE_STATUSES),
+    ).exists()
+    stmt = update(DrawingBatch).where(DrawingBatch.status == 'running', ~active_jobs)
+    if batch_ids is not None:
+        stmt = stmt.where(DrawingBatch.id.in_(batch_ids))
+    return session.execute(
+        stmt.values(status='completed', finished_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False},
+    ).rowcount
+
+
+def _recover_stale_jobs():
+    """Jobs 'running' sem conclusão após DRAWING_JOB_TIMEOUT (worker morto) viram erro.
+
+    Também fecha os lotes em andamento que já não têm jobs ativos.
+    """
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        result = session.execute(
+            update(DrawingJob)
+            .where(DrawingJob.status == 'running', DrawingJob.started_at < _stale_cutoff())
+            .values(status='error', error='Tempo limite excedido', finished_at=datetime.utcnow())
+        )
+        session.commit()
+        if result.rowcount:
+            print(f"⚠️ [DRAWING QUEUE] {result.rowcount} job(s) órfão(s) marcados como erro")
+        if _close_finished_batches(session):
+            session.commit()
+        else:
+            session.rollback()
+    finally:
+        session.close()
+
+
+def _claim_next_job():
+    """Reivindica o job mais antigo da fila se o limite global permitir.
+
+    Retorna (job_id, run_id) ou None. O run_id fica em DrawingJob.worker e
+    identifica esta execução no status final.
+
+    No PostgreSQL a contagem + reivindicação é serializada por um advisory
+    lock de transação; o UPDATE condicional (status='queued') garante que
+    dois processos nunca peguem o mesmo job.
+    """
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        if session.bind.dialect.name == 'postgresql':
+            session.execute(db.text("SELECT pg_advisory_xact_lock(:key)"), {'key': _CLAIM_LOCK_KEY})
+
+        running = session.query(func.count(DrawingJob.id)).filter(
+            DrawingJob.status == 'running'
+        ).scalar() or 0
+        if running >= DRAWING_MAX_CONCURRENCY:
+            session.rollback()
+            return None
+
+        # Pedidos individuais antes dos jobs de geração em massa
+        candidate = session.query(DrawingJob.id, DrawingJob.variants).filter(
+            DrawingJob.status == 'queued'
+        ).order_by(
+            case((DrawingJob.drawing_batch_id.is_(None), 0), else_=1),
+            DrawingJob.id,
+        ).first()
+        if not candidate:
+            session.rollback()
+            return None
+
+        if DRAWING_IMAGES_PER_MINUTE:
+            started_last_minute = session.query(func.coalesce(func.sum(DrawingJob.variants), 0)).filter(
+                DrawingJob.started_at >= datetime.utcnow() - timedelta(seconds=60)
+            ).scalar() or 0
+            if started_last_minute + (candidate.variants or 1) > DRAWING_IMAGES_PER_MINUTE and started_last_minute:
+                session.rollback()
+                return None
+
+        run_id = f"{_WORKER_ID}:{uuid.uuid4().hex[:8]}"
+        result = session.execute(
+            update(DrawingJob)
+            .where(DrawingJob.id == candidate.id, DrawingJob.status == 'queued')
+            .values(status='running', started_at=datetime.utcnow(), worker=run_id)
+        )
+        session.commit()
+        return (candidate.id, run_id) if result.rowcount == 1 else None
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _finish_job(job_id, run_id, status, error=None, drawing_url=None):
+    """Fecha o job se ele ainda pertence a esta execução. Retorna True se fechou.
+
+    Se era o último job ativo do lote, o lote é fechado na mesma transação.
+    """
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        batch_id = session.query(DrawingJob.drawing_batch_id).filter(DrawingJob.id == job_id).scalar()
+        if batch_id is not None:
+            # Serializa os jobs do lote terminando juntos: o último vê os outros já fechados
+            session.query(DrawingBatch.id).filter(DrawingBatch.id == batch_id).with_for_update().scalar()
+        result = session.execute(
+            update(DrawingJob)
+            .where(
+                DrawingJob.id == job_id,
+                DrawingJob.status == 'running',
+                DrawingJob.worker == run_id,
+            )
+            .values(status=status, error=error, drawing_url=drawing_url, finished_at=datetime.utcnow())
+        )
+        if result.rowcount and batch_id is not None:
+            _close_finished_batches(session, [batch_id])
+        session.commit()
+        if not result.rowcount:
+            print(f"⚠️ [DRAWING QUEUE] Job {job_id} já recuperado/finalizado por outro processo; resultado '{status}' descartado")
+        return bool(result.rowcount)
+    except Exception as e:
+        session.rollback()
+        print(f"Error updating drawing job {job_id}: {e}")
+        return False
+    finally:
+        session.close()
+
+
+def _run_job(job_id, run_id, app):
+    global _local_running
+    from flask import current_app
+    from app.routes.drawings import generate_drawing_background
+
+    spec_id = None
+    try:
+        with app.app_context():
+            try:
+                job = db.session.query(DrawingJob).get(job_id)
+                spec = Specification.query.get(job.specification_id) if job else None
+                if not spec:
+                    _finish_job(job_id, run_id, 'error', error='Ficha não encontrada')
+                    return
+                spec_id = spec.id
+                if not spec.pdf_filename:
+                    _finish_job(job_id, run_id, 'error', error='Ficha sem arquivo de origem')
+                    return
+                variants = job.variants or 1
+                force_new = bool(job.force_new)
+                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], spec.pdf_filename)
+                db.session.remove()
+
+                print(f"🖌️ [DRAWING QUEUE] Job {job_id} iniciado para spec {spec_id}")
+                drawing_url = generate_drawing_background(spec_id, file_path, app, variants=variants, job_id=job_id,
+                                                          force_new=force_new)
+            except Exception as e:
+                db.session.remove()
+                print(f"❌ Error generating technical drawing for spec {spec_id}: {e}")
+                traceback.print_exc()
+                rpa_error(f"DESENHO_TECNICO_ERRO: Falha ao gerar desenho para spec ID {spec_id}", exc=e, regiao="geracao_desenho")
+                _finish_job(job_id, run_id, 'error', error=str(e)[:1000])
+                return
+
+            _finish_job(job_id, run_id, 'completed', drawing_url=drawing_url)
+            rpa_info(f"DESENHO_TECNICO: Geração concluída para spec ID {spec_id}")
+    finally:
+        with _local_running_lock:
+            _local_running -= 1
+        _wake_event.set()
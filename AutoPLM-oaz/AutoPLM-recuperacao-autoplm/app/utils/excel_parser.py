@@ -1,10 +1,11 @@
-import io
 import re
-import math
 import unicodedata
 import logging
+import numpy as np
 import pandas as pd
 
+from app.utils.xlsx_reader import open_sheet, detect_header, normalize_row, iter_frames
+
 logger = logging.getLogger('excel_parser')
 
 # Values treated as empty / missing
@@ -159,41 +160,209 @@ def clean_string(value):
     return text
 
 
-def _find_header_row(df):
-    max_rows = min(200, len(df))
-    best_row = None
-    best_score = -1
-
-    for i in range(max_rows):
-        row = df.iloc[i].tolist()
-        normalized = [normalize_column_name(v) for v in row if pd.notna(v)]
-        if not normalized:
-            continue
-        mapped = sum(1 for name in normalized if name in COLUMN_MAP)
-        score = mapped * 10 + len(normalized)
-        if mapped >= 3 and score > best_score:
-            best_score = score
-            best_row = i
+# ── Columnar (vectorized) versions of clean_string / parse_number ────
+_COMBINING_MARKS = r'[\u0300-\u036f]'
+
+
+def _clean_string_column(series):
+    """clean_string applied to a whole column: object Series of str or None."""
+    missing = series.isna()
+    text = series.astype(str).str.strip()
+    empty = missing.to_numpy() | text.str.lower().isin(_EMPTY_MARKERS).to_numpy()
+    return text.astype(object).where(~empty, None)
+
+
+def _parse_number_column(series):
+    """parse_number applied to a whole column: float64 Series (NaN = missing)."""
+    # Numbers and plain numeric strings ("12", "1.5") convert in C; only what
+    # fails there (BR formats, markers, dates, text) goes through the str path.
+    result = pd.to_numeric(series, errors='coerce').astype('float64')
+    is_text = series.notna() & result.isna()
+    if is_text.any():
+        text = (series[is_text].astype(str)
+                .str.normalize('NFKD').str.replace(_COMBINING_MARKS, '', regex=True)
+                .str.strip())
+        text = text.where(~text.str.lower().isin(_EMPTY_MARKERS))
+        text = text.str.replace(' ', '', regex=False)
+        # "1.234,56" → "1234.56"; "12,5" → "12.5"
+        thousands = text.str.contains(',', regex=False) & text.str.contains('.', regex=False)
+        text = text.where(~thousands.fillna(False), text.str.replace('.', '', regex=False))
+        text = text.str.replace(',', '.', regex=False)
+        result[is_text] = pd.to_numeric(text, errors='coerce')
+    return result
+
+
+def _parse_columns(frames, numeric_indexes):
+    """Clean every column (and convert the numeric ones) one chunk at a time.
+
+    Only one chunk of raw cells is alive at a time; the cleaned/typed chunks
+    are concatenated at the end. Returns (index, cleaned, numbers, width),
+    with cleaned/numbers keyed by column position.
+    """
+    indexes = []
+    cleaned_parts = {}
+    number_parts = {}
+    for frame in frames:
+        chunk = len(indexes)
+        indexes.append(frame.index)
+        for idx in frame.columns:
+            cleaned_parts.setdefault(idx, {})[chunk] = _clean_string_column(frame[idx])
+            if idx in numeric_indexes:
+                number_parts.setdefault(idx, {})[chunk] = _parse_number_column(frame[idx])
+
+    if indexes:
+        index = pd.RangeIndex(indexes[0][0], indexes[-1][-1] + 1)
+    else:
+        index = pd.RangeIndex(0)
+
+    def assemble(parts, empty):
+        if len(parts) == len(indexes) == 1:
+            return parts[0]
+        return pd.concat([parts[i] if i in parts else empty(indexes[i]) for i in range(len(indexes))])
+
+    cleaned = {
+        idx: assemble(parts, lambda ix: pd.Series([None] * len(ix), index=ix, dtype=object))
+        for idx, parts in cleaned_parts.items()
+    }
+    numbers = {
+        idx: assemble(parts, lambda ix: pd.Series(np.nan, index=ix))
+        for idx, parts in number_parts.items()
+    }
+    return index, cleaned, numbers, max(cleaned_parts, default=-1) + 1
+
+
+def _python_values(series, as_int=False):
+    """Column values as Python objects, NaN → None (ints for qty fields)."""
+    if series.dtype != object:
+        if as_int:
+            return [None if v != v else int(v) for v in series.tolist()]
+        return [None if v != v else v for v in series.tolist()]
+    return series.tolist()
+
+
+def _raw_records(raw_df, positions):
+    names = list(raw_df.columns)
+    rows = raw_df.iloc[positions]
+    return [dict(zip(names, values)) for values in zip(*(rows[n].tolist() for n in names))]
+
+
+class ParsedItems:
+    """Valid rows of a parsed sheet, kept columnar.
+
+    Behaves like the list of item dicts the importers expect (len, slicing,
+    iteration), but each dict (fields + raw_row) is only built when accessed:
+    the preview slice and the final insert.
+    """
+
+    CHUNK_SIZE = 2000
+
+    def __init__(self, items_df, raw_df, int_fields=()):
+        self._items = items_df.reset_index(drop=True)
+        self._raw = raw_df.reset_index(drop=True)
+        self._int_fields = set(int_fields)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return len(self._items) > 0
+
+    def __iter__(self):
+        for start in range(0, len(self), self.CHUNK_SIZE):
+            yield from self._records(start, start + self.CHUNK_SIZE)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self._records(0, len(self))[key]
+            return self._records(start, stop)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('item index out of range')
+        return self._records(key, key + 1)[0]
+
+    def column(self, name):
+        """Typed column (pandas Series) for set-based consumers."""
+        return self._items[name]
+
+    def _records(self, start, stop):
+        if stop <= start:
+            return []
+        chunk = self._items.iloc[start:stop]
+        names = list(chunk.columns)
+        columns = [_python_values(chunk[name], name in self._int_fields) for name in names]
+        raw_rows = _raw_records(self._raw, range(start, min(stop, len(self._raw))))
+        records = []
+        for values, raw_row in zip(zip(*columns), raw_rows):
+            record = dict(zip(names, values))
+            record['raw_row'] = raw_row
+            records.append(record)
+        return records
+
+
+_HEADER_SCAN_ROWS = 200
+
+
+def _header_score(row):
+    normalized = [normalize_column_name(v) for v in row if v is not None]
+    if not normalized:
+        return None
+    mapped = sum(1 for name in normalized if name in COLUMN_MAP)
+    return mapped * 10 + len(normalized) if mapped >= 3 else None
 
-    if best_row is not None:
-        return best_row
 
+def _fallback_header_row(rows):
+    """Row with the most filled cells, when no row looks like a known header."""
     max_count = 0
     fallback = None
-    for i in range(max_rows):
-        count = df.iloc[i].notna().sum()
+    for i, row in enumerate(rows):
+        count = sum(1 for v in row if v is not None)
         if count > max_count:
             max_count = count
             fallback = i
     return fallback
 
 
-def extract_header_metadata(df, header_row):
+def _build_columns(header_values):
+    columns = []
+    seen = {}
+
+    for idx, value in enumerate(header_values):
+        source_name = clean_string(value) or ''
+        normalized = normalize_column_name(value)
+        mapped = COLUMN_MAP.get(normalized, normalized)
+        if not mapped:
+            mapped = f"col_{idx}"
+        if mapped in seen:
+            seen[mapped] += 1
+            mapped = f"{mapped}_{seen[mapped]}"
+        else:
+            seen[mapped] = 1
+        columns.append({
+            'index': idx,
+            'sourceColumnName': source_name,
+            'name': mapped,
+        })
+    return columns
+
+
+def _pad(row, width):
+    return tuple(row) + (None,) * (width - len(row))
+
+
+def extract_header_metadata(rows, header_row):
+    """Metadata (PI number, supplier, ...) from the rows above the column header.
+
+    `rows`: the sheet rows as tuples (None = empty cell), all padded to the
+    same width.
+    """
     header_raw = []
     header_data = {}
 
     for i in range(header_row):
-        row = df.iloc[i].tolist()
+        row = list(rows[i])
         non_empty = [(idx, val) for idx, val in enumerate(row) if pd.notna(val)]
         if not non_empty:
             continue
@@ -230,15 +399,38 @@ _OPTIONAL_NUMERIC_DEFAULTS = {'moq': 0, 'oaz_qty': 0}
 _EXPECTED_COLUMNS = {'item_no_ref_supplier', 'moq', 'oaz_qty'}
 
 _MAX_INVALID_SAMPLES = 20
+# Integer qty fields (should be whole numbers)
+_INTEGER_QTY_FIELDS = ('moq', 'oaz_qty', 'inner_packing_pcs', 'outer_packing_pcs')
 
 
 def parse_excel(file_bytes):
-    stream = io.BytesIO(file_bytes)
-    xl = pd.ExcelFile(stream, engine='openpyxl')
-    sheet = 'SOUQ' if 'SOUQ' in xl.sheet_names else xl.sheet_names[0]
-    df_raw = xl.parse(sheet_name=sheet, header=None)
+    """`file_bytes`: bytes do XLSX ou caminho do arquivo (ver app.utils.uploads).
+
+    A aba é lida em streaming (app.utils.xlsx_reader), sem carregar o workbook.
+    """
+    with open_sheet(file_bytes, preferred=('SOUQ',)) as sheet:
+        return parse_sheet_rows(sheet.rows, sheet.name)
+
 
-    header_row = _find_header_row(df_raw)
+def parse_sheet_frame(df_raw, sheet=None):
+    """Parse a sheet already loaded as a DataFrame (header=None)."""
+    rows = (normalize_row(tuple(None if pd.isna(v) else v for v in row))
+            for row in df_raw.itertuples(index=False, name=None))
+    return parse_sheet_rows(rows, sheet)
+
+
+def parse_sheet_rows(rows, sheet=None):
+    """Parse the rows of a sheet (tuples, None = empty cell), consumed lazily.
+
+    The header is searched in the first rows; the data rows after it are
+    loaded in chunks straight into the columnar frame.
+    """
+    scan = detect_header(rows, _header_score, _HEADER_SCAN_ROWS)
+    header_row = scan.index
+    if header_row is None:
+        header_row = _fallback_header_row(scan.head)
+        if header_row is not None:
+            scan.rest = scan.rows_after(header_row)
     if header_row is None:
         return {
             'header': {},
@@ -251,26 +443,8 @@ def parse_excel(file_bytes):
             'messages': [{'severity': 'error', 'text': 'Linha de cabeçalho não encontrada.'}],
         }
 
-    header_values = df_raw.iloc[header_row].tolist()
-    columns = []
-    seen = {}
-
-    for idx, value in enumerate(header_values):
-        source_name = clean_string(value) or ''
-        normalized = normalize_column_name(value)
-        mapped = COLUMN_MAP.get(normalized, normalized)
-        if not mapped:
-            mapped = f"col_{idx}"
-        if mapped in seen:
-            seen[mapped] += 1
-            mapped = f"{mapped}_{seen[mapped]}"
-        else:
-            seen[mapped] = 1
-        columns.append({
-            'index': idx,
-            'sourceColumnName': source_name,
-            'name': mapped,
-        })
+    header_values = scan.head[header_row]
+    columns = _build_columns(_pad(header_values, scan.width))
 
     # ── Log & check detected columns ─────────────────────────────────
     mapped_names = {c['name'] for c in columns}
@@ -332,86 +506,94 @@ def parse_excel(file_bytes):
             ],
         }
 
-    header_data, header_raw = extract_header_metadata(df_raw, header_row)
-    df = df_raw.iloc[header_row + 1:].copy()
-    df.columns = [col['name'] for col in columns]
-
-    items = []
-    invalid_rows = []
-    invalid_total = 0  # total count (may exceed _MAX_INVALID_SAMPLES)
-    fractional_qty_rows = []  # rows where qty had fractional values
-
-    # ── Integer qty fields (should be whole numbers) ──────────────
-    _INTEGER_QTY_FIELDS = {'moq', 'oaz_qty', 'inner_packing_pcs', 'outer_packing_pcs'}
-
-    for idx, row in df.iterrows():
-        raw_row = {}
-        item = {}
-
-        for col_meta in columns:
-            name = col_meta['name']
-            source_name = col_meta['sourceColumnName'] or name
-            value = row.get(name)
-            raw_row[source_name] = clean_string(value) if pd.notna(value) else None
-
-            if name in NUMERIC_FIELDS:
-                item[name] = parse_number(value)
-            else:
-                item[name] = clean_string(value)
-
-        item_no = (item.get('item_no_ref_supplier') or '').strip()
-
-        # Apply defaults for optional numeric fields
-        for field, default_val in _OPTIONAL_NUMERIC_DEFAULTS.items():
-            if item.get(field) is None:
-                item[field] = default_val
-
-        moq = item.get('moq')
-        oaz_qty = item.get('oaz_qty')
-
-        # Skip completely empty rows
-        if not item_no and moq == 0 and oaz_qty == 0:
-            has_any_value = any(v for v in raw_row.values() if v)
-            if not has_any_value:
-                continue
+    # ── Columnar parsing: one vectorized pass per column, chunk by chunk ──
+    numeric_indexes = {c['index'] for c in columns if c['name'] in NUMERIC_FIELDS}
+    index, raw_columns, number_columns, data_width = _parse_columns(
+        iter_frames(scan.rest, first_index=header_row + 1), numeric_indexes)
+    row_numbers = index.to_numpy() + 1
+
+    width = max(scan.width, data_width)
+    if width > len(columns):
+        # Data rows wider than the header get the same col_N names as before
+        extra = _build_columns(_pad(header_values, width))[len(columns):]
+        columns.extend(extra)
+        unmapped_cols.extend(extra)
+
+    header_data, header_raw = extract_header_metadata(
+        [_pad(row, width) for row in scan.head[:header_row]], header_row)
+
+    typed = {}
+    for col_meta in columns:
+        idx = col_meta['index']
+        if idx not in raw_columns:
+            raw_columns[idx] = pd.Series([None] * len(index), index=index, dtype=object)
+        if idx in numeric_indexes:
+            typed[col_meta['name']] = number_columns.get(idx, pd.Series(np.nan, index=index))
+        else:
+            typed[col_meta['name']] = raw_columns[idx]
+
+    # raw_row is keyed by source column name (last column wins, first position kept)
+    raw_sources = {}
+    for col_meta in columns:
+        raw_sources[col_meta['sourceColumnName'] or col_meta['name']] = col_meta['index']
+    raw_df = pd.DataFrame({source: raw_columns[idx] for source, idx in raw_sources.items()})
+
+    # Apply defaults for optional numeric fields
+    for field, default_val in _OPTIONAL_NUMERIC_DEFAULTS.items():
+        if field in typed:
+            typed[field] = typed[field].fillna(default_val)
+        else:
+            typed[field] = pd.Series(float(default_val), index=index)
+
+    # ── Row masks ────────────────────────────────────────────────
+    has_item_no = typed['item_no_ref_supplier'].notna().to_numpy()
+    has_any_value = raw_df.notna().to_numpy().any(axis=1)
+    empty_rows = (~has_item_no & (typed['moq'] == 0).to_numpy()
+                  & (typed['oaz_qty'] == 0).to_numpy() & ~has_any_value)
+    invalid_mask = ~has_item_no & ~empty_rows
+
+    # Only item_no_ref_supplier is truly required per row
+    invalid_total = int(invalid_mask.sum())
+    invalid_positions = np.flatnonzero(invalid_mask)[:_MAX_INVALID_SAMPLES]
+    invalid_rows = [
+        {
+            'row': int(row_numbers[pos]),
+            'errors': ['item_no_ref_supplier'],
+            'rawRow': raw_row,
+        }
+        for pos, raw_row in zip(invalid_positions, _raw_records(raw_df, invalid_positions))
+    ]
 
-        # Only item_no_ref_supplier is truly required per row
-        if not item_no:
-            invalid_total += 1
-            if len(invalid_rows) < _MAX_INVALID_SAMPLES:
-                invalid_rows.append({
-                    'row': int(idx) + 1,
-                    'errors': ['item_no_ref_supplier'],
-                    'rawRow': raw_row,
-                })
+    # ── Qty normalization: float → int, fractional values rounded up ──
+    fractional_candidates = []
+    for order, qf in enumerate(_INTEGER_QTY_FIELDS):
+        if qf not in typed:
             continue
-
-        # ── Qty normalization: float → int when whole ────────────
-        for qf in _INTEGER_QTY_FIELDS:
-            val = item.get(qf)
-            if val is not None and isinstance(val, float):
-                if val == int(val):
-                    item[qf] = int(val)
-                else:
-                    # Fractional qty — round and warn
-                    if len(fractional_qty_rows) < 5:
-                        fractional_qty_rows.append({
-                            'row': int(idx) + 1,
-                            'field': qf,
-                            'original': val,
-                            'rounded': math.ceil(val),
-                        })
-                    item[qf] = math.ceil(val)
-
-        item['raw_row'] = raw_row
-        items.append(item)
+        values = typed[qf].to_numpy(dtype='float64')
+        rounded = np.ceil(values)
+        fractional = np.flatnonzero(has_item_no & ~np.isnan(values) & (values != rounded))
+        for pos in fractional[:5]:
+            fractional_candidates.append((pos, order, qf, float(values[pos]), int(rounded[pos])))
+        typed[qf] = pd.Series(rounded, index=index)
+    fractional_qty_rows = [
+        {'row': int(row_numbers[pos]), 'field': qf, 'original': original, 'rounded': rounded}
+        for pos, _, qf, original, rounded in sorted(fractional_candidates)[:5]
+    ]
+
+    items = ParsedItems(
+        pd.DataFrame(typed)[has_item_no],
+        raw_df[has_item_no],
+        int_fields=[qf for qf in _INTEGER_QTY_FIELDS if qf in typed],
+    )
 
     # ── Duplicate item_no detection ──────────────────────────────
-    item_no_counts = {}
-    for it in items:
-        ref = it.get('item_no_ref_supplier', '')
-        item_no_counts[ref] = item_no_counts.get(ref, 0) + 1
-    duplicates = {k: v for k, v in item_no_counts.items() if v > 1}
+    item_nos = typed['item_no_ref_supplier'][has_item_no]
+    ref_counts = item_nos.value_counts()
+    repeated = ref_counts[ref_counts > 1]
+    duplicates = {
+        ref: int(repeated[ref])
+        for ref in item_nos[item_nos.isin(repeated.index)].drop_duplicates()
+    }
 
     # ── Build messages for invalid rows (severity=error, not warning) ──
     if invalid_total > 0:
@@ -0,0 +1,121 @@
+"""
+Reimportação incremental de fichas técnicas.
+
+Quando a proforma de um number_pi_order que já existe é importada de novo,
+os itens não são recriados: cada linha da planilha é casada com o item
+existente pela chave (item_no_ref_supplier, oaz_reference) e comparada
+pelo hash da linha normalizada (row_hash):
+
+- linha nova                → insert
+- hash diferente            → update (e o item volta a 'pending' no Fluxogama)
+- item que saiu da planilha → soft delete (deleted_at)
+- hash igual                → nada muda, o estado de sync OAZ/Fluxogama fica
+
+Chaves repetidas na planilha são casadas com os itens existentes na ordem
+(menor id primeiro), então reimportar o mesmo arquivo não muda nada.
+
+O row_hash guarda o hash da última versão importada. Um item editado à mão
+só é sobrescrito quando a linha dele muda na planilha.
+"""
+
+import json
+import hashlib
+
+from app.models import FichaTecnicaItem
+
+# Colunas preenchidas pela importação (entram no hash e no update)
+IMPORTED_COLUMNS = tuple(
+    column.name for column in FichaTecnicaItem.__table__.columns
+    if column.name not in ('id', 'ficha_id', 'created_at', 'updated_at', 'deleted_at', 'row_hash')
+    and column.name not in FichaTecnicaItem.SYNC_COLUMNS
+)
+
+_FLOAT_COLUMNS = frozenset(
+    column.name for column in FichaTecnicaItem.__table__.columns
+    if column.name in IMPORTED_COLUMNS and column.type.python_type is float
+)
+
+
+def _normalize_value(name, value):
+    """Mesmo valor vindo do parser ou lido do banco → mesma representação."""
+    if value is None:
+        return None
+    if name in _FLOAT_COLUMNS:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+    return str(value)
+
+
+def item_row_hash(row):
+    """SHA-256 das colunas importadas de uma linha (dict coluna → valor)."""
+    values = [_normalize_value(name, row.get(name)) for name in IMPORTED_COLUMNS]
+    encoded = json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _key_part(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def item_key(row):
+    return (_key_part(row.get('item_no_ref_supplier')), _key_part(row.get('oaz_reference')))
+
+
+class ItemSyncPlan:
+    """Resultado de plan_item_sync.
+
+    actions: por linha da planilha, ('insert', None), ('update', item) ou
+             ('unchanged', item), onde item é o dict do item existente
+    removed: ids dos itens ativos que não estão mais na planilha
+    """
+
+    def __init__(self, actions, removed):
+        self.actions = actions
+        self.removed = removed
+
+    def counts(self):
+        counts = {'insert': 0, 'update': 0, 'unchanged': 0}
+        for action, _ in self.actions:
+            counts[action] += 1
+        counts['delete'] = len(self.removed)
+        return counts
+
+
+def plan_item_sync(existing, rows):
+    """
+    Casa as linhas da planilha com os itens existentes.
+
+    Args:
+        existing: dicts com id, item_no_ref_supplier, oaz_reference, row_hash e
+                  deleted_at dos itens da ficha (inclusive os já removidos)
+        rows: linhas normalizadas da planilha, já com 'row_hash'
+
+    Um item removido que volta à planilha é atualizado (deleted_at = None).
+    """
+    by_key = {}
+    for item in sorted(existing, key=lambda item: item['id']):
+        by_key.setdefault(item_key(item), []).append(item)
+
+    actions = []
+    matched = set()
+    for row in rows:
+        candidates = by_key.get(item_key(row))
+        if not candidates:
+            actions.append(('insert', None))
+            continue
+        item = candidates.pop(0)
+        matched.add(item['id'])
+        if item['row_hash'] == row['row_hash'] and item['deleted_at'] is None:
+            actions.append(('unchanged', item))
+        else:
+            actions.append(('update', item))
+
+    removed = [
+        item['id'] for item in existing
+        if item['id'] not in matched and item['deleted_at'] is None
+    ]
+    return ItemSyncPlan(actions, removed)
@@ -0,0 +1,194 @@
+"""
+Entrega de arquivos (PDFs, imagens, desenhos) com a checagem de acesso no
+Flask e a transferência dos bytes delegada ao proxy quando configurado.
+
+FILE_SERVING_BACKEND:
+- 'flask':    send_file condicional (ETag forte, 304, Range/206) pelo próprio worker
+- 'nginx':    resposta vazia com X-Accel-Redirect; o nginx envia o arquivo
+              (e atende Range) a partir de uma location `internal`
+- 'sendfile': idem com X-Sendfile (Apache mod_xsendfile / lighttpd)
+
+No modo 'flask' o ETag é forte: o SHA-256 do nome para arquivos do asset
+store e "<mtime_ns>-<tamanho>" (só um stat, sem ler o arquivo) para os
+demais; If-None-Match / If-Modified-Since são respondidos com 304 antes de
+qualquer leitura. Quando o proxy entrega o arquivo ('nginx'/'sendfile'),
+ETag, Last-Modified e 304 ficam com ele.
+"""
+
+import os
+import re
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import current_app, request, send_file, Response
+from werkzeug.http import http_date, parse_date
+
+from app.utils.object_storage import get_object_storage
+
+_DIGEST_CACHE = OrderedDict()
+_DIGEST_CACHE_SIZE = 2048
+_etag_lock = threading.Lock()
+
+_ASSET_PATH_RE = re.compile(r'[\\/]assets[\\/][0-9a-f]{2}[\\/][0-9a-f]{2}[\\/]([0-9a-f]{64})\.[a-z0-9]{1,10}$')
+
+
+def file_etag(path, stat=None):
+    """ETag forte do arquivo sem lê-lo.
+
+    Arquivos do asset store têm o SHA-256 no nome; os demais usam mtime_ns e
+    tamanho (qualquer regravação muda o mtime).
+    """
+    match = _ASSET_PATH_RE.search(path)
+    if match:
+        return match.group(1)
+    stat = stat or os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def file_sha256(path, stat=None):
+    """SHA-256 do conteúdo, memoizado por (caminho, mtime, tamanho).
+
+    Arquivos do asset store já têm o hash no nome e não são relidos.
+    """
+    match = _ASSET_PATH_RE.search(path)
+    if match:
+        return match.group(1)
+
+    stat = stat or os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _etag_lock:
+        digest = _DIGEST_CACHE.get(key)
+        if digest:
+            _DIGEST_CACHE.move_to_end(key)
+            return digest
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _etag_lock:
+        _DIGEST_CACHE[key] = digest
+        while len(_DIGEST_CACHE) > _DIGEST_CACHE_SIZE:
+            _DIGEST_CACHE.popitem(last=False)
+    return digest
+
+
+def _content_disposition(as_attachment, download_name):
+    kind = 'attachment' if as_attachment else 'inline'
+    if not download_name:
+        return kind
+    try:
+        download_name.encode('ascii')
+        return f'{kind}; filename="{download_name}"'
+    except UnicodeEncodeError:
+        fallback = download_name.encode('ascii', 'ignore').decode('ascii') or 'download'
+        return f"{kind}; filename=\"{fallback}\"; filename*=UTF-8''{quote(download_name)}"
+
+
+def _accel_uri(path):
+    """URI interna do nginx para o arquivo, ou None se estiver fora das raízes mapeadas."""
+    roots = (
+        (os.path.abspath(current_app.config['UPLOAD_FOLDER']), current_app.config['ACCEL_REDIRECT_UPLOADS']),
+        (os.path.abspath(current_app.static_folder), current_app.config['ACCEL_REDIRECT_STATIC']),
+    )
+    for root, prefix in roots:
+        if path == root or path.startswith(root + os.sep):
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            return prefix.rstrip('/') + '/' + quote(relative)
+    return None
+
+
+def _not_modified(etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        candidates = [tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')]
+        return etag in candidates or '*' in candidates
+    if_modified_since = parse_date(request.headers.get('If-Modified-Since'))
+    if if_modified_since:
+        return last_modified.replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def serve_file(path, mimetype=None, as_attachment=False, download_name=None, max_age=0, immutable=False):
+    """Responde com o arquivo local `path` (já autorizado pela rota).
+
+    max_age/immutable definem o Cache-Control; o padrão (0) obriga o
+    navegador a revalidar, o que com ETag forte custa só um 304.
+    """
+    path = os.path.abspath(path)
+
+    if immutable:
+        cache_control = 'public, max-age=31536000, immutable'
+    elif max_age:
+        cache_control = f'private, max-age={int(max_age)}'
+    else:
+        cache_control = 'private, no-cache'
+
+    backend = current_app.config.get('FILE_SERVING_BACKEND', 'flask')
+    if backend in ('nginx', 'sendfile'):
+        # O proxy lê o arquivo e cuida de ETag, Last-Modified, 304 e Range
+        headers = {
+            'Cache-Control': cache_control,
+            'Content-Disposition': _content_disposition(as_attachment, download_name or os.path.basename(path)),
+        }
+        mimetype = mimetype or _guess_mimetype(download_name or path)
+        if backend == 'nginx':
+            accel_uri = _accel_uri(path)
+            if accel_uri:
+                headers['X-Accel-Redirect'] = accel_uri
+                return Response(status=200, mimetype=mimetype, headers=headers)
+        else:
+            headers['X-Sendfile'] = path
+            return Response(status=200, mimetype=mimetype, headers=headers)
+
+    stat = os.stat(path)
+    etag = file_etag(path, stat)
+    last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+
+    if _not_modified(etag, last_modified):
+        return Response(status=304, headers={
+            'ETag': f'"{etag}"',
+            'Last-Modified': http_date(last_modified),
+            'Cache-Control': cache_control,
+            'Accept-Ranges': 'bytes',
+        })
+
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+        last_modified=last_modified,
+        max_age=None,
+    )
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def _guess_mimetype(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def serve_object_storage(key, mimetype=None, as_attachment=False, download_name=None):
+    """Serve um objeto do Object Storage a partir do cache local (app.utils.object_storage).
+
+    O objeto é baixado uma vez no primeiro acesso e daí em diante segue o
+    mesmo caminho de serve_file (ETag, 304, Range, X-Accel). Retorna None se
+    o storage estiver desativado ou o objeto não existir.
+    """
+    storage = get_object_storage()
+    if not storage:
+        return None
+    local_path = storage.fetch(key)
+    if not local_path:
+        return None
+    return serve_file(local_path, mimetype=mimetype, as_attachment=as_attachment,
+                      download_name=download_name or os.path.basename(key))
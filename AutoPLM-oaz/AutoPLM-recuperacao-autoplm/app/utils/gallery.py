@@ -0,0 +1,204 @@
+"""
+Galeria de desenhos técnicos: paginação por keyset, facetas em cache e
+miniaturas dos desenhos.
+
+A listagem é ordenada por (created_at DESC, id DESC) e cada página continua
+a partir do último card da anterior (cursor "after") ou volta a partir do
+primeiro (cursor "before"), sem OFFSET. O filtro "tem desenho" é escrito
+como (technical_drawing_url IS NOT NULL) = true para casar com o índice
+ix_specification_drawing_created (ver migrate_gallery_indexes.py).
+
+As listas de fornecedores/coleções dos filtros e o total de cada combinação
+de filtros ficam em cache por processo (GALLERY_FACETS_TTL segundos) em vez
+de um DISTINCT e um COUNT a cada página. invalidate_gallery_facets() limpa o
+cache do processo quando um desenho é gerado/trocado, uma ficha é excluída
+ou uma coleção muda; os outros workers se atualizam pelo TTL.
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+
+from sqlalchemy import and_, or_, true
+from sqlalchemy.orm import load_only
+from PIL import Image
+
+from app.extensions import db
+from app.models import Specification, Collection
+from app.utils.file_serving import file_sha256
+
+GALLERY_PAGE_SIZE = 12
+GALLERY_FACETS_TTL = int(os.environ.get('GALLERY_FACETS_TTL', '120'))
+DRAWING_THUMB_SIZE = 360
+
+_GALLERY_COLUMNS = (
+    Specification.id,
+    Specification.user_id,
+    Specification.created_at,
+    Specification.description,
+    Specification.ref_souq,
+    Specification.collection,
+    Specification.supplier,
+    Specification.technical_drawing_url,
+)
+
+_facets_cache = {}
+_FACETS_CACHE_MAX = 1024
+_facets_lock = threading.Lock()
+
+
+def has_drawing():
+    return Specification.technical_drawing_url.isnot(None) == true()
+
+
+def encode_cursor(spec):
+    created = spec.created_at.isoformat() if spec.created_at else ''
+    return f"{created}_{spec.id}"
+
+
+def decode_cursor(value):
+    """(created_at ou None, id) a partir do cursor da URL, ou None se inválido."""
+    if not value or '_' not in value:
+        return None
+    created, _, spec_id = value.rpartition('_')
+    try:
+        return (datetime.fromisoformat(created) if created else None), int(spec_id)
+    except ValueError:
+        return None
+
+
+def _nulls_first():
+    # PostgreSQL ordena NULL primeiro em DESC; SQLite, por último
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _keyset_condition(cursor, direction):
+    created_at, spec_id = cursor
+    nulls_first = _nulls_first()
+    if direction == 'after':
+        if created_at is None:
+            condition = and_(Specification.created_at.is_(None), Specification.id < spec_id)
+            return or_(condition, Specification.created_at.isnot(None)) if nulls_first else condition
+        condition = or_(Specification.created_at < created_at,
+                        and_(Specification.created_at == created_at, Specification.id < spec_id))
+        return condition if nulls_first else or_(condition, Specification.created_at.is_(None))
+
+    if created_at is None:
+        condition = and_(Specification.created_at.is_(None), Specification.id > spec_id)
+        return condition if nulls_first else or_(condition, Specification.created_at.isnot(None))
+    condition = or_(Specification.created_at > created_at,
+                    and_(Specification.created_at == created_at, Specification.id > spec_id))
+    return or_(condition, Specification.created_at.is_(None)) if nulls_first else condition
+
+
+def gallery_page(query, after=None, before=None, per_page=GALLERY_PAGE_SIZE):
+    """Página da galeria a partir de `query` (já filtrada).
+
+    Retorna dict com items, next_cursor e prev_cursor (None quando não há).
+    """
+    query = query.options(load_only(*_GALLERY_COLUMNS))
+    cursor_after = decode_cursor(after)
+    cursor_before = None if cursor_after else decode_cursor(before)
+
+    if cursor_before:
+        rows = query.filter(_keyset_condition(cursor_before, 'before')).order_by(
+            Specification.created_at.asc(), Specification.id.asc()).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = has_more, True
+    else:
+        if cursor_after:
+            query = query.filter(_keyset_condition(cursor_after, 'after'))
+        rows = query.order_by(
+            Specification.created_at.desc(), Specification.id.desc()).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_prev, has_next = bool(cursor_after), len(rows) > per_page
+
+    return {
+        'items': items,
+        'next_cursor': encode_cursor(items[-1]) if items and has_next else None,
+        'prev_cursor': encode_cursor(items[0]) if items and has_prev else None,
+    }
+
+
+def get_gallery_facets(user):
+    """(coleções, fornecedores) para os filtros, em cache por GALLERY_FACETS_TTL."""
+    key = 'admin' if user.is_admin else user.id
+    now = time.monotonic()
+    with _facets_lock:
+        cached = _facets_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+
+    collections_query = Collection.query.options(load_only(Collection.id, Collection.name))
+    suppliers_query = db.session.query(Specification.supplier).filter(
+        has_drawing(), Specification.supplier.isnot(None), Specification.supplier != '')
+    if not user.is_admin:
+        collections_query = collections_query.filter_by(user_id=user.id)
+        suppliers_query = suppliers_query.filter(Specification.user_id == user.id)
+
+    collections = [{'id': c.id, 'name': c.name} for c in collections_query.order_by(Collection.name).all()]
+    suppliers = [row[0] for row in suppliers_query.distinct().order_by(Specification.supplier).all()]
+
+    with _facets_lock:
+        _facets_cache[key] = (now + GALLERY_FACETS_TTL, collections, suppliers)
+    return collections, suppliers
+
+
+def get_gallery_total(user, query, filters):
+    """Total de fichas de `query` (já filtrada), em cache por usuário e filtros."""
+    key = ('total', 'admin' if user.is_admin else user.id, tuple(filters))
+    now = time.monotonic()
+    with _facets_lock:
+        cached = _facets_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    total = query.order_by(None).count()
+    with _facets_lock:
+        # Cada busca vira uma chave: descarta as vencidas antes de crescer demais
+        if len(_facets_cache) >= _FACETS_CACHE_MAX:
+            for stale in [k for k, v in _facets_cache.items() if v[0] <= now]:
+                del _facets_cache[stale]
+            if len(_facets_cache) >= _FACETS_CACHE_MAX:
+                _facets_cache.clear()
+        _facets_cache[key] = (now + GALLERY_FACETS_TTL, total)
+    return total
+
+
+def invalidate_gallery_facets():
+    with _facets_lock:
+        _facets_cache.clear()
+
+
+def drawing_version(drawing_url):
+    """Parâmetro de versão da miniatura: muda quando o desenho da ficha muda."""
+    return hashlib.sha256(drawing_url.encode('utf-8')).hexdigest()[:12] if drawing_url else ''
+
+
+def drawing_thumbnail_path(source_path, static_folder, size=DRAWING_THUMB_SIZE):
+    """Miniatura WebP do desenho, gerada uma vez por conteúdo (SHA-256 da origem)."""
+    digest = file_sha256(os.path.abspath(source_path))
+    thumb_dir = os.path.join(static_folder, 'drawings', 'thumbs', digest[:2])
+    thumb_path = os.path.join(thumb_dir, f"{digest}-{size}.webp")
+    if os.path.exists(thumb_path):
+        return thumb_path
+
+    os.makedirs(thumb_dir, exist_ok=True)
+    with Image.open(source_path) as img:
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.webp', dir=thumb_dir)
+        os.close(fd)
+        try:
+            img.save(tmp_path, 'WEBP', quality=80, method=4)
+            os.replace(tmp_path, thumb_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return thumb_path
@@ -0,0 +1,393 @@
+"""
+Jobs de importação em background (fichas, compras, banco de dados).
+
+O confirm de uma importação não grava mais nada dentro da requisição: ele
+move o payload do preview para o import_store, cria um ImportJob no banco e
+responde na hora com o job_id. Um dispatcher por processo (mesmo desenho da
+fila de desenhos) reivindica os jobs respeitando um limite GLOBAL de
+importações simultâneas e chama o handler registrado para o tipo do job.
+
+O handler processa o payload em blocos e chama ctx.save() a cada bloco:
+as linhas do bloco e o novo checkpoint são confirmados na mesma transação,
+e o save só vale se o job ainda pertence a esta execução. Assim:
+
+- um job sem heartbeat há IMPORT_JOB_TIMEOUT segundos (deploy, worker morto)
+  volta para a fila e recomeça do último checkpoint, sem duplicar linhas;
+- o cancelamento é só uma marca no job; o handler para no próximo bloco e
+  a limpeza registrada para o tipo (se houver) desfaz o que já foi gravado;
+- o status (linhas processadas, linhas/s, ETA) vem direto do ImportJob.
+
+Variáveis de ambiente:
+- IMPORT_MAX_CONCURRENCY: importações simultâneas no total (padrão 2)
+- IMPORT_JOB_CHUNK: linhas por bloco/checkpoint (padrão 2000)
+- IMPORT_JOB_TIMEOUT: segundos sem heartbeat até o job ser retomado (padrão 300)
+- IMPORT_POLL_INTERVAL: intervalo do dispatcher quando ocioso (padrão 2s)
+- IMPORT_QUEUE_AUTOSTART: sobe o dispatcher junto com o app (padrão 1), para
+  jobs na fila ou interrompidos num restart/deploy voltarem a andar sozinhos
+"""
+
+import os
+import json
+import uuid
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import update, func
+from sqlalchemy.orm import sessionmaker
+
+from app.extensions import db
+from app.models import ImportJob
+from app.utils.import_store import get_import_store
+
+IMPORT_MAX_CONCURRENCY = max(1, int(os.environ.get('IMPORT_MAX_CONCURRENCY', '2')))
+IMPORT_JOB_CHUNK = max(1, int(os.environ.get('IMPORT_JOB_CHUNK', '2000')))
+IMPORT_JOB_TIMEOUT = int(os.environ.get('IMPORT_JOB_TIMEOUT', '300'))
+IMPORT_POLL_INTERVAL = float(os.environ.get('IMPORT_POLL_INTERVAL', '2'))
+IMPORT_JOB_MAX_ATTEMPTS = 3
+IMPORT_QUEUE_AUTOSTART = os.environ.get('IMPORT_QUEUE_AUTOSTART', '1') == '1'
+
+# Payloads dos jobs ficam no import_store até o job terminar
+_PAYLOAD_KIND = 'import_jobs'
+_PAYLOAD_TTL = timedelta(days=2)
+
+# Chave do advisory lock (PostgreSQL) que serializa a reivindicação de jobs
+_CLAIM_LOCK_KEY = 0x1A9B0845
+
+_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_HANDLERS = {}  # {kind: (handler, on_cancel)}
+
+_dispatcher_lock = threading.Lock()
+_dispatcher_thread = None
+_dispatcher_pid = None
+_wake_event = threading.Event()
+_executor = None
+_local_running = 0
+_local_running_lock = threading.Lock()
+
+
+class ImportCancelled(Exception):
+    """O usuário pediu o cancelamento; o handler para no bloco atual."""
+
+
+class ImportJobLost(Exception):
+    """O job foi retomado por outra execução (heartbeat atrasado); esta para sem gravar."""
+
+
+def register_import_handler(kind, handler, on_cancel=None):
+    """Registra o processamento de um tipo de importação.
+
+    handler(payload, ctx) grava os blocos e devolve o dict de resultado.
+    on_cancel(job, checkpoint) desfaz as linhas já gravadas de um job cancelado.
+    """
+    _HANDLERS[kind] = (handler, on_cancel)
+
+
+class ImportJobContext:
+    """Estado de uma execução, passado ao handler."""
+
+    def __init__(self, job, run_id, chunk_size=IMPORT_JOB_CHUNK):
+        self.job_id = job.id
+        self.user_id = job.user_id
+        self.run_id = run_id
+        self.chunk_size = chunk_size
+        self.checkpoint = job.get_checkpoint()
+        self.result = job.get_result()
+        self.processed_rows = job.processed_rows or 0
+
+    def save(self, processed_rows, result=None, **checkpoint):
+        """Avança o checkpoint e confirma a transação (junto com o bloco gravado).
+
+        Levanta ImportJobLost se o job não pertence mais a esta execução (o
+        bloco é desfeito) e ImportCancelled se o cancelamento foi pedido.
+        """
+        self.checkpoint.update(checkpoint)
+        self.processed_rows = processed_rows
+        values = {
+            'checkpoint': json.dumps(self.checkpoint),
+            'processed_rows': processed_rows,
+            'heartbeat_at': datetime.utcnow(),
+        }
+        if result is not None:
+            self.result = result
+            values['result'] = json.dumps(result, ensure_ascii=False)
+        owned = db.session.execute(
+            update(ImportJob)
+            .where(ImportJob.id == self.job_id, ImportJob.status == 'running', ImportJob.worker == self.run_id)
+            .values(**values)
+        ).rowcount
+        if not owned:
+            db.session.rollback()
+            raise ImportJobLost(self.job_id)
+        db.session.commit()
+
+        cancel = db.session.query(ImportJob.cancel_requested).filter(ImportJob.id == self.job_id).scalar()
+        if cancel:
+            raise ImportCancelled(self.job_id)
+
+
+def _stale_cutoff():
+    return datetime.utcnow() - timedelta(seconds=IMPORT_JOB_TIMEOUT)
+
+
+def enqueue_import_job(kind, payload, user_id, app, total_rows=0, source_filename=None, checkpoint=None):
+    """Guarda o payload no import_store e cria o job na fila. Retorna o ImportJob.
+
+    `checkpoint` é o checkpoint inicial (ex.: a ficha alvo de um 'ficha_update').
+    Pode levantar import_store.PayloadTooLarge.
+    """
+    if kind not in _HANDLERS:
+        raise ValueError(f"Tipo de importação sem handler: {kind}")
+    token = get_import_store(app).put(_PAYLOAD_KIND, payload, _PAYLOAD_TTL)
+    job = ImportJob(
+        kind=kind, user_id=user_id, status='queued', payload_token=token,
+        source_filename=(source_filename or '')[:255] or None,
+        total_rows=total_rows, processed_rows=0, run_start_rows=0, attempts=0,
+        cancel_requested=False, checkpoint=json.dumps(checkpoint) if checkpoint else None,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    ensure_import_dispatcher(app)
+    _wake_event.set()
+    return job
+
+
+def prune_import_store(app=None):
+    """prune() do import_store sem descartar payloads de jobs na fila/rodando."""
+    tokens = db.session.query(ImportJob.payload_token).filter(
+        ImportJob.status.in_(ImportJob.ACTIVE_STATUSES),
+        ImportJob.payload_token.isnot(None),
+    ).all()
+    return get_import_store(app).prune(keep=[(_PAYLOAD_KIND, token) for token, in tokens])
+
+
+def get_import_job_for_user(job_id, user):
+    """ImportJob do usuário (admins veem todos), ou None."""
+    job = db.session.get(ImportJob, job_id)
+    if not job or (not user.is_admin and job.user_id != user.id):
+        return None
+    return job
+
+
+def cancel_import_job(job, app):
+    """Pede o cancelamento. Jobs na fila são cancelados (e limpos) na hora;
+    jobs rodando param no próximo bloco. Retorna True se havia algo a cancelar."""
+    if not job.is_active:
+        return False
+
+    db.session.execute(
+        update(ImportJob).where(ImportJob.id == job.id).values(cancel_requested=True)
+    )
+    cancelled_now = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job.id, ImportJob.status == 'queued')
+        .values(status='cancelled', finished_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+
+    if cancelled_now:
+        db.session.refresh(job)
+        # Job retomável que já tinha gravado blocos antes de voltar para a fila
+        if job.checkpoint:
+            _cleanup_cancelled(job)
+        get_import_store(app).delete(_PAYLOAD_KIND, job.payload_token)
+    return True
+
+
+def _cleanup_cancelled(job):
+    _, on_cancel = _HANDLERS.get(job.kind, (None, None))
+    if not on_cancel:
+        return
+    try:
+        on_cancel(job, job.get_checkpoint())
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ [IMPORT JOBS] Falha ao desfazer o job {job.id} cancelado: {e}")
+        traceback.print_exc()
+
+
+def ensure_import_dispatcher(app):
+    """Inicia (uma vez por processo) a thread que consome a fila de importações."""
+    global _dispatcher_thread, _dispatcher_pid, _executor
+    with _dispatcher_lock:
+        pid = os.getpid()
+        if _dispatcher_thread and _dispatcher_thread.is_alive() and _dispatcher_pid == pid:
+            return
+        _executor = ThreadPoolExecutor(max_workers=IMPORT_MAX_CONCURRENCY, thread_name_prefix='import-job')
+        _dispatcher_pid = pid
+        _dispatcher_thread = threading.Thread(
+            target=_dispatcher_loop, args=(app,), name='import-dispatcher', daemon=True
+        )
+        _dispatcher_thread.start()
+        print(f"📥 [IMPORT JOBS] Dispatcher iniciado ({_WORKER_ID}, máx {IMPORT_MAX_CONCURRENCY} simultâneos)")
+
+
+def start_import_queue(app):
+    """Sobe o dispatcher na inicialização do processo (run.py, post_fork do gunicorn)."""
+    if IMPORT_QUEUE_AUTOSTART:
+        ensure_import_dispatcher(app)
+        _wake_event.set()
+
+
+def _dispatcher_loop(app):
+    global _local_running
+    while True:
+        _wake_event.clear()
+        try:
+            with app.app_context():
+                _recover_stale_jobs()
+                while _local_slots_available():
+                    claimed = _claim_next_job()
+                    if not claimed:
+                        break
+                    with _local_running_lock:
+                        _local_running += 1
+                    _executor.submit(_run_job, *claimed, app)
+        except Exception as e:
+            print(f"❌ [IMPORT JOBS] Erro no dispatcher: {e}")
+            traceback.print_exc()
+        _wake_event.wait(IMPORT_POLL_INTERVAL)
+
+
+def _local_slots_available():
+    with _local_running_lock:
+        return _local_running < IMPORT_MAX_CONCURRENCY
+
+
+def _recover_stale_jobs():
+    """Jobs 'running' sem heartbeat (worker morto) voltam para a fila, até IMPORT_JOB_MAX_ATTEMPTS."""
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        stale = (ImportJob.status == 'running') & (ImportJob.heartbeat_at < _stale_cutoff())
+        failed = session.execute(
+            update(ImportJob)
+            .where(stale, ImportJob.attempts >= IMPORT_JOB_MAX_ATTEMPTS)
+            .values(status='error', error='Tempo limite excedido', finished_at=datetime.utcnow(), worker=None)
+        ).rowcount
+        requeued = session.execute(
+            update(ImportJob)
+            .where(stale)
+            .values(status='queued', worker=None)
+        ).rowcount
+        session.commit()
+        if requeued:
+            print(f"⚠️ [IMPORT JOBS] {requeued} job(s) interrompido(s) de volta à fila (retomam do checkpoint)")
+        if failed:
+            print(f"⚠️ [IMPORT JOBS] {failed} job(s) marcados como erro após {IMPORT_JOB_MAX_ATTEMPTS} tentativas")
+    finally:
+        session.close()
+
+
+def _claim_next_job():
+    """Reivindica o job mais antigo da fila se o limite global permitir.
+
+    Retorna (job_id, run_id) ou None. O run_id fica em ImportJob.worker e
+    identifica esta execução nos saves.
+    """
+    Session = sessionmaker(bind=db.engine)
+    session = Session()
+    try:
+        if session.bind.dialect.name == 'postgresql':
+            session.execute(db.text("SELECT pg_advisory_xact_lock(:key)"), {'key': _CLAIM_LOCK_KEY})
+
+        running = session.query(func.count(ImportJob.id)).filter(
+            ImportJob.status == 'running'
+        ).scalar() or 0
+        if running >= IMPORT_MAX_CONCURRENCY:
+            session.rollback()
+            return None
+
+        candidate = session.query(ImportJob.id).filter(
+            ImportJob.status == 'queued'
+        ).order_by(ImportJob.id).first()
+        if not candidate:
+            session.rollback()
+            return None
+
+        run_id = f"{_WORKER_ID}:{uuid.uuid4().hex[:8]}"
+        now = datetime.utcnow()
+        result = session.execute(
+            update(ImportJob)
+            .where(ImportJob.id == candidate.id, ImportJob.status == 'queued')
+            .values(
+                status='running', worker=run_id, started_at=now, heartbeat_at=now,
+                run_start_rows=func.coalesce(ImportJob.processed_rows, 0),
+                attempts=func.coalesce(ImportJob.attempts, 0) + 1,
+            )
+        )
+        session.commit()
+        return (candidate.id, run_id) if result.rowcount == 1 else None
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _finish_job(job_id, run_id, status, error=None, result=None):
+    """Fecha o job se ele ainda pertence a esta execução. Retorna True se fechou."""
+    values = {'status': status, 'error': error, 'finished_at': datetime.utcnow(), 'heartbeat_at': datetime.utcnow()}
+    if result is not None:
+        values['result'] = json.dumps(result, ensure_ascii=False)
+    try:
+        closed = db.session.execute(
+            update(ImportJob)
+            .where(ImportJob.id == job_id, ImportJob.status == 'running', ImportJob.worker == run_id)
+            .values(**values)
+        ).rowcount
+        db.session.commit()
+        return bool(closed)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error updating import job {job_id}: {e}")
+        return False
+
+
+def _run_job(job_id, run_id, app):
+    global _local_running
+    try:
+        with app.app_context():
+            job = db.session.get(ImportJob, job_id)
+            handler, _ = _HANDLERS.get(job.kind, (None, None))
+            store = get_import_store(app)
+            payload = store.get(_PAYLOAD_KIND, job.payload_token) if job.payload_token else None
+            if not handler or payload is None:
+                _finish_job(job_id, run_id, 'error',
+                            error='Dados da importação não encontrados (preview expirado). Refaça o upload.')
+                return
+
+            ctx = ImportJobContext(job, run_id)
+            print(f"📥 [IMPORT JOBS] Job {job_id} ({job.kind}) iniciado a partir da linha {ctx.processed_rows}")
+            try:
+                result = handler(payload, ctx)
+            except ImportJobLost:
+                print(f"⚠️ [IMPORT JOBS] Job {job_id} retomado por outra execução; esta foi interrompida")
+                return
+            except ImportCancelled:
+                db.session.rollback()
+                job = db.session.get(ImportJob, job_id)
+                _cleanup_cancelled(job)
+                if _finish_job(job_id, run_id, 'cancelled', result=job.get_result()):
+                    store.delete(_PAYLOAD_KIND, job.payload_token)
+                print(f"🛑 [IMPORT JOBS] Job {job_id} cancelado")
+                return
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ [IMPORT JOBS] Erro no job {job_id}: {e}")
+                traceback.print_exc()
+                _finish_job(job_id, run_id, 'error', error=str(e)[:1000])
+                return
+
+            if _finish_job(job_id, run_id, 'completed', result=result):
+                store.delete(_PAYLOAD_KIND, job.payload_token)
+            print(f"✅ [IMPORT JOBS] Job {job_id} concluído ({ctx.processed_rows} linhas)")
+    finally:
+        with _local_running_lock:
+            _local_running -= 1
+        _wake_event.set()
@@ -0,0 +1,241 @@
+"""
+Store compartilhado dos previews e jobs de importação (XLSX).
+
+O preview e o confirm de uma importação podem cair em workers diferentes do
+gunicorn, então o payload parseado não pode ficar num dict do processo. Cada
+entrada vira um arquivo pickle comprimido (gzip) em IMPORT_STORE_DIR, e
+qualquer worker da máquina lê o mesmo arquivo:
+
+- put(kind, payload, ttl) grava e devolve o token (ou regrava um token dado);
+- pop(kind, token) lê e remove. A entrada é renomeada antes da leitura, então
+  só um worker consegue consumir o token (o confirm não roda duas vezes);
+- a validade fica no mtime do arquivo; prune() remove as vencidas e, se o
+  diretório passar de IMPORT_STORE_MAX_MB, as que vencem primeiro (menos as
+  passadas em `keep`, como os payloads de jobs ainda na fila);
+- uma entrada acima de IMPORT_STORE_ENTRY_MAX_MB (já comprimida) é recusada
+  com PayloadTooLarge.
+
+Os arquivos só são escritos pelo próprio app (pickle não deve ler dados de
+fora); os tokens são validados antes de virar caminho.
+"""
+
+import os
+import re
+import gzip
+import time
+import uuid
+import pickle
+import tempfile
+import threading
+
+from flask import current_app
+
+_TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+_EXTENSION = '.pkl.gz'
+_STALE_TMP_SECONDS = 3600
+
+
+class PayloadTooLarge(Exception):
+    """O payload comprimido passa do limite por entrada."""
+
+
+class ImportStore:
+    """Entradas pickle+gzip por (kind, token) num diretório compartilhado. Thread-safe."""
+
+    def __init__(self, directory, max_bytes, max_entry_bytes):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._prune_lock = threading.Lock()
+
+    def _path(self, kind, token):
+        if not _TOKEN_RE.match(kind or '') or not _TOKEN_RE.match(token or ''):
+            return None
+        return os.path.join(self.directory, kind, token + _EXTENSION)
+
+    def put(self, kind, payload, ttl, token=None):
+        """Grava o payload (válido por `ttl`, um timedelta) e devolve o token."""
+        token = token or uuid.uuid4().hex
+        path = self._path(kind, token)
+        if not path:
+            raise ValueError(f"Token inválido: {token!r}")
+        data = gzip.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), compresslevel=1)
+        if len(data) > self.max_entry_bytes:
+            raise PayloadTooLarge(
+                f"Importação grande demais para o preview ({len(data) / 1024 / 1024:.0f}MB comprimidos, "
+                f"limite {self.max_entry_bytes / 1024 / 1024:.0f}MB)"
+            )
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            expires_at = time.time() + ttl.total_seconds()
+            os.utime(tmp_path, (expires_at, expires_at))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return token
+
+    def get(self, kind, token):
+        """Payload da entrada, ou None se não existir/tiver vencido."""
+        path = self._path(kind, token)
+        if not path:
+            return None
+        try:
+            if os.stat(path).st_mtime < time.time():
+                self._remove(path)
+                return None
+            with open(path, 'rb') as f:
+                return pickle.loads(gzip.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+
+    def touch(self, kind, token, ttl):
+        """Estende a validade da entrada para `ttl` a partir de agora. False se não existir/venceu."""
+        path = self._path(kind, token)
+        if not path:
+            return False
+        try:
+            if os.stat(path).st_mtime < time.time():
+                return False
+            expires_at = time.time() + ttl.total_seconds()
+            os.utime(path, (expires_at, expires_at))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def pop(self, kind, token):
+        """Lê e remove a entrada; entre workers concorrentes, só um recebe o payload."""
+        path = self._path(kind, token)
+        if not path:
+            return None
+        claimed = f"{os.path.join(os.path.dirname(path), '.tmp-')}{token}-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        try:
+            if os.stat(claimed).st_mtime < time.time():
+                return None
+            with open(claimed, 'rb') as f:
+                return pickle.loads(gzip.decompress(f.read()))
+        finally:
+            self._remove(claimed)
+
+    def delete(self, kind, token):
+        path = self._path(kind, token)
+        if path:
+            self._remove(path)
+
+    def entries(self, kind):
+        """Payloads válidos de um tipo (usado para listar jobs)."""
+        kind_dir = os.path.join(self.directory, kind)
+        if not os.path.isdir(kind_dir):
+            return []
+        payloads = []
+        for name in os.listdir(kind_dir):
+            if name.endswith(_EXTENSION) and not name.startswith('.tmp-'):
+                payload = self.get(kind, name[:-len(_EXTENSION)])
+                if payload is not None:
+                    payloads.append(payload)
+        return payloads
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((name.startswith('.tmp-'), stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def prune(self, keep=()):
+        """Remove as entradas vencidas e, acima do limite total, as que vencem primeiro.
+
+        Args:
+            keep: pares (kind, token) que o limite total não remove (só o vencimento)
+        """
+        if not self._prune_lock.acquire(blocking=False):
+            return 0
+        try:
+            kept = {self._path(kind, token) for kind, token in keep}
+            now = time.time()
+            live = []
+            removed = 0
+            for is_tmp, mtime, size, path in self._scan():
+                # Temporários: escrita/consumo em andamento (ou abandonado por um worker morto)
+                if is_tmp:
+                    try:
+                        if os.stat(path).st_ctime < now - _STALE_TMP_SECONDS:
+                            self._remove(path)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if mtime < now:
+                    self._remove(path)
+                    removed += 1
+                else:
+                    live.append((mtime, size, path))
+
+            total = sum(size for _, size, _ in live)
+            if total > self.max_bytes:
+                for _, size, path in sorted(live):
+                    if total <= self.max_bytes * 0.9:
+                        break
+                    if path in kept:
+                        continue
+                    self._remove(path)
+                    total -= size
+                    removed += 1
+                print(f"🧹 [IMPORT STORE] Limite de {self.max_bytes // 1024 // 1024}MB atingido, previews antigos removidos")
+            return removed
+        finally:
+            self._prune_lock.release()
+
+    def stats(self):
+        entries = [e for e in self._scan() if not e[0]]
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'max_entry_bytes': self.max_entry_bytes,
+        }
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_import_store(app=None):
+    """Store do processo (criado na primeira chamada)."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid == pid:
+        return _store
+
+    with _store_lock:
+        if _store_pid != pid:
+            config = (app or current_app).config
+            directory = config.get('IMPORT_STORE_DIR') or os.path.join(config['UPLOAD_FOLDER'], '.import_store')
+            _store = ImportStore(
+                directory,
+                max_bytes=int(config.get('IMPORT_STORE_MAX_MB', 2048)) * 1024 * 1024,
+                max_entry_bytes=int(config.get('IMPORT_STORE_ENTRY_MAX_MB', 256)) * 1024 * 1024,
+            )
+            _store_pid = pid
+    return _store
@@ -0,0 +1,289 @@
+"""
+Adaptador de Object Storage com cache local em disco.
+
+Desenhos legados (technical_drawing_url = 'technical-drawings/...') ficam
+no Replit Object Storage. Em vez de criar um Client por requisição e fazer
+exists() + download_as_bytes() a cada acesso, o processo mantém um único
+adaptador (conexão reutilizada) e um cache read-through em disco:
+
+- fetch(key) baixa o objeto uma única vez (download direto, sem exists())
+  para OBJECT_STORAGE_CACHE_DIR e devolve o caminho local;
+- acessos seguintes são servidos do disco (e pelo nginx, via serve_file);
+- o cache é limitado a OBJECT_STORAGE_CACHE_MAX_MB, com remoção LRU pelo
+  atime (renovado a cada acerto; o mtime é preservado para não invalidar o
+  ETag/Last-Modified de serve_file).
+
+OBJECT_STORAGE_BACKEND:
+- 'replit':     replit.object_storage.Client (padrão quando instalado)
+- 'filesystem': diretório OBJECT_STORAGE_ROOT, para testes e migrações locais
+- 'none':       desativado
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from flask import current_app
+
+try:
+    from replit.object_storage import Client
+except ImportError:
+    Client = None
+
+
+# Locks de download por faixa de chaves (hash % N): memória fixa, em vez de um lock por chave já vista
+_KEY_LOCK_STRIPES = 64
+
+
+class ObjectNotFound(Exception):
+    """O objeto não existe no storage."""
+
+
+class ReplitBackend:
+    name = 'replit'
+
+    def __init__(self):
+        self._client = Client()
+
+    def download_to_filename(self, key, path):
+        try:
+            self._client.download_to_filename(key, path)
+        except Exception as e:
+            # O SDK levanta erros diferentes conforme a versão (ObjectNotFoundError / NotFound)
+            if 'notfound' in type(e).__name__.lower():
+                raise ObjectNotFound(key) from e
+            raise
+
+    def upload_from_filename(self, key, path):
+        self._client.upload_from_filename(key, path)
+
+    def exists(self, key):
+        return self._client.exists(key)
+
+    def delete(self, key):
+        self._client.delete(key, ignore_missing=True)
+
+
+class FilesystemBackend:
+    """Object Storage simulado num diretório local (chave = caminho relativo)."""
+    name = 'filesystem'
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Chave inválida: {key}")
+        return path
+
+    def download_to_filename(self, key, path):
+        source = self._path(key)
+        if not os.path.isfile(source):
+            raise ObjectNotFound(key)
+        shutil.copyfile(source, path)
+
+    def upload_from_filename(self, key, path):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(target))
+        os.close(fd)
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class ObjectStorage:
+    """Backend + cache local LRU limitado por tamanho. Thread-safe."""
+
+    def __init__(self, backend, cache_dir, max_bytes):
+        self.backend = backend
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._key_locks = [threading.Lock() for _ in range(_KEY_LOCK_STRIPES)]
+        self._size_lock = threading.Lock()
+        self._cached_bytes = None
+        self.hits = 0
+        self.misses = 0
+
+    def cache_path(self, key):
+        extension = os.path.splitext(key)[1].lower()
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + extension)
+
+    def _key_lock(self, key):
+        return self._key_locks[hash(key) % _KEY_LOCK_STRIPES]
+
+    def fetch(self, key):
+        """Caminho local do objeto (baixado na primeira vez), ou None se não existir."""
+        local_path = self.cache_path(key)
+        if self._touch(local_path):
+            self.hits += 1
+            return local_path
+
+        # Um download por chave, mesmo com várias requisições simultâneas
+        with self._key_lock(key):
+            if self._touch(local_path):
+                self.hits += 1
+                return local_path
+
+            fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.cache_dir)
+            os.close(fd)
+            try:
+                self.backend.download_to_filename(key, tmp_path)
+                os.replace(tmp_path, local_path)
+            except ObjectNotFound:
+                return None
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        self.misses += 1
+        self._account(os.path.getsize(local_path))
+        return local_path
+
+    def upload_file(self, key, path):
+        self.backend.upload_from_filename(key, path)
+        self.invalidate(key)
+
+    def exists(self, key):
+        return os.path.exists(self.cache_path(key)) or self.backend.exists(key)
+
+    def delete(self, key):
+        self.backend.delete(key)
+        self.invalidate(key)
+
+    def invalidate(self, key):
+        try:
+            os.remove(self.cache_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _touch(self, path):
+        try:
+            stat = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith('.tmp-'):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+        return entries
+
+    def _account(self, added_bytes):
+        """Soma o novo arquivo ao total e remove os menos usados se passar do limite.
+
+        O total em memória é só uma estimativa (outros workers escrevem no
+        mesmo diretório); ao estourar o limite o diretório é relido.
+        """
+        with self._size_lock:
+            if self._cached_bytes is None:
+                self._cached_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._cached_bytes += added_bytes
+            if self._cached_bytes <= self.max_bytes:
+                return
+
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    evicted += 1
+                except FileNotFoundError:
+                    pass
+            self._cached_bytes = total
+            if evicted:
+                print(f"🧹 [OBJECT STORAGE] {evicted} arquivo(s) removidos do cache local")
+
+    def stats(self):
+        entries = self._scan()
+        return {
+            'backend': self.backend.name,
+            'files': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_storage = None
+_storage_pid = None
+_storage_lock = threading.Lock()
+
+
+def _build_backend(config):
+    backend = (config.get('OBJECT_STORAGE_BACKEND') or '').lower()
+    if not backend:
+        backend = 'replit' if Client else 'none'
+    if backend == 'none':
+        return None
+    if backend == 'filesystem':
+        root = config.get('OBJECT_STORAGE_ROOT') or os.path.join(config['UPLOAD_FOLDER'], '.object_storage_fs')
+        return FilesystemBackend(root)
+    if backend == 'replit':
+        if not Client:
+            print("⚠️ [OBJECT STORAGE] replit.object_storage não instalado; storage desativado")
+            return None
+        return ReplitBackend()
+    raise ValueError(f"OBJECT_STORAGE_BACKEND inválido: {backend}")
+
+
+def get_object_storage(app=None):
+    """Adaptador do processo (criado na primeira chamada), ou None se desativado."""
+    global _storage, _storage_pid
+    pid = os.getpid()
+    if _storage_pid == pid:
+        return _storage
+
+    with _storage_lock:
+        if _storage_pid != pid:
+            config = (app or current_app).config
+            storage = None
+            try:
+                backend = _build_backend(config)
+                if backend:
+                    cache_dir = config.get('OBJECT_STORAGE_CACHE_DIR') or os.path.join(config['UPLOAD_FOLDER'], '.object_storage')
+                    max_bytes = int(config.get('OBJECT_STORAGE_CACHE_MAX_MB', 1024)) * 1024 * 1024
+                    storage = ObjectStorage(backend, cache_dir, max_bytes)
+            except Exception as e:
+                print(f"❌ [OBJECT STORAGE] Falha ao iniciar o storage: {e}")
+            _storage = storage
+            _storage_pid = pid
+    return _storage
+
+
+def reset_object_storage():
+    """Descarta o adaptador atual (usado por scripts que trocam de backend)."""
+    global _storage, _storage_pid
+    with _storage_lock:
+        _storage = None
+        _storage_pid = None
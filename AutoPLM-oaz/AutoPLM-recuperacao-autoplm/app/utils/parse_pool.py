@@ -0,0 +1,143 @@
+"""
+Parse de vários arquivos em paralelo, cada um num processo próprio.
+
+Usado no preview dos bancos de dados (vários XLSX por upload): em vez de
+parsear um arquivo depois do outro na thread do request, cada arquivo vai
+para um processo filho e os resultados saem na ordem em que terminam.
+
+- até PARSE_POOL_WORKERS processos ao mesmo tempo;
+- PARSE_POOL_TIMEOUT segundos por arquivo: o processo que passar do tempo é
+  morto e o arquivo volta com erro, sem travar os outros;
+- PARSE_POOL_MEMORY_MB de memória extra por processo (RLIMIT_AS, só Linux):
+  um arquivo que estoure o limite falha sozinho (MemoryError) em vez de
+  derrubar o worker do gunicorn.
+
+Os filhos saem de um forkserver, não de fork direto do worker: o worker do
+gunicorn já tem threads (dispatchers, executores, requests) e um fork dele
+copiaria locks presos por elas (logging, pool do banco, zip do openpyxl),
+travando o filho. O forkserver é um processo novo, de uma thread só, que
+importa uma vez este módulo e o do parser (sem criar o app) e faz o fork de
+cada filho a partir dele, então cada arquivo ainda custa só um fork. Sem
+forkserver (Windows), spawn. O filho só roda o parser e devolve o resultado
+pelo pipe.
+
+Com forkserver/spawn o filho reimporta o script de entrada como
+__mp_main__: por isso run.py/app.py só criam o app sob
+`if __name__ == '__main__'` (com gunicorn o script é o do próprio gunicorn).
+
+    for index, result, error in iter_parallel(parse_banco_xlsx, paths):
+        ...
+"""
+
+import os
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PARSE_POOL_WORKERS = int(os.environ.get('PARSE_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+PARSE_POOL_TIMEOUT = float(os.environ.get('PARSE_POOL_TIMEOUT', 120))
+PARSE_POOL_MEMORY_MB = int(os.environ.get('PARSE_POOL_MEMORY_MB', 1024))
+
+
+def _get_context(func):
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    # Só vale antes do forkserver do processo subir (o primeiro parser usado fica pré-importado)
+    context.set_forkserver_preload([__name__, func.__module__])
+    return context
+
+
+def _address_space_bytes():
+    """Memória virtual atual do processo (Linux), base para o limite extra."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _limit_memory(extra_bytes):
+    if resource is None or not extra_bytes:
+        return
+    limit = _address_space_bytes() + extra_bytes
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+
+def _run_child(conn, func, arg, memory_bytes):
+    try:
+        _limit_memory(memory_bytes)
+        try:
+            conn.send(('ok', func(arg)))
+        except MemoryError:
+            conn.send(('error', f'Limite de memória ({memory_bytes // 1024 // 1024}MB) excedido'))
+        except Exception as e:
+            conn.send(('error', str(e) or e.__class__.__name__))
+    finally:
+        conn.close()
+
+
+def iter_parallel(func, args, max_workers=None, timeout=None, memory_mb=None):
+    """
+    Roda func(arg) para cada arg em processos separados.
+
+    Gera (índice, resultado, erro) na ordem de término; erro é None quando deu
+    certo. `func` precisa ser uma função de módulo (vai por pickle). Se o
+    gerador for fechado antes do fim, os processos restantes são mortos.
+    """
+    max_workers = max(1, max_workers or PARSE_POOL_WORKERS)
+    timeout = timeout or PARSE_POOL_TIMEOUT
+    memory_bytes = (memory_mb if memory_mb is not None else PARSE_POOL_MEMORY_MB) * 1024 * 1024
+    context = _get_context(func)
+
+    pending = list(enumerate(args))
+    pending.reverse()
+    running = {}  # conn -> (index, process, deadline)
+    try:
+        while pending or running:
+            while pending and len(running) < max_workers:
+                index, arg = pending.pop()
+                recv_conn, send_conn = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=_run_child, args=(send_conn, func, arg, memory_bytes), daemon=True,
+                )
+                process.start()
+                send_conn.close()
+                running[recv_conn] = (index, process, time.monotonic() + timeout)
+
+            next_deadline = min(deadline for _, _, deadline in running.values())
+            for conn in wait(list(running), timeout=max(0, next_deadline - time.monotonic())):
+                index, process, _ = running.pop(conn)
+                try:
+                    status, value = conn.recv()
+                except (EOFError, OSError):
+                    process.join()
+                    status, value = 'error', f'Processo de leitura encerrado (código {process.exitcode})'
+                conn.close()
+                process.join()
+                if status == 'ok':
+                    yield index, value, None
+                else:
+                    yield index, None, value
+
+            now = time.monotonic()
+            for conn, (index, process, deadline) in list(running.items()):
+                if deadline <= now:
+                    running.pop(conn)
+                    process.kill()
+                    process.join()
+                    conn.close()
+                    yield index, None, f'Tempo limite de {timeout:.0f}s excedido'
+    finally:
+        for conn, (_, process, _) in running.items():
+            process.kill()
+            process.join()
+            conn.close()
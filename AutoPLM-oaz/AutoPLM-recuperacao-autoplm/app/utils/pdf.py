@@ -3,8 +3,11 @@ import io
 import base64
 import re
 import shutil
+import threading
+from collections import OrderedDict
 import PyPDF2
 from PIL import Image
+from app.utils.assets import store_asset
 
 
 def _get_static_dir():
@@ -198,6 +201,120 @@ def extract_text_from_image(image_path):
     return text
 
 
+def _decode_pdf_image(xobj, page_num, obj_num):
+    """Decodifica um XObject de imagem do PDF em PIL.Image (None se não suportado)."""
+    width = xobj['/Width']
+    height = xobj['/Height']
+    size = (width, height)
+    data = xobj.get_data()
+    filter_raw = xobj.get('/Filter', None)
+    if hasattr(filter_raw, 'get_object'):
+        filter_value = filter_raw.get_object()
+    else:
+        filter_value = filter_raw
+    if isinstance(filter_value, list):
+        filters = filter_value
+    elif filter_value:
+        filters = [filter_value]
+    else:
+        filters = []
+
+    colorspace_raw = xobj.get('/ColorSpace', None)
+
+    if hasattr(colorspace_raw, 'get_object'):
+        colorspace = colorspace_raw.get_object()
+    else:
+        colorspace = colorspace_raw
+
+    try:
+        if '/DCTDecode' in filters or '/JPXDecode' in filters:
+            img = Image.open(io.BytesIO(data))
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+        elif colorspace == '/DeviceRGB':
+            img = Image.frombytes('RGB', size, data)
+        elif colorspace == '/DeviceGray':
+            img = Image.frombytes('L', size, data)
+        elif colorspace == '/DeviceCMYK':
+            img = Image.frombytes('CMYK', size, data)
+            img = img.convert('RGB')
+        elif isinstance(colorspace, list):
+            colorspace_name = colorspace[0] if colorspace else None
+
+            if colorspace_name == '/Indexed':
+                try:
+                    base_colorspace = colorspace[1] if len(colorspace) > 1 else '/DeviceRGB'
+                    hival = int(colorspace[2]) if len(colorspace) > 2 else 255
+                    lookup_raw = colorspace[3] if len(colorspace) > 3 else None
+
+                    if lookup_raw and hasattr(lookup_raw, 'get_object'):
+                        lookup = lookup_raw.get_object()
+                    else:
+                        lookup = lookup_raw
+
+                    if hasattr(lookup, 'get_data'):
+                        lookup_data = lookup.get_data()
+                    elif isinstance(lookup, bytes):
+                        lookup_data = lookup
+                    elif hasattr(lookup, 'original_bytes'):
+                        lookup_data = lookup.original_bytes
+                    elif isinstance(lookup, str):
+                        lookup_data = lookup.encode('latin-1')
+                    else:
+                        try:
+                            lookup_data = bytes(lookup)
+                        except:
+                            print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: Lookup type desconhecido ({type(lookup)})")
+                            img = Image.frombytes('P', size, data)
+                            img = img.convert('RGB')
+
+                    img = Image.frombytes('P', size, data)
+
+                    if base_colorspace == '/DeviceRGB' or (isinstance(base_colorspace, str) and 'RGB' in base_colorspace):
+                        palette = []
+                        for i in range(min(256, hival + 1)):
+                            idx = i * 3
+                            if idx + 2 < len(lookup_data):
+                                palette.extend([lookup_data[idx], lookup_data[idx + 1], lookup_data[idx + 2]])
+                            else:
+                                palette.extend([0, 0, 0])
+                        while len(palette) < 768:
+                            palette.extend([0, 0, 0])
+                        img.putpalette(palette)
+                        img = img.convert('RGB')
+                    else:
+                        img = img.convert('RGB')
+
+                except Exception as indexed_error:
+                    print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: Indexed ColorSpace - erro na paleta ({indexed_error})")
+                    return None
+
+            elif colorspace_name == '/ICCBased':
+                try:
+                    img = Image.frombytes('RGB', size, data)
+                except:
+                    print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: ICCBased ColorSpace não suportado")
+                    return None
+            else:
+                try:
+                    img = Image.frombytes('RGB', size, data)
+                except:
+                    print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: ColorSpace complexo ({colorspace_name})")
+                    return None
+        else:
+            try:
+                img = Image.frombytes('RGB', size, data)
+            except:
+                print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: ColorSpace desconhecido ({colorspace})")
+                return None
+
+    except Exception as color_error:
+        print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: Erro ao processar ColorSpace - {color_error}")
+        return None
+
+    return img
+
+
 def extract_images_from_pdf(pdf_path):
     images_data = []
     try:
@@ -213,114 +330,11 @@ def extract_images_from_pdf(pdf_path):
                     for obj_num, obj in enumerate(xObject):
                         if xObject[obj]['/Subtype'] == '/Image':
                             try:
+                                img = _decode_pdf_image(xObject[obj], page_num, obj_num)
+                                if img is None:
+                                    continue
                                 width = xObject[obj]['/Width']
                                 height = xObject[obj]['/Height']
-                                size = (width, height)
-                                data = xObject[obj].get_data()
-                                filter_raw = xObject[obj].get('/Filter', None)
-                                if hasattr(filter_raw, 'get_object'):
-                                    filter_value = filter_raw.get_object()
-                                else:
-                                    filter_value = filter_raw
-                                if isinstance(filter_value, list):
-                                    filters = filter_value
-                                elif filter_value:
-                                    filters = [filter_value]
-                                else:
-                                    filters = []
-
-                                colorspace_raw = xObject[obj].get('/ColorSpace', None)
-
-                                if hasattr(colorspace_raw, 'get_object'):
-                                    colorspace = colorspace_raw.get_object()
-                                else:
-                                    colorspace = colorspace_raw
-
-                                try:
-                                    if '/DCTDecode' in filters or '/JPXDecode' in filters:
-                                        img = Image.open(io.BytesIO(data))
-                                        if img.mode not in ('RGB', 'L'):
-                                            img = img.convert('RGB')
-                                    elif colorspace == '/DeviceRGB':
-                                        img = Image.frombytes('RGB', size, data)
-                                    elif colorspace == '/DeviceGray':
-                                        img = Image.frombytes('L', size, data)
-                                    elif colorspace == '/DeviceCMYK':
-                                        img = Image.frombytes('CMYK', size, data)
-                                        img = img.convert('RGB')
-                                    elif isinstance(colorspace, list):
-                                        colorspace_name = colorspace[0] if colorspace else None
-
-                                        if colorspace_name == '/Indexed':
-                                            try:
-                                                base_colorspace = colorspace[1] if len(colorspace) > 1 else '/DeviceRGB'
-                                                hival = int(colorspace[2]) if len(colorspace) > 2 else 255
-                                                lookup_raw = colorspace[3] if len(colorspace) > 3 else None
-
-                                                if lookup_raw and hasattr(lookup_raw, 'get_object'):
-                                                    lookup = lookup_raw.get_object()
-                                                else:
-                                                    lookup = lookup_raw
-
-                                                if hasattr(lookup, 'get_data'):
-                                                    lookup_data = lookup.get_data()
-                                                elif isinstance(lookup, bytes):
-                                                    lookup_data = lookup
-                                                elif hasattr(lookup, 'original_bytes'):
-                                                    lookup_data = lookup.original_bytes
-                                                elif isinstance(lookup, str):
-                                                    lookup_data = lookup.encode('latin-1')
-                                                else:
-                                                    try:
-                                                        lookup_data = bytes(lookup)
-                                                    except:
-                                                        print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: Lookup type desconhecido ({type(lookup)})")
-                                                        img = Image.frombytes('P', size, data)
-                                                        img = img.convert('RGB')
-
-                                                img = Image.frombytes('P', size, data)
-
-                                                if base_colorspace == '/DeviceRGB' or (isinstance(base_colorspace, str) and 'RGB' in base_colorspace):
-                                                    palette = []
-                                                    for i in range(min(256, hival + 1)):
-                                                        idx = i * 3
-                                                        if idx + 2 < len(lookup_data):
-                                                            palette.extend([lookup_data[idx], lookup_data[idx + 1], lookup_data[idx + 2]])
-                                                        else:
-                                                            palette.extend([0, 0, 0])
-                                                    while len(palette) < 768:
-                                                        palette.extend([0, 0, 0])
-                                                    img.putpalette(palette)
-                                                    img = img.convert('RGB')
-                                                else:
-                                                    img = img.convert('RGB')
-
-                                            except Exception as indexed_error:
-                                                print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: Indexed ColorSpace - erro na paleta ({indexed_error})")
-                                                continue
-
-                                        elif colorspace_name == '/ICCBased':
-                                            try:
-                                                img = Image.frombytes('RGB', size, data)
-                                            except:
-                                                print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: ICCBased ColorSpace não suportado")
-                                                continue
-                                        else:
-                                            try:
-                                                img = Image.frombytes('RGB', size, data)
-                                            except:
-                                                print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: ColorSpace complexo ({colorspace_name})")
-                                                continue
-                                    else:
-                                        try:
-                                            img = Image.frombytes('RGB', size, data)
-                                        except:
-                                            print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: ColorSpace desconhecido ({colorspace})")
-                                            continue
-
-                                except Exception as color_error:
-                                    print(f"  ⚠️ Página {page_num + 1}, Imagem {obj_num + 1}: Erro ao processar ColorSpace - {color_error}")
-                                    continue
 
                                 buffered = io.BytesIO()
                                 img.save(buffered, format="PNG")
@@ -360,10 +374,154 @@ def extract_images_from_pdf(pdf_path):
     return images_data
 
 
-def generate_image_thumbnail(image_path, spec_id):
+class PdfImageSet:
+    """Imagens de um PDF ordenadas da maior para a menor, decodificadas sob demanda.
+
+    Na abertura só os metadados (/Width, /Height) são lidos; cada imagem é
+    decodificada e codificada em PNG apenas quando pedida, uma única vez.
+    Imagens que não puderem ser decodificadas são puladas, como em
+    extract_images_from_pdf.
+    """
+
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+        self._lock = threading.Lock()
+        self._entries = []
+        with open(pdf_path, 'rb') as file:
+            self._reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
+
+        for page_num, page in enumerate(self._reader.pages):
+            if '/Resources' in page and '/XObject' in page['/Resources']:
+                xObject = page['/Resources']['/XObject'].get_object()
+                for obj_num, obj in enumerate(xObject):
+                    try:
+                        xobj = xObject[obj]
+                        if xobj['/Subtype'] != '/Image':
+                            continue
+                        width = xobj['/Width']
+                        height = xobj['/Height']
+                    except Exception as e:
+                        print(f"  ✗ Erro lendo imagem da página {page_num + 1}: {e}")
+                        continue
+                    self._entries.append({
+                        'xobj': xobj,
+                        'page': page_num + 1,
+                        'obj_num': obj_num,
+                        'width': width,
+                        'height': height,
+                        'area': width * height,
+                        'png_bytes': None,
+                        'failed': False,
+                    })
+
+        self._entries.sort(key=lambda x: x['area'], reverse=True)
+        print(f"📄 PDF {os.path.basename(pdf_path)}: {len(self._entries)} imagem(ns) encontrada(s) (decodificação sob demanda)")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _encode(self, entry):
+        if entry['png_bytes'] is None and not entry['failed']:
+            try:
+                img = _decode_pdf_image(entry['xobj'], entry['page'] - 1, entry['obj_num'])
+                if img is None:
+                    entry['failed'] = True
+                else:
+                    buffered = io.BytesIO()
+                    img.save(buffered, format="PNG")
+                    entry['png_bytes'] = buffered.getvalue()
+                    print(f"  ✓ Página {entry['page']}, Imagem {entry['obj_num'] + 1}: {entry['width']}x{entry['height']}px (área: {entry['area']:,}px²)")
+            except Exception as e:
+                print(f"  ✗ Erro extraindo imagem da página {entry['page']}: {e}")
+                entry['failed'] = True
+        return entry['png_bytes']
+
+    def images(self, limit=None):
+        """Até `limit` imagens (maior primeiro) no formato de extract_images_from_pdf,
+        com 'png_bytes' além de 'base64'."""
+        result = []
+        with self._lock:
+            for entry in self._entries:
+                if limit is not None and len(result) >= limit:
+                    break
+                png_bytes = self._encode(entry)
+                if png_bytes is None:
+                    continue
+                if 'base64' not in entry:
+                    entry['base64'] = base64.b64encode(png_bytes).decode('utf-8')
+                result.append({
+                    'base64': entry['base64'],
+                    'png_bytes': png_bytes,
+                    'page': entry['page'],
+                    'width': entry['width'],
+                    'height': entry['height'],
+                    'area': entry['area'],
+                })
+        return result
+
+    def largest(self):
+        images = self.images(limit=1)
+        return images[0] if images else None
+
+
+# Cache por worker só das imagens já renderizadas (PNG + base64), nunca do PDF:
+# limitado pelo total de bytes, não pelo número de arquivos
+PDF_IMAGE_CACHE_BYTES = int(os.environ.get('PDF_IMAGE_CACHE_MB', '64')) * 1024 * 1024
+_PDF_IMAGE_CACHE = OrderedDict()  # chave → (imagens, completo, bytes)
+_pdf_image_cache_bytes = 0
+_pdf_image_cache_lock = threading.Lock()
+
+
+def _images_size(images):
+    return sum(len(img['png_bytes']) + len(img['base64']) for img in images)
+
+
+def get_pdf_images(pdf_path, limit=None):
+    """Até `limit` imagens do PDF (maior primeiro), no formato de PdfImageSet.images().
+
+    O resultado fica em cache por arquivo (caminho + mtime + tamanho); o PDF
+    em si é aberto só quando as imagens não estão no cache. Retorna [] se o
+    PDF não puder ser aberto.
+    """
+    global _pdf_image_cache_bytes
     try:
-        import uuid
+        stat = os.stat(pdf_path)
+    except OSError:
+        return []
+    key = (os.path.realpath(pdf_path), stat.st_mtime_ns, stat.st_size)
+
+    with _pdf_image_cache_lock:
+        cached = _PDF_IMAGE_CACHE.get(key)
+        if cached is not None:
+            images, complete, _ = cached
+            if complete or (limit is not None and len(images) >= limit):
+                _PDF_IMAGE_CACHE.move_to_end(key)
+                return images[:limit] if limit is not None else list(images)
 
+    try:
+        images = PdfImageSet(pdf_path).images(limit=limit)
+    except Exception as e:
+        print(f"Error processing PDF for images: {e}")
+        return []
+
+    # Menos imagens que o limite = o PDF inteiro já foi percorrido
+    complete = limit is None or len(images) < limit
+    size = _images_size(images)
+    if size <= PDF_IMAGE_CACHE_BYTES:
+        with _pdf_image_cache_lock:
+            previous = _PDF_IMAGE_CACHE.pop(key, None)
+            if previous is not None:
+                _pdf_image_cache_bytes -= previous[2]
+            _PDF_IMAGE_CACHE[key] = (images, complete, size)
+            _pdf_image_cache_bytes += size
+            while _pdf_image_cache_bytes > PDF_IMAGE_CACHE_BYTES:
+                _, (_, _, evicted) = _PDF_IMAGE_CACHE.popitem(last=False)
+                _pdf_image_cache_bytes -= evicted
+    return list(images)
+
+
+def generate_image_thumbnail(image_path, spec_id):
+    try:
         print(f"\n{'='*80}")
         print(f"GERANDO THUMBNAIL DA IMAGEM: {image_path}")
         print(f"{'='*80}")
@@ -373,16 +531,9 @@ def generate_image_thumbnail(image_path, spec_id):
         max_size = (800, 800)
         img.thumbnail(max_size, Image.Resampling.LANCZOS)
 
-        static_dir = _get_static_dir()
-        thumbnails_dir = os.path.join(static_dir, 'thumbnails')
-        os.makedirs(thumbnails_dir, exist_ok=True)
-
-        thumbnail_filename = f"thumbnail_{spec_id}_{uuid.uuid4().hex[:8]}.png"
-        thumbnail_path = os.path.join(thumbnails_dir, thumbnail_filename)
-
-        img.save(thumbnail_path, 'PNG')
-
-        thumbnail_url = f"/static/thumbnails/{thumbnail_filename}"
+        buffered = io.BytesIO()
+        img.save(buffered, 'PNG')
+        thumbnail_url = store_asset(buffered.getvalue(), 'png', _get_static_dir())
         print(f"✓ Thumbnail de imagem gerado com sucesso: {thumbnail_url}")
         print(f"{'='*80}\n")
 
@@ -398,7 +549,6 @@ def generate_image_thumbnail(image_path, spec_id):
 def generate_pdf_thumbnail(pdf_path, spec_id):
     try:
         import pymupdf as fitz
-        import uuid
 
         print(f"\n{'='*80}")
         print(f"GERANDO THUMBNAIL DO PDF: {pdf_path}")
@@ -415,17 +565,10 @@ def generate_pdf_thumbnail(pdf_path, spec_id):
         mat = fitz.Matrix(2.0, 2.0)
         pix = page.get_pixmap(matrix=mat)
 
-        static_dir = _get_static_dir()
-        thumbnails_dir = os.path.join(static_dir, 'thumbnails')
-        os.makedirs(thumbnails_dir, exist_ok=True)
-
-        thumbnail_filename = f"thumbnail_{spec_id}_{uuid.uuid4().hex[:8]}.png"
-        thumbnail_path = os.path.join(thumbnails_dir, thumbnail_filename)
-
-        pix.save(thumbnail_path)
+        png_bytes = pix.tobytes('png')
         doc.close()
 
-        thumbnail_url = f"/static/thumbnails/{thumbnail_filename}"
+        thumbnail_url = store_asset(png_bytes, 'png', _get_static_dir())
         print(f"✓ Thumbnail gerado com sucesso: {thumbnail_url}")
         print(f"{'='*80}\n")
 
@@ -0,0 +1,180 @@
+"""
+Ingestão de uploads em uma única passada.
+
+O arquivo enviado é copiado para o disco em blocos enquanto o SHA-256 é
+calculado, o tipo real é identificado pelos primeiros bytes (magic bytes) e
+o tamanho é contado. Tipo não permitido ou tamanho acima do limite
+interrompem a cópia na hora (UploadRejected) e o arquivo parcial é apagado.
+Nada é lido inteiro para a memória do worker, e o hash fica disponível para
+deduplicação/cache sem reler o arquivo.
+
+    ingest_upload(file, upload_folder, filename, allowed_kinds=SPEC_UPLOAD_KINDS)
+    with ingest_to_tempfile(file, allowed_kinds=XLSX_KINDS) as upload:
+        parse_excel(upload.path)
+"""
+
+import os
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+from flask import current_app, request
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+SPEC_UPLOAD_KINDS = ('pdf', 'jpeg', 'png', 'gif', 'webp')
+XLSX_KINDS = ('xlsx',)
+
+# Extensões aceitas para cada tipo identificado
+_KIND_EXTENSIONS = {
+    'pdf': ('pdf',),
+    'jpeg': ('jpg', 'jpeg'),
+    'png': ('png',),
+    'gif': ('gif',),
+    'webp': ('webp',),
+    'xlsx': ('xlsx', 'xlsm'),
+}
+
+
+class UploadRejected(ValueError):
+    """Upload recusado (tipo, extensão ou tamanho); a mensagem vai para o usuário."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IngestedFile:
+    """Arquivo já gravado em disco, com hash, tamanho e tipo identificados."""
+
+    def __init__(self, path, original_filename, sha256, size, kind):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.original_filename = original_filename
+        self.sha256 = sha256
+        self.size = size
+        self.kind = kind
+
+    def to_dict(self):
+        return {
+            'filename': self.filename,
+            'original_filename': self.original_filename,
+            'sha256': self.sha256,
+            'size': self.size,
+            'kind': self.kind,
+        }
+
+
+def sniff_kind(head):
+    """Tipo do arquivo pelos primeiros bytes, ou None se desconhecido."""
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'PK\x03\x04'):
+        # XLSX é um ZIP; o conteúdo é validado pelo openpyxl ao abrir
+        return 'xlsx'
+    return None
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+
+
+def _max_bytes_for(kinds):
+    config = current_app.config
+    if set(kinds) <= set(XLSX_KINDS):
+        return int(config.get('IMPORT_MAX_FILE_MB', 50)) * 1024 * 1024
+    return int(config.get('UPLOAD_MAX_FILE_MB', 200)) * 1024 * 1024
+
+
+def reject_oversized_request(allowed_kinds=XLSX_KINDS):
+    """Recusa pelo Content-Length antes de o corpo multipart ser lido.
+
+    Para rotas de um arquivo só; deve ser chamada antes de acessar
+    request.files. Retorna a mensagem de erro ou None. A folga de 64KB cobre
+    os campos e cabeçalhos do formulário.
+    """
+    max_bytes = _max_bytes_for(allowed_kinds)
+    length = request.content_length
+    if length is not None and length > max_bytes + 64 * 1024:
+        return f'Arquivo excede {max_bytes // (1024 * 1024)}MB.'
+    return None
+
+
+def _copy_stream(file, target, allowed_kinds, max_bytes):
+    """Copia `file.stream` para o arquivo aberto `target`; retorna (sha256, tamanho, tipo)."""
+    original = file.filename or ''
+    digest = hashlib.sha256()
+    size = 0
+    kind = None
+
+    stream = file.stream
+    if hasattr(stream, 'seek'):
+        try:
+            stream.seek(0)
+        except (OSError, ValueError):
+            pass
+
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if kind is None:
+            kind = sniff_kind(chunk[:16])
+            if kind not in allowed_kinds:
+                raise UploadRejected(f'"{original}": conteúdo não é um formato aceito ({", ".join(allowed_kinds)}).')
+            if _extension(original) not in _KIND_EXTENSIONS[kind]:
+                raise UploadRejected(f'"{original}": extensão não corresponde ao conteúdo ({kind}).')
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadRejected(f'"{original}" excede {max_bytes // (1024 * 1024)}MB.', status_code=413)
+        digest.update(chunk)
+        target.write(chunk)
+
+    if size == 0:
+        raise UploadRejected(f'"{original}": arquivo vazio.')
+    return digest.hexdigest(), size, kind
+
+
+def ingest_upload(file, dest_dir, filename, allowed_kinds=SPEC_UPLOAD_KINDS, max_bytes=None):
+    """Grava o upload em dest_dir/filename em uma passada e retorna um IngestedFile.
+
+    A escrita vai para um temporário no mesmo diretório e só é renomeada no
+    final, então um upload recusado ou interrompido nunca deixa arquivo
+    parcial com o nome definitivo.
+    """
+    max_bytes = max_bytes or _max_bytes_for(allowed_kinds)
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', dir=dest_dir)
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            sha256, size, kind = _copy_stream(file, target, allowed_kinds, max_bytes)
+        final_path = os.path.join(dest_dir, filename)
+        os.replace(tmp_path, final_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return IngestedFile(final_path, file.filename, sha256, size, kind)
+
+
+@contextmanager
+def ingest_to_tempfile(file, allowed_kinds=XLSX_KINDS, max_bytes=None):
+    """Como ingest_upload, mas num temporário apagado ao sair do bloco (para parsers)."""
+    max_bytes = max_bytes or _max_bytes_for(allowed_kinds)
+    suffix = '.' + _extension(file.filename) if _extension(file.filename) else ''
+    fd, tmp_path = tempfile.mkstemp(prefix='autoplm-upload-', suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            sha256, size, kind = _copy_stream(file, target, allowed_kinds, max_bytes)
+        yield IngestedFile(tmp_path, file.filename, sha256, size, kind)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,255 @@
+"""
+Pré-processamento de imagens antes das chamadas ao GPT-4o Vision.
+
+Etapas aplicadas a cada imagem:
+1. recorte da região da peça (remove fundo uniforme nas bordas)
+2. redimensionamento para a resolução ótima de tiles do modo "high"
+3. re-encode em JPEG/WebP com qualidade ajustada
+
+No modo "high" a OpenAI reduz a imagem para caber em 2048x2048, depois para
+que o menor lado tenha 768px, e cobra 85 + 170 tokens por tile de 512x512.
+Enviar a imagem já nesse tamanho evita upload e tokens desperdiçados.
+"""
+
+import os
+import io
+import math
+import base64
+import hashlib
+from PIL import Image, ImageChops
+
+VISION_MAX_SIDE = 2048
+VISION_SHORT_SIDE = 768
+VISION_TILE_SIZE = 512
+VISION_BASE_TOKENS = 85
+VISION_TILE_TOKENS = 170
+
+# Quantas imagens (as maiores) vão para cada análise de visão
+VISION_MAX_IMAGES = 3
+
+# Redução máxima aceita (fator de escala) para eliminar tiles excedentes
+VISION_MIN_TILE_SCALE = 0.75
+
+VISION_IMAGE_FORMAT = os.environ.get('VISION_IMAGE_FORMAT', 'JPEG').upper()
+VISION_IMAGE_QUALITY = int(os.environ.get('VISION_IMAGE_QUALITY', '85'))
+
+_FORMAT_MIMETYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'PNG': 'image/png',
+}
+
+
+def estimate_vision_tokens(width, height, detail='high'):
+    """Estima os tokens de imagem cobrados pelo GPT-4o para um dado tamanho."""
+    if not width or not height:
+        return 0
+    if detail == 'low':
+        return VISION_BASE_TOKENS
+
+    w, h = _fit_high_detail(width, height)
+    tiles = math.ceil(w / VISION_TILE_SIZE) * math.ceil(h / VISION_TILE_SIZE)
+    return VISION_BASE_TOKENS + VISION_TILE_TOKENS * tiles
+
+
+def _fit_high_detail(width, height):
+    scale = min(1.0, VISION_MAX_SIDE / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, VISION_SHORT_SIDE / min(w, h))
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+
+def _tile_optimal_size(width, height):
+    """Tamanho final: o que a API usaria, reduzido até um múltiplo de 512px
+    quando isso elimina uma fileira/coluna de tiles com perda pequena de
+    resolução (escala >= VISION_MIN_TILE_SCALE)."""
+    w, h = _fit_high_detail(width, height)
+
+    best = (w, h)
+    best_tokens = estimate_vision_tokens(w, h)
+    for dim in (w, h):
+        overflow = dim % VISION_TILE_SIZE
+        if dim <= VISION_TILE_SIZE or overflow == 0:
+            continue
+        scale = (dim - overflow) / dim
+        if scale < VISION_MIN_TILE_SCALE:
+            continue
+        cand = (max(1, int(w * scale)), max(1, int(h * scale)))
+        cand_tokens = estimate_vision_tokens(*cand)
+        if cand_tokens < best_tokens or (cand_tokens == best_tokens and cand[0] * cand[1] > best[0] * best[1]):
+            best, best_tokens = cand, cand_tokens
+    return best
+
+
+def _to_rgb(img):
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def crop_to_garment(img, threshold=24, margin=0.03, min_area_ratio=0.10):
+    """Recorta a imagem para a região que difere do fundo (cor dos cantos).
+
+    Se o recorte detectado for pequeno demais (ruído) ou cobrir a imagem
+    inteira, a imagem original é mantida.
+    """
+    width, height = img.size
+    corners = [
+        img.getpixel((0, 0)),
+        img.getpixel((width - 1, 0)),
+        img.getpixel((0, height - 1)),
+        img.getpixel((width - 1, height - 1)),
+    ]
+    background_color = tuple(sorted(channel)[len(channel) // 2] for channel in zip(*corners))
+
+    diff = ImageChops.difference(img, Image.new('RGB', img.size, background_color))
+    mask = diff.convert('L').point(lambda x: 255 if x > threshold else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return img
+
+    left, top, right, bottom = bbox
+    if (right - left) * (bottom - top) < width * height * min_area_ratio:
+        return img
+
+    pad_x = int(width * margin)
+    pad_y = int(height * margin)
+    bbox = (
+        max(0, left - pad_x),
+        max(0, top - pad_y),
+        min(width, right + pad_x),
+        min(height, bottom + pad_y),
+    )
+    if bbox == (0, 0, width, height):
+        return img
+    return img.crop(bbox)
+
+
+def _decode_image_input(image):
+    """Aceita data URL, base64 puro ou bytes; retorna os bytes da imagem."""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if isinstance(image, str):
+        if image.startswith('data:'):
+            image = image.split(',', 1)[1]
+        return base64.b64decode(image)
+    raise TypeError(f"Tipo de imagem não suportado: {type(image)}")
+
+
+def vision_image_hash(images, limit=VISION_MAX_IMAGES):
+    """SHA-256 do conteúdo (bytes decodificados) das imagens enviadas à visão.
+
+    Data URL e base64 puro da mesma imagem geram o mesmo hash.
+    """
+    digest = hashlib.sha256()
+    for image in images[:limit]:
+        try:
+            raw = _decode_image_input(image)
+        except Exception:
+            raw = str(image).encode('utf-8')
+        digest.update(hashlib.sha256(raw).digest())
+    return digest.hexdigest()
+
+
+def prepare_image_for_vision(image, detail='high', image_format=None, quality=None, crop=True):
+    """Prepara uma imagem para o GPT-4o Vision.
+
+    Retorna dict com 'data_url' e as métricas antes/depois
+    ('original_bytes', 'optimized_bytes', 'original_tokens', 'optimized_tokens').
+    """
+    image_format = (image_format or VISION_IMAGE_FORMAT).upper()
+    quality = quality or VISION_IMAGE_QUALITY
+    if image_format not in _FORMAT_MIMETYPES:
+        image_format = 'JPEG'
+
+    raw = _decode_image_input(image)
+    with Image.open(io.BytesIO(raw)) as src:
+        src.load()
+        original_size = src.size
+        img = _to_rgb(src)
+
+    if crop:
+        img = crop_to_garment(img)
+
+    if detail == 'low':
+        target = (min(img.width, VISION_TILE_SIZE), min(img.height, VISION_TILE_SIZE))
+        scale = min(target[0] / img.width, target[1] / img.height)
+        target = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+    else:
+        target = _tile_optimal_size(img.width, img.height)
+    if target != img.size:
+        img = img.resize(target, Image.Resampling.LANCZOS)
+
+    buffered = io.BytesIO()
+    save_kwargs = {'quality': quality}
+    if image_format == 'JPEG':
+        save_kwargs['optimize'] = True
+    elif image_format == 'WEBP':
+        save_kwargs['method'] = 4
+    elif image_format == 'PNG':
+        save_kwargs = {'optimize': True}
+    img.save(buffered, format=image_format, **save_kwargs)
+    optimized = buffered.getvalue()
+
+    encoded = base64.b64encode(optimized).decode('utf-8')
+    return {
+        'data_url': f"data:{_FORMAT_MIMETYPES[image_format]};base64,{encoded}",
+        'original_size': original_size,
+        'optimized_size': img.size,
+        'original_bytes': len(raw),
+        'optimized_bytes': len(optimized),
+        'original_tokens': estimate_vision_tokens(*original_size, detail=detail),
+        'optimized_tokens': estimate_vision_tokens(*img.size, detail=detail),
+    }
+
+
+def prepare_images_for_vision(images, detail='high', limit=VISION_MAX_IMAGES):
+    """Prepara até `limit` imagens e imprime o relatório de economia.
+
+    Imagens que falharem no pré-processamento são enviadas como vieram.
+    Retorna (lista de data URLs, dict de estatísticas agregadas).
+    """
+    data_urls = []
+    stats = {
+        'images': 0,
+        'original_bytes': 0,
+        'optimized_bytes': 0,
+        'original_tokens': 0,
+        'optimized_tokens': 0,
+    }
+
+    for image in images[:limit]:
+        try:
+            prepared = prepare_image_for_vision(image, detail=detail)
+        except Exception as e:
+            print(f"  ⚠️ Pré-processamento da imagem falhou, enviando original: {e}")
+            if isinstance(image, str) and image.startswith('data:'):
+                data_urls.append(image)
+            elif isinstance(image, str):
+                data_urls.append(f"data:image/png;base64,{image}")
+            continue
+
+        data_urls.append(prepared['data_url'])
+        stats['images'] += 1
+        for key in ('original_bytes', 'optimized_bytes', 'original_tokens', 'optimized_tokens'):
+            stats[key] += prepared[key]
+        print(
+            f"  ✓ Imagem {prepared['original_size'][0]}x{prepared['original_size'][1]} → "
+            f"{prepared['optimized_size'][0]}x{prepared['optimized_size'][1]} "
+            f"({prepared['original_bytes']:,} → {prepared['optimized_bytes']:,} bytes, "
+            f"~{prepared['original_tokens']} → ~{prepared['optimized_tokens']} tokens)"
+        )
+
+    stats['bytes_saved'] = stats['original_bytes'] - stats['optimized_bytes']
+    stats['tokens_saved'] = stats['original_tokens'] - stats['optimized_tokens']
+    if stats['images']:
+        print(
+            f"  [VISION] {stats['images']} imagem(ns) otimizada(s): "
+            f"{stats['bytes_saved']:,} bytes e ~{stats['tokens_saved']} tokens economizados"
+        )
+    return data_urls, stats
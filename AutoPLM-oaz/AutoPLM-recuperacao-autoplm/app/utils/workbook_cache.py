@@ -0,0 +1,136 @@
+"""
+Cache de workbooks XLSX enviados uma vez e parseados por aba.
+
+No fluxo de Compras o usuário escolhe a aba depois do upload. Em vez de
+reenviar e reabrir o mesmo XLSX a cada troca de aba:
+
+- /compras/import/sheets grava o arquivo no import_store, identificado pelo
+  SHA-256 do conteúdo (workbook_id), e uma entrada pequena à parte com o
+  nome do arquivo e os nomes das abas;
+- o preview de uma aba recebe só workbook_id + sheet_name. Na primeira vez o
+  conteúdo do XLSX é lido (uma vez) e a aba é decodificada em colunas
+  (SheetColumns, arrays NumPy), que também ficam no store; voltar a uma aba
+  já vista lê só os metadados e as colunas, sem tocar no XLSX.
+
+As entradas são por usuário (o token combina user_id e hash) e vencem em
+WORKBOOK_CACHE_TTL_MINUTES. Workbook vencido → WorkbookExpired, e o cliente
+envia o arquivo de novo.
+
+    workbook_id, sheet_names = cache_workbook(user.id, upload)
+    columns, sheet_names = load_sheet_columns(user.id, workbook_id, 'TESTE PLM')
+"""
+
+import os
+import re
+import hashlib
+import logging
+from datetime import timedelta
+
+from app.utils.import_store import get_import_store, PayloadTooLarge
+from app.utils.xlsx_reader import read_sheet_names, read_sheet_columns
+
+logger = logging.getLogger(__name__)
+
+WORKBOOK_CACHE_TTL = timedelta(minutes=int(os.environ.get('WORKBOOK_CACHE_TTL_MINUTES', 60)))
+
+_WORKBOOK_KIND = 'workbooks'
+_META_KIND = 'workbook_meta'
+_SHEET_KIND = 'workbook_sheets'
+_WORKBOOK_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class WorkbookExpired(Exception):
+    """O workbook não está (mais) no cache; o arquivo precisa ser reenviado."""
+
+
+def _workbook_token(user_id, workbook_id):
+    return f'{int(user_id)}-{workbook_id[:48]}'
+
+
+def _sheet_token(user_id, workbook_id, sheet_name):
+    sheet_hash = hashlib.sha256(sheet_name.encode('utf-8')).hexdigest()[:12]
+    return f'{int(user_id)}-{workbook_id[:40]}-{sheet_hash}'
+
+
+def cache_workbook(user_id, upload):
+    """
+    Grava o XLSX recebido (IngestedFile) no cache do usuário.
+
+    Returns:
+        (workbook_id, sheet_names) — o mesmo arquivo enviado de novo reaproveita a entrada
+    """
+    store = get_import_store()
+    workbook_id = upload.sha256
+    token = _workbook_token(user_id, workbook_id)
+    meta = store.get(_META_KIND, token)
+    # Reenvio do mesmo arquivo: renova o prazo das duas entradas (o preview/confirm vem em seguida)
+    if (meta is not None and meta['workbook_id'] == workbook_id
+            and store.touch(_WORKBOOK_KIND, token, WORKBOOK_CACHE_TTL)
+            and store.touch(_META_KIND, token, WORKBOOK_CACHE_TTL)):
+        return workbook_id, meta['sheet_names']
+
+    sheet_names = read_sheet_names(upload.path)
+    with open(upload.path, 'rb') as f:
+        content = f.read()
+    # Conteúdo antes dos metadados: metadados presentes = conteúdo gravado
+    store.put(_WORKBOOK_KIND, {'workbook_id': workbook_id, 'content': content},
+              WORKBOOK_CACHE_TTL, token=token)
+    store.put(_META_KIND, {
+        'workbook_id': workbook_id,
+        'filename': upload.original_filename,
+        'sheet_names': sheet_names,
+    }, WORKBOOK_CACHE_TTL, token=token)
+    return workbook_id, sheet_names
+
+
+def _get_meta(user_id, workbook_id):
+    if not _WORKBOOK_ID_RE.match(workbook_id or ''):
+        raise WorkbookExpired('Workbook inválido')
+    meta = get_import_store().get(_META_KIND, _workbook_token(user_id, workbook_id))
+    if meta is None or meta['workbook_id'] != workbook_id:
+        raise WorkbookExpired('Workbook expirado; envie o arquivo novamente')
+    return meta
+
+
+def _get_content(user_id, workbook_id):
+    cached = get_import_store().get(_WORKBOOK_KIND, _workbook_token(user_id, workbook_id))
+    if cached is None or cached['workbook_id'] != workbook_id:
+        raise WorkbookExpired('Workbook expirado; envie o arquivo novamente')
+    return cached['content']
+
+
+def workbook_info(user_id, workbook_id):
+    """(filename, sheet_names) do workbook em cache (WorkbookExpired se não existir)."""
+    meta = _get_meta(user_id, workbook_id)
+    return meta['filename'], meta['sheet_names']
+
+
+def load_sheet_columns(user_id, workbook_id, sheet_name):
+    """
+    Aba `sheet_name` do workbook em forma colunar.
+
+    Returns:
+        (SheetColumns ou None se a aba não existir, sheet_names)
+    """
+    store = get_import_store()
+    sheet_token = _sheet_token(user_id, workbook_id, sheet_name)
+    cached = store.get(_SHEET_KIND, sheet_token)
+    if cached is not None and cached['workbook_id'] == workbook_id and cached['sheet_name'] == sheet_name:
+        return cached['columns'], cached['sheet_names']
+
+    sheet_names = _get_meta(user_id, workbook_id)['sheet_names']
+    if sheet_name not in sheet_names:
+        return None, sheet_names
+
+    columns = read_sheet_columns(_get_content(user_id, workbook_id), sheet_name)
+    try:
+        store.put(_SHEET_KIND, {
+            'workbook_id': workbook_id,
+            'sheet_name': sheet_name,
+            'sheet_names': sheet_names,
+            'columns': columns,
+        }, WORKBOOK_CACHE_TTL, token=sheet_token)
+    except PayloadTooLarge as exc:
+        # Só perde o atalho: a próxima troca para esta aba lê o XLSX de novo
+        logger.warning('Aba "%s" não coube no cache de workbooks: %s', sheet_name, exc)
+    return columns, sheet_names
@@ -0,0 +1,245 @@
+"""
+Leitura de XLSX em streaming, compartilhada pelos parsers de importação
+(fichas, compras, banco de dados Fluxogama).
+
+- read_sheet_names(): nomes das abas direto do manifesto (xl/workbook.xml),
+  sem abrir nenhuma planilha;
+- open_sheet(): abre a aba com openpyxl read_only=True e entrega as linhas
+  como tuplas, uma de cada vez (iter_rows(values_only=True));
+- detect_header(): procura o cabeçalho nas primeiras N linhas e devolve o
+  restante das linhas ainda como iterador.
+
+Os valores são normalizados como o pandas.read_excel fazia antes (número
+inteiro gravado como float vira int, células vazias/erros/"N/A" viram None,
+linhas vazias no fim da aba são descartadas), então os parsers continuam
+vendo os mesmos dados. A memória de pico acompanha a largura da linha, não o
+tamanho do arquivo.
+
+    with open_sheet(path, preferred=('SOUQ',)) as sheet:
+        scan = detect_header(sheet.rows, score_row, max_rows=200)
+        for row in scan.rest:
+            ...
+
+Para o parser colunar das fichas, iter_frames() agrupa as linhas em blocos
+de DataFrame, então só um bloco de células brutas fica em memória por vez.
+
+read_sheet_columns() decodifica uma aba inteira em colunas (SheetColumns,
+arrays NumPy), o formato guardado no cache de workbooks: reparsear a aba
+depois não abre o XLSX de novo.
+"""
+
+import io
+import zipfile
+import posixpath
+from contextlib import contextmanager
+from itertools import chain, islice
+from xml.etree import ElementTree
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+# Textos que o pandas (read_excel) tratava como vazio, mais os erros de fórmula
+_NA_VALUES = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+    '#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!',
+})
+
+FRAME_CHUNK_ROWS = 5000
+
+
+def _as_source(source):
+    """bytes → BytesIO; caminho ou arquivo aberto são usados como estão."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def read_sheet_names(source):
+    """Nomes das abas, na ordem do arquivo, lidos só do manifesto do pacote."""
+    with zipfile.ZipFile(_as_source(source)) as zf:
+        workbook_path = 'xl/workbook.xml'
+        try:
+            rels = ElementTree.fromstring(zf.read('_rels/.rels'))
+            for rel in rels:
+                if rel.get('Type', '').endswith('/officeDocument'):
+                    workbook_path = posixpath.normpath(rel.get('Target', workbook_path).lstrip('/'))
+                    break
+        except KeyError:
+            pass
+        root = ElementTree.fromstring(zf.read(workbook_path))
+    return [el.get('name') for el in root.iter() if _local_name(el.tag) == 'sheet']
+
+
+def normalize_row(row):
+    """Tupla da linha com as células normalizadas e sem as células vazias do fim."""
+    end = len(row)
+    while end and (row[end - 1] is None or row[end - 1] == ''):
+        end -= 1
+    values = []
+    for value in row[:end]:
+        if isinstance(value, float):
+            if value.is_integer():
+                value = int(value)
+        elif isinstance(value, str) and value in _NA_VALUES:
+            value = None
+        values.append(value)
+    return tuple(values)
+
+
+def _is_empty(row):
+    return all(value is None for value in row)
+
+
+def iter_sheet_rows(worksheet):
+    """Linhas normalizadas da aba. Linhas vazias só saem se houver dado depois delas."""
+    pending_empty = 0
+    for raw in worksheet.iter_rows(values_only=True):
+        row = normalize_row(raw)
+        if _is_empty(row):
+            pending_empty += 1
+            continue
+        for _ in range(pending_empty):
+            yield ()
+        pending_empty = 0
+        yield row
+
+
+class XlsxSheet:
+    """Aba aberta em streaming: `name`, `sheet_names` e o iterador `rows`."""
+
+    def __init__(self, name, sheet_names, rows):
+        self.name = name
+        self.sheet_names = sheet_names
+        self.rows = rows
+
+
+@contextmanager
+def open_sheet(source, sheet_name=None, preferred=()):
+    """Abre a aba `sheet_name` (ou a primeira de `preferred` que existir, ou a primeira).
+
+    Levanta KeyError se `sheet_name` não existir.
+    """
+    wb = openpyxl.load_workbook(_as_source(source), read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet_names = wb.sheetnames
+        if not sheet_name:
+            sheet_name = next((name for name in preferred if name in sheet_names), sheet_names[0])
+        if sheet_name not in sheet_names:
+            raise KeyError(sheet_name)
+        yield XlsxSheet(sheet_name, sheet_names, iter_sheet_rows(wb[sheet_name]))
+    finally:
+        wb.close()
+
+
+class HeaderScan:
+    """Resultado de detect_header.
+
+    head:  linhas lidas durante a busca (até max_rows)
+    index: posição do cabeçalho em head, ou None
+    rest:  iterador das linhas depois do cabeçalho (ou depois de head, se não achou)
+    """
+
+    def __init__(self, head, index, rest):
+        self.head = head
+        self.index = index
+        self.rest = rest
+
+    @property
+    def width(self):
+        return max((len(row) for row in self.head), default=0)
+
+    def rows_after(self, index):
+        return chain(self.head[index + 1:], self.rest)
+
+
+def detect_header(rows, score, max_rows):
+    """Procura o cabeçalho nas primeiras `max_rows` linhas.
+
+    `score(row)` devolve um número (maior = mais provável) ou None quando a
+    linha não pode ser cabeçalho; em empate vale a primeira linha.
+    """
+    rows = iter(rows)
+    head = list(islice(rows, max_rows))
+    best_index = None
+    best_score = None
+    for idx, row in enumerate(head):
+        row_score = score(row)
+        if row_score is not None and (best_score is None or row_score > best_score):
+            best_score = row_score
+            best_index = idx
+    scan = HeaderScan(head, best_index, rows)
+    if best_index is not None:
+        scan.rest = scan.rows_after(best_index)
+    return scan
+
+
+def iter_frames(rows, first_index=0, chunk_size=FRAME_CHUNK_ROWS):
+    """Blocos de até `chunk_size` linhas como DataFrame (dtype object).
+
+    O índice continua a numeração das linhas da aba a partir de
+    `first_index`; cada bloco tem a largura da sua linha mais longa.
+    """
+    rows = iter(rows)
+    start = first_index
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        frame = pd.DataFrame(chunk, dtype=object)
+        frame.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield frame
+
+
+class SheetColumns:
+    """Aba já normalizada, guardada por coluna (arrays NumPy dtype object).
+
+    rows() devolve as mesmas tuplas que open_sheet().rows entregaria.
+    """
+
+    def __init__(self, name, columns, nrows):
+        self.name = name
+        self.columns = columns
+        self.nrows = nrows
+
+    @classmethod
+    def from_rows(cls, name, rows):
+        columns = []
+        nrows = 0
+        for row in rows:
+            for idx in range(len(columns), len(row)):
+                columns.append([None] * nrows)
+            for idx, column in enumerate(columns):
+                column.append(row[idx] if idx < len(row) else None)
+            nrows += 1
+        arrays = []
+        for values in columns:
+            array = np.empty(nrows, dtype=object)
+            array[:] = values
+            arrays.append(array)
+        return cls(name, arrays, nrows)
+
+    def rows(self):
+        if not self.columns:
+            for _ in range(self.nrows):
+                yield ()
+            return
+        for row in zip(*self.columns):
+            end = len(row)
+            while end and row[end - 1] is None:
+                end -= 1
+            yield row[:end]
+
+
+def read_sheet_columns(source, sheet_name):
+    """Decodifica a aba `sheet_name` inteira em SheetColumns (KeyError se não existir)."""
+    with open_sheet(source, sheet_name=sheet_name) as sheet:
+        return SheetColumns.from_rows(sheet.name, sheet.rows)
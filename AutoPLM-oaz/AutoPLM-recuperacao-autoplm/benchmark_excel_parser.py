@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark do parser de fichas XLSX (app.utils.excel_parser.parse_excel).
+
+Gera uma planilha proforma sintética (cabeçalho + N linhas com números em
+formato brasileiro, células vazias, linhas inválidas e refs duplicadas) e
+mede separadamente:
+
+- parse_excel completo (leitura em streaming + parsing colunar)
+- referência: leitura via pandas.ExcelFile + parsing (parse_sheet_frame)
+- materialização do preview (50 itens) e de todos os itens (insert final)
+
+Com --memory, mede também o pico de memória (tracemalloc) de cada caminho.
+
+    python benchmark_excel_parser.py --rows 50000
+    python benchmark_excel_parser.py --rows 50000 --xlsx /tmp/proforma_50k.xlsx --memory --output bench.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+HEADER = [
+    'IMG REF', 'ITEM NO REF SUPPLIER', 'MATERIAL COMPOSITION PERCENTAGE', 'COLOR',
+    'PORTUGUESE DESCRIPTION', 'NCM', 'LENGTH CM', 'WIDTH CM', 'HEIGHT CM',
+    'UNIT NET WEIGHT KG', 'MOQ', 'ORDER QTY', 'INNER PACKING PCS', 'OUTER PACKING PCS',
+    'CBM', 'UNIT PRICE', 'TOTAL AMOUNT', 'PREÇO R$', 'FAMILIA', 'GRUPO', 'SUB GRUPO', 'OBS',
+]
+
+
+def _number(rng):
+    value = round(rng.uniform(0, 5000), 2)
+    kind = rng.random()
+    if kind < 0.6:
+        return value
+    if kind < 0.8:
+        return f"{value:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    if kind < 0.9:
+        return str(value)
+    return rng.choice([None, '', '-', 'n/a'])
+
+
+def build_workbook(rows, seed=42):
+    """XLSX sintético (bytes) no layout da aba SOUQ."""
+    import openpyxl
+
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('SOUQ')
+    ws.append(['PROFORMA INVOICE', None, 'PI-BENCH-001'])
+    ws.append(['SUPPLIER NO', None, 'SUP-42'])
+    ws.append(['ORDER DATE', None, '2026-01-15'])
+    ws.append([])
+    ws.append(HEADER)
+
+    for i in range(rows):
+        if rng.random() < 0.01:
+            ws.append([])
+            continue
+        ref = None if rng.random() < 0.02 else f"REF-{rng.randint(1, rows)}"
+        ws.append([
+            f"IMG{i}", ref, '100% COTTON', rng.choice(['AZUL', 'PRETO', 'OFF WHITE', None]),
+            f"PRODUTO {i}", '6109.10.00',
+            _number(rng), _number(rng), _number(rng), _number(rng),
+            rng.choice([100, 200, '300', 250.0, None]), rng.choice([500, '1.000', 1200.0, 12.5, None]),
+            rng.choice([10, 12, None]), rng.choice([50, 100.0, None]),
+            _number(rng), _number(rng), _number(rng), _number(rng),
+            'VESTUARIO', 'MALHA', 'BLUSA', rng.choice([None, '', 'obs livre']),
+        ])
+
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def _measured(fn, memory):
+    """(resultado, segundos, pico de memória em MB ou None)."""
+    if not memory:
+        result, seconds = _timed(fn)
+        return result, seconds, None
+    tracemalloc.start()
+    try:
+        result, seconds = _timed(fn)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, round(peak / 1024 / 1024, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do parser de fichas XLSX')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--xlsx', help='grava (ou reutiliza, se existir) a planilha gerada neste caminho')
+    parser.add_argument('--memory', action='store_true', help='mede o pico de memória (mais lento)')
+    parser.add_argument('--output', help='grava o relatório em JSON')
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+    from app.utils.excel_parser import parse_excel, parse_sheet_frame
+
+    if args.xlsx and os.path.exists(args.xlsx):
+        print(f"📄 Reutilizando {args.xlsx}")
+        with open(args.xlsx, 'rb') as fh:
+            data = fh.read()
+    else:
+        print(f"🧪 Gerando planilha com {args.rows} linhas...")
+        data, build_s = _timed(build_workbook, args.rows, args.seed)
+        print(f"   gerada em {build_s:.1f}s ({len(data) / 1024 / 1024:.1f}MB)")
+        if args.xlsx:
+            with open(args.xlsx, 'wb') as fh:
+                fh.write(data)
+
+    def pandas_path():
+        with pd.ExcelFile(io.BytesIO(data), engine='openpyxl') as xl:
+            df_raw = xl.parse(sheet_name='SOUQ', header=None)
+        return parse_sheet_frame(df_raw, 'SOUQ')
+
+    result, stream_s, stream_mb = _measured(lambda: parse_excel(data), args.memory)
+    del result
+    result, pandas_s, pandas_mb = _measured(pandas_path, args.memory)
+    del result
+    result = parse_excel(data)
+    items = result['items']
+    preview, preview_s = _timed(lambda: items[:50])
+    all_items, materialize_s = _timed(lambda: sum(1 for _ in items))
+
+    rows = args.rows
+    report = {
+        'rows': rows,
+        'valid': len(items),
+        'invalid': result['counts_summary']['invalid'],
+        'duplicated_refs': result['counts_summary']['duplicated_refs'],
+        'streaming_seconds': round(stream_s, 3),
+        'streaming_rows_per_second': round(rows / stream_s) if stream_s else None,
+        'streaming_peak_mb': stream_mb,
+        'pandas_seconds': round(pandas_s, 3),
+        'pandas_peak_mb': pandas_mb,
+        'preview_seconds': round(preview_s, 4),
+        'materialize_all_seconds': round(materialize_s, 3),
+    }
+
+    def _mb(value):
+        return f" | pico {value}MB" if value is not None else ''
+
+    print("\n" + "=" * 60)
+    print(f"Linhas:                {rows} ({report['valid']} válidas, {report['invalid']} inválidas)")
+    print(f"parse_excel (stream):  {stream_s:.2f}s ({report['streaming_rows_per_second']} linhas/s){_mb(stream_mb)}")
+    print(f"pandas + parsing:      {pandas_s:.2f}s{_mb(pandas_mb)}")
+    print(f"Preview (50 itens):    {preview_s * 1000:.1f}ms")
+    print(f"Materializar todos:    {materialize_s:.2f}s ({all_items} itens)")
+    print("=" * 60)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+        print(f"💾 Relatório salvo em {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
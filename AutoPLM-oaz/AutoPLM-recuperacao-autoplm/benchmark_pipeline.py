@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmark do pipeline de processamento de fichas (advance_spec_processing).
+
+Cria Specifications a partir dos arquivos de exemplo (PDF/imagens) em
+--uploads, processa todas com N workers e reporta vazão e latência por ficha.
+Para rodar offline e sem custo, aponte o cliente para o stub local:
+
+    python openai_stub_server.py --port 8089 --quiet &
+    python benchmark_pipeline.py --uploads ../../uploads --repeat 5 --workers 4 \\
+        --base-url http://127.0.0.1:8089/v1
+
+Por padrão usa um SQLite descartável (benchmark.db). Se o .env do ambiente
+sobrescrever DATABASE_URL ou OPENAI_BASE_URL, o benchmark aborta em vez de
+escrever em outro banco.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _stub_stats(base_url):
+    if not base_url:
+        return None
+    stats_url = base_url.rstrip('/')
+    if stats_url.endswith('/v1'):
+        stats_url = stats_url[:-3]
+    try:
+        with urllib.request.urlopen(f"{stats_url}/stats", timeout=5) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do pipeline advance_spec_processing')
+    parser.add_argument('--uploads', default='uploads', help='diretório com os arquivos de exemplo')
+    parser.add_argument('--repeat', type=int, default=1, help='quantas vezes cada arquivo é processado')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--queue', action='store_true',
+                        help='usa process_batch_queue (com extração em lote de fichas curtas) em vez de N workers')
+    parser.add_argument('--database-url', default='sqlite:///' + os.path.abspath('benchmark.db'))
+    parser.add_argument('--base-url', default=os.environ.get('OPENAI_BASE_URL'),
+                        help='OPENAI_BASE_URL (ex: stub local)')
+    parser.add_argument('--output', help='grava o relatório em JSON')
+    parser.add_argument('--keep', action='store_true', help='mantém as specs geradas')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    if args.base_url:
+        os.environ['OPENAI_BASE_URL'] = args.base_url
+
+    from app import create_app
+    from app.extensions import db, init_openai
+    from app.models import User, Specification
+    from app.utils.files import is_image_file, is_pdf_file
+    from app.utils.batch_processor import advance_spec_processing, process_batch_queue
+
+    app = create_app()
+    if app.config['SQLALCHEMY_DATABASE_URI'] != args.database_url:
+        print(f"❌ DATABASE_URL sobrescrita pelo .env ({app.config['SQLALCHEMY_DATABASE_URI']}); abortando.")
+        return 1
+    if args.base_url:
+        init_openai(os.environ.get('OPENAI_API_KEY'), args.base_url)
+
+    uploads = os.path.abspath(args.uploads)
+    files = sorted(
+        f for f in os.listdir(uploads)
+        if is_pdf_file(f) or is_image_file(f)
+    )
+    if not files:
+        print(f"Nenhum PDF/imagem encontrado em {uploads}")
+        return 1
+
+    batch_id = f"bench_{uuid.uuid4().hex[:8]}"
+
+    with app.app_context():
+        db.create_all()
+        user = User.query.filter_by(username='benchmark').first()
+        if not user:
+            user = User(username='benchmark', email='benchmark@example.com', role='admin')
+            user.set_password(uuid.uuid4().hex)
+            db.session.add(user)
+            db.session.commit()
+
+        spec_ids = []
+        for _ in range(max(1, args.repeat)):
+            for filename in files:
+                spec = Specification(
+                    user_id=user.id,
+                    pdf_filename=filename,
+                    processing_status='pending',
+                    processing_stage=0,
+                    batch_id=batch_id,
+                )
+                db.session.add(spec)
+                db.session.flush()
+                spec_ids.append(spec.id)
+        db.session.commit()
+
+    print(f"\n{'='*80}")
+    print(f"BENCHMARK: {len(spec_ids)} fichas ({len(files)} arquivos x {args.repeat}), {args.workers} worker(s)")
+    print(f"OpenAI: {args.base_url or 'API real'}")
+    print(f"{'='*80}\n")
+
+    stub_before = _stub_stats(args.base_url)
+    durations = {}
+
+    def run_one(spec_id):
+        with app.app_context():
+            started = time.perf_counter()
+            ok = advance_spec_processing(spec_id, uploads, app)
+            return spec_id, ok, time.perf_counter() - started
+
+    wall_start = time.perf_counter()
+    if args.queue:
+        process_batch_queue(batch_id, uploads, app)
+        wall = time.perf_counter() - wall_start
+        with app.app_context():
+            for spec in Specification.query.filter_by(batch_id=batch_id).all():
+                durations[spec.id] = (spec.processing_status == 'completed', wall / len(spec_ids))
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = [executor.submit(run_one, spec_id) for spec_id in spec_ids]
+            for future in as_completed(futures):
+                spec_id, ok, elapsed = future.result()
+                durations[spec_id] = (ok, elapsed)
+        wall = time.perf_counter() - wall_start
+
+    elapsed_all = [d for _, d in durations.values()]
+    succeeded = sum(1 for ok, _ in durations.values() if ok)
+    report = {
+        'batch_id': batch_id,
+        'files': len(files),
+        'specs': len(spec_ids),
+        'workers': 'queue' if args.queue else args.workers,
+        'succeeded': succeeded,
+        'failed': len(spec_ids) - succeeded,
+        'wall_seconds': round(wall, 3),
+        'specs_per_minute': round(len(spec_ids) / wall * 60, 2) if wall else 0,
+        'latency_mean': round(statistics.mean(elapsed_all), 3),
+        'latency_p50': round(_percentile(elapsed_all, 50), 3),
+        'latency_p95': round(_percentile(elapsed_all, 95), 3),
+        'latency_max': round(max(elapsed_all), 3),
+    }
+    stub_after = _stub_stats(args.base_url)
+    if stub_before is not None and stub_after is not None:
+        report['stub'] = {k: stub_after.get(k, 0) - stub_before.get(k, 0) for k in stub_after}
+
+    with app.app_context():
+        errors = Specification.query.filter(
+            Specification.batch_id == batch_id,
+            Specification.processing_status == 'error',
+        ).all()
+        report['errors'] = [{'spec_id': s.id, 'stage': s.error_stage, 'error': s.last_error} for s in errors[:20]]
+
+        if not args.keep:
+            specs = Specification.query.filter_by(batch_id=batch_id).all()
+            # Thumbnails ficam no asset store (deduplicado, compartilhado com o
+            # app); os que ficarem órfãos são removidos por gc_assets.py
+            for spec in specs:
+                db.session.delete(spec)
+            db.session.commit()
+
+    print(f"\n{'='*80}")
+    print("RESULTADO DO BENCHMARK")
+    print(f"{'='*80}")
+    for key, value in report.items():
+        if key != 'errors':
+            print(f"  {key}: {value}")
+    for err in report['errors']:
+        print(f"  ✗ spec {err['spec_id']} (etapa {err['stage']}): {err['error']}")
+    print(f"{'='*80}\n")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Relatório salvo em {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -96,11 +96,28 @@ server {
         proxy_connect_timeout 10s;
     }
 
+    location /static/assets/ {
+        alias $APP_DIR/static/assets/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
     location /static/ {
         alias $APP_DIR/static/;
         expires 7d;
         add_header Cache-Control "public, immutable";
     }
+
+    # Arquivos protegidos: o Flask autoriza e responde com X-Accel-Redirect
+    # (FILE_SERVING_BACKEND=nginx); o nginx envia os bytes e atende Range.
+    location /_protected/uploads/ {
+        internal;
+        alias $APP_DIR/uploads/;
+    }
+
+    location /_protected/static/ {
+        internal;
+        alias $APP_DIR/static/;
+    }
 }
 EOF
 
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Coleta de lixo do asset store (static/assets).
+
+Recalcula o ref_count de cada asset a partir das colunas que apontam para
+ele (desenhos, thumbnails, capas, candidatos de desenho) e remove os arquivos
+sem referência. Por padrão roda em modo de simulação e só imprime o relatório.
+
+    python gc_assets.py                 # dry-run
+    python gc_assets.py --apply         # remove de fato
+    python gc_assets.py --apply --legacy --grace-hours 48
+
+--legacy também remove arquivos não referenciados das pastas antigas
+(static/drawings, static/thumbnails, static/covers).
+Pode ser agendado (cron) com --apply.
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='GC do asset store')
+    parser.add_argument('--apply', action='store_true', help='remove os arquivos (sem isso, só simula)')
+    parser.add_argument('--legacy', action='store_true', help='inclui static/drawings, thumbnails e covers antigos')
+    parser.add_argument('--grace-hours', type=float, default=24.0,
+                        help='não remove arquivos mais novos que isso (padrão 24h)')
+    parser.add_argument('--keep-candidates', action='store_true',
+                        help='não apaga candidatos de desenho de gerações antigas')
+    args = parser.parse_args(argv)
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
+    from app import create_app
+    from app.utils.assets import collect_garbage
+
+    app = create_app()
+    with app.app_context():
+        report = collect_garbage(
+            dry_run=not args.apply,
+            grace_seconds=int(args.grace_hours * 3600),
+            legacy=args.legacy,
+            prune_candidates=not args.keep_candidates,
+            static_dir=app.static_folder,
+        )
+
+    print(f"\n{'='*80}")
+    print(f"GC DO ASSET STORE {'(SIMULAÇÃO)' if report['dry_run'] else ''}")
+    print(f"{'='*80}")
+    print(f"  Candidatos antigos removidos: {report['candidates_pruned']}")
+    print(f"  ref_count corrigidos:         {report['refcounts_fixed']}")
+    print(f"  Linhas criadas:               {report['rows_created']}")
+    print(f"  Assets verificados:           {report['assets_scanned']}")
+    print(f"  Assets órfãos removidos:      {report['assets_removed']}")
+    print(f"  Arquivos antigos removidos:   {report['legacy_removed']}")
+    print(f"  Manifestos removidos:         {report['manifests_removed']}")
+    print(f"  Mantidos (período de graça):  {report['kept_in_grace']}")
+    print(f"  Espaço liberado:              {report['bytes_freed'] / (1024 * 1024):.1f} MB")
+    print(f"{'='*80}\n")
+    if report['dry_run']:
+        print("💡 Nada foi removido. Rode com --apply para aplicar.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -27,3 +27,13 @@ preload_app = True
 # Restart workers after N requests (prevent memory leaks)
 max_requests = 1000
 max_requests_jitter = 50
+
+
+def post_fork(server, worker):
+    # With preload_app the app is created in the master; the drawing and
+    # import queue dispatchers (threads) have to start in each worker, after the fork
+    from app.utils.drawing_queue import start_drawing_queue
+    from app.utils.import_jobs import start_import_queue
+    app = worker.app.wsgi()
+    start_drawing_queue(app)
+    start_import_queue(app)
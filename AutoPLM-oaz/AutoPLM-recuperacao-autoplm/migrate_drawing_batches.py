@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Script de Migração: geração de desenhos em massa
+Banco de dados: PostgreSQL (Neon)
+Modelos: DrawingBatch, DrawingJob
+
+Cria a tabela 'drawing_batch' e adiciona a coluna 'drawing_batch_id' (com o
+índice ix_drawing_job_batch_status) à tabela 'drawing_job'.
+Se a tabela/coluna já existem, o script é ignorado com segurança.
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+from sqlalchemy import inspect
+from app import create_app
+from app.extensions import db
+from app.models import DrawingBatch
+
+
+def migrate():
+    """Executa a migração de forma segura"""
+
+    env_path = os.path.join(os.path.dirname(__file__), '.env')
+    load_dotenv(env_path)
+
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔍 Iniciando migração da geração de desenhos em massa...")
+
+            # create_app já roda db.create_all(); garante a tabela nova mesmo assim
+            DrawingBatch.__table__.create(db.engine, checkfirst=True)
+            print("✅ Tabela 'drawing_batch' ok")
+
+            columns = {c['name'] for c in inspect(db.engine).get_columns('drawing_job')}
+            with db.engine.begin() as connection:
+                if 'drawing_batch_id' not in columns:
+                    print("➕ Adicionando coluna 'drawing_batch_id'...")
+                    connection.execute(db.text("""
+                        ALTER TABLE drawing_job
+                        ADD COLUMN drawing_batch_id INTEGER
+                        REFERENCES drawing_batch(id) ON DELETE SET NULL
+                    """))
+                    print("✅ Coluna 'drawing_batch_id' adicionada com sucesso!")
+                else:
+                    print("⏭️  Coluna 'drawing_batch_id' já existe, ignorando...")
+
+                connection.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_drawing_job_batch_status "
+                    "ON drawing_job (drawing_batch_id, status)"
+                ))
+                print("✅ Índice 'ix_drawing_job_batch_status' ok")
+
+            print("\n🎉 Migração concluída!")
+            return True
+
+        except Exception as e:
+            print(f"❌ Erro durante migração: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    success = migrate()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Script de Migração: regeneração de desenho sem cache
+Banco de dados: PostgreSQL (Neon)
+Modelo: DrawingJob
+
+Adiciona a coluna 'force_new' à tabela 'drawing_job' ("Gerar Novo Desenho"
+ignora o cache de desenhos).
+Se a coluna já existe, o script é ignorado com segurança.
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+from sqlalchemy import inspect
+from app import create_app
+from app.extensions import db
+
+
+def migrate():
+    """Executa a migração de forma segura"""
+
+    env_path = os.path.join(os.path.dirname(__file__), '.env')
+    load_dotenv(env_path)
+
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔍 Iniciando migração da regeneração de desenhos...")
+
+            columns = {c['name'] for c in inspect(db.engine).get_columns('drawing_job')}
+            if 'force_new' not in columns:
+                print("➕ Adicionando coluna 'force_new'...")
+                with db.engine.begin() as connection:
+                    connection.execute(db.text(
+                        "ALTER TABLE drawing_job ADD COLUMN force_new BOOLEAN DEFAULT FALSE"
+                    ))
+                print("✅ Coluna 'force_new' adicionada com sucesso!")
+            else:
+                print("⏭️  Coluna 'force_new' já existe, ignorando...")
+
+            print("\n🎉 Migração concluída!")
+            return True
+
+        except Exception as e:
+            print(f"❌ Erro durante migração: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    success = migrate()
+    sys.exit(0 if success else 1)
@@ -1,119 +1,362 @@
 #!/usr/bin/env python3
 """
-Script de migração para mover desenhos técnicos locais para Replit Object Storage.
+Script de migração para mover desenhos técnicos locais para o Object Storage.
 
 Este script:
-1. Busca todas as especificações com desenhos técnicos
-2. Faz upload dos desenhos locais para o Object Storage
-3. Atualiza os caminhos no banco de dados
-4. Mantém fallback para arquivos que já estão no Object Storage
+1. Faz um inventário das especificações com desenhos técnicos (só id + URL)
+2. Envia os desenhos locais (uploads/) para o Object Storage em paralelo
+3. Confere o SHA-256 de cada objeto enviado baixando-o de volta
+4. Atualiza os caminhos no banco em lotes (UPDATE condicional, idempotente)
+5. Registra o progresso num checkpoint para retomar após interrupção
+
+    python migrate_drawings.py --dry-run                # só o relatório de inventário
+    python migrate_drawings.py --workers 16             # migra
+    python migrate_drawings.py --backend filesystem --root /tmp/os   # teste local
+
+URLs externas (http/https) e desenhos servidos de /static/ (asset store)
+não são migrados. Rodar de novo com o mesmo checkpoint pula o que já foi
+enviado e confirmado no banco.
 """
 
 import os
 import sys
-try:
-    from replit.object_storage import Client
-except ImportError:
-    Client = None
-from app import app, db, Specification
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from dotenv import load_dotenv
+
+STORAGE_PREFIX = 'technical-drawings/'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Arquivo JSONL só de acréscimo: 'uploaded' após o envio verificado,
+    'committed' após o UPDATE no banco."""
+
+    def __init__(self, path):
+        self.path = path
+        self.uploaded = {}
+        self.committed = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # linha truncada por interrupção
+                    if entry.get('status') == 'uploaded':
+                        self.uploaded[entry['spec_id']] = entry
+                    elif entry.get('status') == 'committed':
+                        self.committed.add(entry['spec_id'])
+        self._file = None
+
+    def record(self, entries):
+        if not entries:
+            return
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            for entry in entries:
+                self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+def build_inventory(app, storage, checkpoint, workers):
+    """Classifica cada desenho: external, static, migrated, missing, pending ou resumed."""
+    from app.extensions import db
+    from app.models import Specification
+
+    rows = db.session.query(Specification.id, Specification.technical_drawing_url).filter(
+        Specification.technical_drawing_url.isnot(None),
+        Specification.technical_drawing_url != ''
+    ).order_by(Specification.id).all()
+
+    upload_folder = app.config['UPLOAD_FOLDER']
+    items = []
+    remote_checks = []
+    for spec_id, drawing_url in rows:
+        item = {'spec_id': spec_id, 'url': drawing_url}
+        items.append(item)
+        if drawing_url.startswith('http://') or drawing_url.startswith('https://'):
+            item['category'] = 'external'
+            continue
+        if drawing_url.startswith('/static/'):
+            item['category'] = 'static'
+            continue
+        if (spec_id in checkpoint.uploaded and spec_id not in checkpoint.committed
+                and checkpoint.uploaded[spec_id]['key'] != drawing_url):
+            item['category'] = 'resumed'
+            item.update(key=checkpoint.uploaded[spec_id]['key'], sha256=checkpoint.uploaded[spec_id]['sha256'])
+            continue
+
+        local_path = os.path.join(upload_folder, drawing_url)
+        if os.path.isfile(local_path):
+            item['category'] = 'pending'
+            item['path'] = local_path
+            item['size'] = os.path.getsize(local_path)
+        elif drawing_url.startswith(STORAGE_PREFIX):
+            remote_checks.append(item)
+        else:
+            item['category'] = 'missing'
+
+    # Desenhos que já apontam para o storage e não existem localmente
+    def check_remote(item):
+        try:
+            item['category'] = 'migrated' if storage.backend.exists(item['url']) else 'missing'
+        except Exception as e:
+            item['category'] = 'missing'
+            item['error'] = str(e)
+
+    if remote_checks:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(check_remote, remote_checks))
+
+    # Chave de destino determinística: o id da ficha evita colisão entre
+    # arquivos de mesmo nome e se mantém igual entre execuções
+    for item in items:
+        if item['category'] != 'pending':
+            continue
+        if item['url'].startswith(STORAGE_PREFIX):
+            item['key'] = item['url']
+        else:
+            item['key'] = f"{STORAGE_PREFIX}{item['spec_id']}_{os.path.basename(item['url'])}"
+    return items
+
+
+def print_inventory(items):
+    counts = Counter(item['category'] for item in items)
+    pending_bytes = sum(item.get('size', 0) for item in items if item['category'] == 'pending')
+
+    print(f"\n{'='*50}")
+    print("📋 INVENTÁRIO DE DESENHOS TÉCNICOS")
+    print(f"{'='*50}")
+    print(f"Total com desenho:                {len(items)}")
+    print(f"📤 A migrar (arquivo local):      {counts['pending']} ({pending_bytes / (1024 * 1024):.1f} MB)")
+    print(f"🔁 Enviados, falta atualizar DB:  {counts['resumed']}")
+    print(f"✅ Já no Object Storage:          {counts['migrated']}")
+    print(f"⏭️  URLs externas:                 {counts['external']}")
+    print(f"⏭️  Servidos de /static/:          {counts['static']}")
+    print(f"❌ Arquivo não encontrado:        {counts['missing']}")
+    print(f"{'='*50}")
+
+    missing = [item for item in items if item['category'] == 'missing']
+    for item in missing[:20]:
+        print(f"   ❌ Spec #{item['spec_id']}: {item['url']}" + (f" ({item['error']})" if item.get('error') else ''))
+    if len(missing) > 20:
+        print(f"   ... e mais {len(missing) - 20}")
+
+
+def upload_item(storage, item, verify):
+    """Envia um desenho e confere o checksum; roda nos workers."""
+    checksum = file_sha256(item['path'])
+    storage.upload_file(item['key'], item['path'])
+
+    if verify:
+        fd, tmp_path = tempfile.mkstemp(prefix='.verify-')
+        os.close(fd)
+        try:
+            storage.backend.download_to_filename(item['key'], tmp_path)
+            remote_checksum = file_sha256(tmp_path)
+        finally:
+            os.remove(tmp_path)
+        if remote_checksum != checksum:
+            raise ValueError(f"checksum divergente ({checksum[:12]} local, {remote_checksum[:12]} remoto)")
+
+    return {'spec_id': item['spec_id'], 'old_url': item['url'], 'key': item['key'],
+            'sha256': checksum, 'size': item['size'], 'status': 'uploaded'}
+
 
-def migrate_drawings():
+def commit_batch(batch, checkpoint):
+    """UPDATE em lote; só altera linhas cujo desenho ainda é o URL antigo."""
+    from sqlalchemy import bindparam, update
+    from app.extensions import db
+    from app.models import Specification
+
+    if not batch:
+        return 0
+    table = Specification.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam('b_id'), table.c.technical_drawing_url == bindparam('b_old'))
+        .values(technical_drawing_url=bindparam('b_new'))
+    )
+    result = db.session.execute(stmt, [
+        {'b_id': entry['spec_id'], 'b_old': entry['old_url'], 'b_new': entry['key']} for entry in batch
+    ])
+    db.session.commit()
+    checkpoint.record([{'spec_id': entry['spec_id'], 'status': 'committed'} for entry in batch])
+    return result.rowcount if result.rowcount >= 0 else len(batch)
+
+
+def migrate_drawings(args):
     """Migra desenhos técnicos para Object Storage"""
-    
+    from app import create_app
+    from app.utils.object_storage import get_object_storage, reset_object_storage
+
+    app = create_app()
+    if args.backend:
+        app.config['OBJECT_STORAGE_BACKEND'] = args.backend
+    if args.root:
+        app.config['OBJECT_STORAGE_ROOT'] = args.root
+    reset_object_storage()
+
     with app.app_context():
-        # Buscar todas as especificações com desenhos técnicos
-        specs_with_drawings = Specification.query.filter(
-            Specification.technical_drawing_url.isnot(None),
-            Specification.technical_drawing_url != ''
-        ).all()
-        
-        print(f"📊 Encontradas {len(specs_with_drawings)} especificações com desenhos técnicos")
-        
-        if not specs_with_drawings:
-            print("✅ Nenhuma migração necessária!")
-            return
-        
-        storage_client = Client()
-        migrated = 0
-        skipped = 0
-        errors = 0
-        
-        for spec in specs_with_drawings:
-            drawing_url = spec.technical_drawing_url
-            
-            # Pular URLs externas (legacy)
-            if drawing_url.startswith('http://') or drawing_url.startswith('https://'):
-                print(f"⏭️  Spec #{spec.id}: URL externa, pulando")
-                skipped += 1
-                continue
-            
-            # Verificar se já está no Object Storage
-            if drawing_url.startswith('technical-drawings/'):
-                try:
-                    if storage_client.exists(drawing_url):
-                        print(f"✅ Spec #{spec.id}: Já está no Object Storage")
-                        skipped += 1
+        storage = get_object_storage(app)
+        if not storage:
+            print("❌ Object Storage indisponível (OBJECT_STORAGE_BACKEND / replit.object_storage)")
+            return 1
+        print(f"🗄️  Backend: {storage.backend.name}  |  workers: {args.workers}  |  checkpoint: {args.checkpoint}")
+
+        checkpoint = Checkpoint(args.checkpoint)
+        items = build_inventory(app, storage, checkpoint, args.workers)
+        print_inventory(items)
+
+        if args.dry_run:
+            print("\n🔍 Modo simulação: nada foi enviado nem alterado.")
+            return 0
+
+        resumed = [dict(checkpoint.uploaded[item['spec_id']], old_url=item['url'])
+                   for item in items if item['category'] == 'resumed']
+        pending = [item for item in items if item['category'] == 'pending']
+        if args.limit:
+            pending = pending[:args.limit]
+
+        committed = 0
+        for start in range(0, len(resumed), args.batch_size):
+            committed += commit_batch(resumed[start:start + args.batch_size], checkpoint)
+        if resumed:
+            print(f"🔁 {len(resumed)} desenho(s) já enviados tiveram o caminho atualizado no banco")
+
+        if not pending:
+            print("\n✅ Nenhuma migração necessária.")
+            checkpoint.close()
+            return 0
+
+        total_bytes = sum(item['size'] for item in pending)
+        uploaded_bytes = 0
+        errors = []
+        batch = []
+        done = 0
+        started = time.perf_counter()
+        last_report = started
+        max_in_flight = args.workers * 4
+
+        print(f"\n📤 Migrando {len(pending)} desenho(s), {total_bytes / (1024 * 1024):.1f} MB...")
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='migrate') as pool:
+            queue = iter(pending)
+            in_flight = {}
+
+            def submit_next():
+                item = next(queue, None)
+                if item is not None:
+                    in_flight[pool.submit(upload_item, storage, item, not args.no_verify)] = item
+                return item is not None
+
+            while len(in_flight) < max_in_flight and submit_next():
+                pass
+
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                uploaded = []
+                for future in finished:
+                    item = in_flight.pop(future)
+                    done += 1
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        errors.append((item, str(e)))
+                        print(f"❌ Spec #{item['spec_id']}: Erro ao migrar: {e}")
                         continue
-                except Exception as e:
-                    print(f"⚠️  Spec #{spec.id}: Erro ao verificar Object Storage: {e}")
-            
-            # Caminho local
-            local_path = os.path.join(app.config['UPLOAD_FOLDER'], drawing_url)
-            
-            if not os.path.exists(local_path):
-                print(f"❌ Spec #{spec.id}: Arquivo local não encontrado: {drawing_url}")
-                errors += 1
-                continue
-            
-            try:
-                # Ler arquivo local
-                with open(local_path, 'rb') as f:
-                    image_data = f.read()
-                
-                # Gerar novo caminho no Object Storage
-                filename = os.path.basename(drawing_url)
-                storage_path = f"technical-drawings/{filename}"
-                
-                # Fazer upload
-                storage_client.upload_from_bytes(storage_path, image_data)
-                print(f"📤 Spec #{spec.id}: Upload concluído - {storage_path}")
-                
-                # Atualizar banco de dados
-                spec.technical_drawing_url = storage_path
-                db.session.commit()
-                
-                migrated += 1
-                print(f"✅ Spec #{spec.id}: Migrado com sucesso!")
-                
-            except Exception as e:
-                print(f"❌ Spec #{spec.id}: Erro ao migrar: {e}")
-                errors += 1
-                db.session.rollback()
-        
+                    uploaded.append(entry)
+                    uploaded_bytes += entry['size']
+
+                while len(in_flight) < max_in_flight and submit_next():
+                    pass
+
+                checkpoint.record(uploaded)
+                batch.extend(uploaded)
+                if len(batch) >= args.batch_size:
+                    committed += commit_batch(batch, checkpoint)
+                    batch = []
+
+                now = time.perf_counter()
+                if now - last_report >= 5 or done == len(pending):
+                    elapsed = max(now - started, 1e-9)
+                    rate = done / elapsed
+                    eta = (len(pending) - done) / rate if rate else 0
+                    print(f"   {done}/{len(pending)} | {rate:.1f} arq/s | "
+                          f"{uploaded_bytes / (1024 * 1024) / elapsed:.1f} MB/s | "
+                          f"ETA {eta:.0f}s | erros {len(errors)}")
+                    last_report = now
+
+        committed += commit_batch(batch, checkpoint)
+        checkpoint.close()
+        elapsed = max(time.perf_counter() - started, 1e-9)
+
         # Resumo
         print("\n" + "="*50)
         print("📊 RESUMO DA MIGRAÇÃO")
         print("="*50)
-        print(f"Total de especificações: {len(specs_with_drawings)}")
-        print(f"✅ Migradas com sucesso: {migrated}")
-        print(f"⏭️  Puladas (já migradas ou URLs externas): {skipped}")
-        print(f"❌ Erros: {errors}")
+        print(f"✅ Migradas com sucesso: {len(pending) - len(errors)}")
+        print(f"🗃️  Caminhos atualizados no banco: {committed}")
+        print(f"❌ Erros: {len(errors)}")
+        print(f"⏱️  {elapsed:.1f}s ({len(pending) / elapsed:.1f} arq/s)")
         print("="*50)
-        
-        if migrated > 0:
-            print("\n🎉 Migração concluída! Os desenhos agora estão no Object Storage.")
-            print("💡 Os arquivos locais podem ser removidos manualmente se desejado.")
-        else:
-            print("\n✅ Nenhuma migração necessária.")
+
+        if errors:
+            print("\n⚠️  Rode novamente para tentar os que falharam (o checkpoint pula os concluídos).")
+            return 1
+        print("\n🎉 Migração concluída! Os desenhos agora estão no Object Storage.")
+        print("💡 Os arquivos locais podem ser removidos manualmente se desejado.")
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migra desenhos técnicos locais para o Object Storage')
+    parser.add_argument('--dry-run', action='store_true', help='só imprime o inventário')
+    parser.add_argument('--workers', type=int, default=8, help='uploads simultâneos (padrão 8)')
+    parser.add_argument('--batch-size', type=int, default=200, help='linhas por UPDATE no banco (padrão 200)')
+    parser.add_argument('--checkpoint', default='migrate_drawings.checkpoint.jsonl',
+                        help='arquivo de progresso para retomar a migração')
+    parser.add_argument('--limit', type=int, default=0, help='migra no máximo N desenhos nesta execução')
+    parser.add_argument('--no-verify', action='store_true', help='não baixa o objeto de volta para conferir o SHA-256')
+    parser.add_argument('--backend', choices=('replit', 'filesystem'), help='sobrescreve OBJECT_STORAGE_BACKEND')
+    parser.add_argument('--root', help='diretório do backend filesystem (OBJECT_STORAGE_ROOT)')
+    args = parser.parse_args(argv)
+    args.workers = max(1, args.workers)
+    args.batch_size = max(1, args.batch_size)
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+    return migrate_drawings(args)
+
 
 if __name__ == '__main__':
     print("🚀 Iniciando migração de desenhos técnicos para Object Storage...")
     print("="*50 + "\n")
-    
+
     try:
-        migrate_drawings()
+        sys.exit(main())
     except KeyboardInterrupt:
-        print("\n\n⚠️  Migração interrompida pelo usuário.")
+        print("\n\n⚠️  Migração interrompida pelo usuário. Rode novamente para retomar do checkpoint.")
         sys.exit(1)
     except Exception as e:
         print(f"\n\n❌ Erro fatal durante migração: {e}")
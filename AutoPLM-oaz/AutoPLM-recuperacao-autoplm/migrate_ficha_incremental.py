@@ -0,0 +1,53 @@
+"""
+Migration: Add incremental re-import columns to ficha_tecnica_item
+==================================================================
+Adds row_hash / updated_at / deleted_at, used when a proforma with an
+existing number_pi_order is imported again (app/utils/ficha_sync.py).
+Items imported before this migration get their row_hash on the next re-import.
+"""
+import os
+import sys
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv('.env.local')
+
+
+def get_connection():
+    db_url = os.environ.get('DATABASE_URL', '')
+    if not db_url:
+        print('ERROR: DATABASE_URL not set')
+        sys.exit(1)
+    return psycopg2.connect(db_url)
+
+
+def run_migration():
+    conn = get_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    columns = [
+        ('row_hash',   'VARCHAR(64)'),
+        ('updated_at', 'TIMESTAMP'),
+        ('deleted_at', 'TIMESTAMP'),
+    ]
+
+    for col_name, col_type in columns:
+        try:
+            cur.execute(
+                f'ALTER TABLE ficha_tecnica_item ADD COLUMN {col_name} {col_type}'
+            )
+            print(f'  + Added column ficha_tecnica_item.{col_name}')
+        except psycopg2.errors.DuplicateColumn:
+            conn.rollback()
+            conn.autocommit = True
+            print(f'  ~ Column ficha_tecnica_item.{col_name} already exists')
+
+    cur.close()
+    conn.close()
+    print('\nMigração concluída com sucesso!')
+
+
+if __name__ == '__main__':
+    print('=== Migrate: ficha_tecnica_item incremental re-import ===')
+    run_migration()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Script de Migração: índices da galeria de desenhos técnicos
+Banco de dados: PostgreSQL (Neon)
+Modelo: Specification
+
+Cria os índices compostos usados pela paginação por keyset da galeria
+(/technical-drawings):
+
+- ix_specification_drawing_created       ((technical_drawing_url IS NOT NULL), created_at, id)
+- ix_specification_user_drawing_created  (user_id, (technical_drawing_url IS NOT NULL), created_at, id)
+
+No PostgreSQL usa CREATE INDEX CONCURRENTLY (sem bloquear escritas).
+Se os índices já existem, o script é ignorado com segurança.
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+from app import create_app
+from app.extensions import db
+
+INDEXES = (
+    ('ix_specification_drawing_created',
+     '((technical_drawing_url IS NOT NULL), created_at, id)'),
+    ('ix_specification_user_drawing_created',
+     '(user_id, (technical_drawing_url IS NOT NULL), created_at, id)'),
+)
+
+
+def migrate():
+    """Executa a migração de forma segura"""
+
+    env_path = os.path.join(os.path.dirname(__file__), '.env')
+    load_dotenv(env_path)
+
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔍 Criando índices da galeria de desenhos...")
+            is_postgres = db.engine.dialect.name == 'postgresql'
+            concurrently = 'CONCURRENTLY ' if is_postgres else ''
+
+            # CONCURRENTLY não pode rodar dentro de transação
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                for name, columns in INDEXES:
+                    print(f"➕ {name}...")
+                    connection.execute(db.text(
+                        f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON specification {columns}"
+                    ))
+                    print(f"✅ {name} ok")
+
+                if is_postgres:
+                    connection.execute(db.text("ANALYZE specification"))
+
+            print("\n🎉 Migração concluída!")
+            return True
+
+        except Exception as e:
+            print(f"❌ Erro durante migração: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    success = migrate()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Script de Migração: jobs de importação em background
+Banco de dados: PostgreSQL (Neon)
+Modelo: ImportJob
+
+Cria a tabela 'import_job' (com os índices ix_import_job_status_created e
+ix_import_job_user), usada pelo confirm das importações de fichas, compras e
+banco de dados.
+Se a tabela já existe, o script é ignorado com segurança.
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+from app import create_app
+from app.extensions import db
+from app.models import ImportJob
+
+
+def migrate():
+    """Executa a migração de forma segura"""
+
+    env_path = os.path.join(os.path.dirname(__file__), '.env')
+    load_dotenv(env_path)
+
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔍 Iniciando migração dos jobs de importação...")
+
+            # create_app já roda db.create_all(); garante a tabela nova mesmo assim
+            ImportJob.__table__.create(db.engine, checkfirst=True)
+            print("✅ Tabela 'import_job' ok")
+
+            with db.engine.begin() as connection:
+                connection.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_import_job_status_created "
+                    "ON import_job (status, created_at)"
+                ))
+                connection.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_import_job_user ON import_job (user_id)"
+                ))
+                print("✅ Índices de 'import_job' ok")
+
+            print("\n🎉 Migração concluída!")
+            return True
+
+        except Exception as e:
+            print(f"❌ Erro durante migração: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    success = migrate()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,427 @@
+"""
+Servidor local compatível com a API OpenAI para benchmarks e testes de carga.
+
+Implementa os endpoints usados pelo AutoPLM:
+    POST /v1/chat/completions
+    POST /v1/images/edits
+    POST /v1/images/generations
+    GET  /stats                  (contadores do stub)
+
+Recursos:
+- latência configurável por tipo de endpoint (fixed/uniform/normal/lognormal)
+- injeção de 429 (probabilidade fixa e/ou limite de requisições por minuto)
+- replay de respostas gravadas (--fixtures DIR) e gravação a partir da API
+  real (--record, usa OPENAI_API_KEY e --upstream)
+- respostas sintéticas quando não há fixture gravada
+
+Uso:
+    python openai_stub_server.py --port 8089 --chat-latency-ms 1500 --image-latency-ms 20000
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python benchmark_pipeline.py
+"""
+import os
+import io
+import re
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SYNTHETIC_SPEC = {
+    "ref_souq": "S27TH026",
+    "description": "BLUSA GOLA ROLE LISTRADA",
+    "collection": "INVERNO 27",
+    "supplier": "FOR ADY",
+    "corner": "SOUQ",
+    "main_fabric": "MALHA CANELADA",
+    "main_group": "MALHA",
+    "sub_group": "BLUSA",
+    "target_price": "R$ 35,00",
+    "store_month": "MAIO",
+    "delivery_cd_month": "ABRIL",
+    "tech_sheet_delivery_date": "2026-01-15",
+    "pilot_delivery_date": "2026-02-10",
+    "showcase_for": None,
+    "stylists": "ANA",
+    "composition": "100% ALGODAO",
+    "pattern": "LISTRADO",
+    "colors": "PRETO, OFF WHITE",
+    "tags_kit": None,
+    "pilot_size": "M",
+}
+
+SYNTHETIC_VISION = {
+    "identificacao": {
+        "tipo_peca": "blusa",
+        "categoria": "malha",
+        "grupo": "MALHA",
+        "subgrupo": "BLUSA",
+        "confianca": 0.9,
+    },
+    "visoes": {"frente": "blusa gola role", "costas": "lisa", "mangas": "longas"},
+    "gola_decote": {"tipo": "role", "acabamento": "ribana", "confianca": 0.9},
+    "mangas": {"comprimento": "longa", "modelo": "set-in", "punho": {"existe": True, "tipo": "ribana"}},
+    "corpo": {"comprimento_visual": "quadril", "caimento": "reto"},
+    "fechamentos": {"tipo": "nao_visivel"},
+    "bolsos": {"existe": False, "lista": []},
+    "barra_hem": {"formato": "reta", "acabamento": "ribana"},
+    "textura_padronagem": {"tipo_trico_malha": "canelado", "direcao": "vertical"},
+    "acabamentos_especiais": [],
+    "diferencas_frente_costas": "",
+}
+
+
+class StubState:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.request_times = deque()
+        self.counters = {
+            'requests': 0,
+            'rate_limited': 0,
+            'fixtures_hit': 0,
+            'recorded': 0,
+            'synthetic': 0,
+        }
+        self._png_cache = {}
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def should_rate_limit(self):
+        now = time.monotonic()
+        with self.lock:
+            self.counters['requests'] += 1
+            if self.args.rate_429 and random.random() < self.args.rate_429:
+                self.counters['rate_limited'] += 1
+                return True
+            if self.args.rpm:
+                while self.request_times and now - self.request_times[0] > 60:
+                    self.request_times.popleft()
+                if len(self.request_times) >= self.args.rpm:
+                    self.counters['rate_limited'] += 1
+                    return True
+                self.request_times.append(now)
+        return False
+
+    def synthetic_png(self, size):
+        if size not in self._png_cache:
+            from PIL import Image, ImageDraw
+            width, height = (int(x) for x in size.split('x')) if 'x' in size else (1024, 1024)
+            img = Image.new('RGB', (width, height), 'white')
+            draw = ImageDraw.Draw(img)
+            draw.rectangle((width // 4, height // 6, width * 3 // 4, height * 5 // 6), outline='black', width=3)
+            buffered = io.BytesIO()
+            img.save(buffered, format='PNG')
+            self._png_cache[size] = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        return self._png_cache[size]
+
+
+def sample_latency(dist, mean_ms, spread_ms):
+    if mean_ms <= 0:
+        return 0.0
+    if dist == 'uniform':
+        value = random.uniform(mean_ms - spread_ms, mean_ms + spread_ms)
+    elif dist == 'normal':
+        value = random.gauss(mean_ms, spread_ms)
+    elif dist == 'lognormal':
+        sigma = spread_ms / mean_ms if mean_ms else 0.5
+        value = random.lognormvariate(0, sigma) * mean_ms
+    else:
+        value = mean_ms
+    return max(0.0, value) / 1000.0
+
+
+def _fixture_key(endpoint, payload):
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{endpoint}_{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:20]}"
+
+
+def _parse_multipart(headers, body):
+    """Converte multipart/form-data em dict {campo: str | bytes}."""
+    content_type = headers.get('Content-Type', '')
+    message = BytesParser(policy=default_policy).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if not name:
+            continue
+        payload = part.get_payload(decode=True) or b''
+        if part.get_filename():
+            fields[name] = payload
+        else:
+            fields[name] = payload.decode('utf-8', 'replace')
+    return fields
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, fmt, *args):
+        if not self.state.args.quiet:
+            super().log_message(fmt, *args)
+
+    def _send_json(self, status, data, extra_headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            with self.state.lock:
+                self._send_json(200, dict(self.state.counters))
+            return
+        self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path.startswith('/v1'):
+            path = path[3:]
+
+        routes = {
+            '/chat/completions': ('chat', self._chat_response),
+            '/images/edits': ('image', self._image_response),
+            '/images/generations': ('image', self._image_response),
+        }
+        if path not in routes:
+            self._send_json(404, {'error': {'message': f'unknown endpoint {path}'}})
+            return
+
+        kind, builder = routes[path]
+        raw_body = self._read_body()
+
+        if self.state.should_rate_limit():
+            self._send_json(429, {
+                'error': {
+                    'message': 'Rate limit reached (stub)',
+                    'type': 'requests',
+                    'code': 'rate_limit_exceeded',
+                }
+            }, extra_headers={'Retry-After': str(self.state.args.retry_after)})
+            return
+
+        args = self.state.args
+        if kind == 'chat':
+            delay = sample_latency(args.latency_dist, args.chat_latency_ms, args.chat_latency_spread_ms)
+        else:
+            delay = sample_latency(args.latency_dist, args.image_latency_ms, args.image_latency_spread_ms)
+
+        try:
+            if 'multipart/form-data' in self.headers.get('Content-Type', ''):
+                payload = _parse_multipart(self.headers, raw_body)
+            else:
+                payload = json.loads(raw_body or b'{}')
+        except Exception as e:
+            self._send_json(400, {'error': {'message': f'invalid body: {e}'}})
+            return
+
+        key_payload = {
+            k: (hashlib.sha256(v).hexdigest() if isinstance(v, bytes) else v)
+            for k, v in payload.items()
+            if k not in ('stream', 'user')
+        }
+        key = _fixture_key(path.strip('/').replace('/', '_'), key_payload)
+
+        data = self._load_fixture(key)
+        if data is not None:
+            self.state.count('fixtures_hit')
+        elif args.record:
+            if isinstance(payload, dict) and payload.get('stream'):
+                # Grava a resposta completa; o replay reconstrói o stream
+                upstream_payload = {k: v for k, v in payload.items() if k not in ('stream', 'stream_options')}
+                raw_body = json.dumps(upstream_payload, ensure_ascii=False).encode('utf-8')
+            data = self._record(path, raw_body, key)
+            if data is None:
+                self._send_json(502, {'error': {'message': 'upstream request failed'}})
+                return
+            delay = 0
+        elif args.strict:
+            self._send_json(404, {'error': {'message': f'no fixture for {key}'}})
+            return
+        else:
+            self.state.count('synthetic')
+            data = builder(path, payload)
+
+        if kind == 'chat' and payload.get('stream'):
+            self._send_chat_stream(data, delay)
+            return
+        if delay:
+            time.sleep(delay)
+        self._send_json(200, data)
+
+    def _send_chat_stream(self, data, delay, chunk_chars=40):
+        """Reenvia uma resposta de chat como SSE (stream=True): ~30% da latência
+        antes do primeiro token e o restante distribuído entre os pedaços."""
+        message = (data.get('choices') or [{}])[0].get('message') or {}
+        text = message.get('content') or ''
+        pieces = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or ['']
+        per_piece = (delay * 0.7) / len(pieces) if delay else 0
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def emit(delta, finish_reason=None):
+            event = {
+                'id': data.get('id', 'chatcmpl-stub'),
+                'object': 'chat.completion.chunk',
+                'created': data.get('created', int(time.time())),
+                'model': data.get('model', 'gpt-4o'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        if delay:
+            time.sleep(delay * 0.3)
+        emit({'role': 'assistant', 'content': ''})
+        for piece in pieces:
+            if per_piece:
+                time.sleep(per_piece)
+            emit({'content': piece})
+        emit({}, finish_reason='stop')
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _load_fixture(self, key):
+        fixtures_dir = self.state.args.fixtures
+        if not fixtures_dir:
+            return None
+        fixture_path = os.path.join(fixtures_dir, f"{key}.json")
+        if not os.path.exists(fixture_path):
+            return None
+        with open(fixture_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _record(self, path, raw_body, key):
+        import httpx
+        args = self.state.args
+        headers = {
+            'Authorization': f"Bearer {os.environ.get('OPENAI_API_KEY', '')}",
+            'Content-Type': self.headers.get('Content-Type', 'application/json'),
+        }
+        try:
+            resp = httpx.post(f"{args.upstream.rstrip('/')}{path}", content=raw_body, headers=headers, timeout=300)
+        except Exception as e:
+            print(f"[STUB] Erro no upstream: {e}")
+            return None
+        if resp.status_code != 200:
+            print(f"[STUB] Upstream HTTP {resp.status_code}: {resp.text[:200]}")
+            return None
+        data = resp.json()
+        if args.fixtures:
+            os.makedirs(args.fixtures, exist_ok=True)
+            with open(os.path.join(args.fixtures, f"{key}.json"), 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            self.state.count('recorded')
+        return data
+
+    def _chat_response(self, path, payload):
+        messages = payload.get('messages') or []
+        has_image = any(
+            isinstance(m.get('content'), list)
+            and any(part.get('type') == 'image_url' for part in m['content'] if isinstance(part, dict))
+            for m in messages if isinstance(m, dict)
+        )
+        content = SYNTHETIC_VISION if has_image else SYNTHETIC_SPEC
+        schema = ((payload.get('response_format') or {}).get('json_schema') or {}).get('schema') or {}
+        if 'documents' in (schema.get('properties') or {}):
+            # Extração em lote: uma entrada por "doc_id: X" presente no prompt
+            prompt_text = json.dumps(messages, ensure_ascii=False)
+            doc_ids = re.findall(r"=== DOCUMENTO doc_id: (\S+) ===", prompt_text)
+            content = {'documents': [dict(SYNTHETIC_SPEC, doc_id=doc_id) for doc_id in doc_ids]}
+        text = json.dumps(content, ensure_ascii=False)
+        prompt_tokens = sum(len(json.dumps(m, ensure_ascii=False)) for m in messages) // 4
+        return {
+            'id': f"chatcmpl-stub-{random.getrandbits(48):x}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'gpt-4o'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': text},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(text) // 4,
+                'total_tokens': prompt_tokens + len(text) // 4,
+            },
+        }
+
+    def _image_response(self, path, payload):
+        n = int(payload.get('n') or 1)
+        size = str(payload.get('size') or '1024x1024')
+        b64 = self.state.synthetic_png(size)
+        return {
+            'created': int(time.time()),
+            'data': [{'b64_json': b64} for _ in range(n)],
+        }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Stub local compatível com a API OpenAI')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'normal', 'lognormal'], default='lognormal')
+    parser.add_argument('--chat-latency-ms', type=float, default=1500)
+    parser.add_argument('--chat-latency-spread-ms', type=float, default=500)
+    parser.add_argument('--image-latency-ms', type=float, default=20000)
+    parser.add_argument('--image-latency-spread-ms', type=float, default=5000)
+    parser.add_argument('--rate-429', type=float, default=0.0, help='probabilidade de responder 429')
+    parser.add_argument('--rpm', type=int, default=0, help='limite de requisições por minuto (0 = sem limite)')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--fixtures', default=None, help='diretório de respostas gravadas')
+    parser.add_argument('--record', action='store_true', help='grava respostas da API real em --fixtures')
+    parser.add_argument('--upstream', default='https://api.openai.com/v1')
+    parser.add_argument('--strict', action='store_true', help='404 quando não houver fixture (sem sintético)')
+    parser.add_argument('--quiet', action='store_true')
+    return parser
+
+
+def make_server(args):
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(args)})
+    return ThreadingHTTPServer((args.host, args.port), handler)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    server = make_server(args)
+    print(f"[STUB] OpenAI stub ouvindo em http://{args.host}:{args.port}/v1")
+    print(f"[STUB] Latência chat ~{args.chat_latency_ms}ms, imagem ~{args.image_latency_ms}ms ({args.latency_dist})")
+    if args.rate_429 or args.rpm:
+        print(f"[STUB] 429: prob={args.rate_429} rpm={args.rpm or '-'}")
+    if args.fixtures:
+        print(f"[STUB] Fixtures: {args.fixtures} ({'gravando' if args.record else 'replay'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
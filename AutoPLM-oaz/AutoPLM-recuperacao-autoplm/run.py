@@ -1,7 +1,11 @@
 from app import create_app, init_db
+from app.utils.drawing_queue import start_drawing_queue
+from app.utils.import_jobs import start_import_queue
 
-app = create_app()
-init_db(app)
-
+# Só no script: os processos do parse_pool reimportam este arquivo como __mp_main__
 if __name__ == '__main__':
+    app = create_app()
+    init_db(app)
+    start_drawing_queue(app)
+    start_import_queue(app)
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)